@@ -0,0 +1,110 @@
+import os, sys, time, shutil, argparse, tempfile, subprocess
+
+# Compares the copy backends (and plain shutil.copy2) on one or more directories, e.g. a tmpfs and an ext4 loopback image:
+#
+#   python benchmarks/bench_copy_backends.py /dev/shm/bench
+#   sudo python benchmarks/bench_copy_backends.py --loopback ext4 --loopback btrfs
+#
+# --loopback creates a file system image, mounts it on a loop device for the run and removes it afterwards (needs root).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from copy_backends import BACKENDS, BACKEND_READINTO, copy_file_fast
+from manifest import HASH_ALGORITHM, new_hasher
+
+
+# Name of the run that hashes while copying (what copy_files does when checksums are on)
+HASHED = f'readinto+{HASH_ALGORITHM}'
+
+
+# Helper method to create the source files for a run (returns their paths)
+def make_files(directory: str, count: int, size: int) -> list:
+    os.makedirs(directory, exist_ok=True)
+    block = os.urandom(min(size, 1024 * 1024))
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"src_{i:05d}.bin")
+        with open(path, 'wb') as f:
+            remaining = size
+            while remaining > 0:
+                f.write(block[:remaining])
+                remaining -= len(block)
+        paths.append(path)
+    return paths
+
+
+# Helper method to time copying every file with one backend (returns MB/s or None if the backend isn't supported)
+def run_backend(backend: str, paths: list, destination: str) -> float:
+    os.makedirs(destination, exist_ok=True)
+    total = sum(os.path.getsize(path) for path in paths)
+    start = time.perf_counter()
+    try:
+        for path in paths:
+            target = os.path.join(destination, os.path.basename(path))
+            if backend == 'copy2':
+                shutil.copy2(path, target)
+            elif backend == HASHED:
+                copy_file_fast(path, target, hasher=new_hasher())
+            else:
+                copy_file_fast(path, target, backend=backend)
+    except OSError as e:
+        print(f"  {backend:<16} unsupported ({e.strerror})")
+        return None
+    finally:
+        elapsed = time.perf_counter() - start
+        shutil.rmtree(destination, ignore_errors=True)
+    return total / elapsed / 1e6
+
+
+# Helper method to mount a loopback file system image (returns the mount point)
+def mount_loopback(fs_type: str, size_mb: int) -> tuple:
+    work = tempfile.mkdtemp(prefix=f"bench_{fs_type}_")
+    image = os.path.join(work, 'fs.img')
+    mount_point = os.path.join(work, 'mnt')
+    os.makedirs(mount_point)
+    subprocess.run(['truncate', '-s', f'{size_mb}M', image], check=True)
+    subprocess.run([f'mkfs.{fs_type}', '-q' if fs_type == 'ext4' else '-f', image], check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(['mount', '-o', 'loop', image, mount_point], check=True)
+    return work, mount_point
+
+
+def unmount_loopback(work: str, mount_point: str) -> None:
+    subprocess.run(['umount', mount_point], check=False)
+    shutil.rmtree(work, ignore_errors=True)
+
+
+def benchmark_directory(directory: str, count: int, size: int) -> None:
+    print(f"{directory} ({count} x {size / 1e6:.1f} MB)")
+    paths = make_files(os.path.join(directory, 'src'), count, size)
+    results = {}
+    try:
+        for backend in ['copy2'] + BACKENDS + [HASHED]:
+            throughput = run_backend(backend, paths, os.path.join(directory, f'dst_{backend}'))
+            if throughput is not None:
+                results[backend] = throughput
+                print(f"  {backend:<16} {throughput:10.1f} MB/s")
+
+        # Overhead of hashing during the copy against the plain copies
+        for baseline in ['copy2', BACKEND_READINTO, max((b for b in BACKENDS if b in results), key=results.get, default=None)]:
+            if baseline in results and HASHED in results:
+                print(f"  checksum overhead vs {baseline}: {(1 - results[HASHED] / results[baseline]) * 100:.1f}%")
+    finally:
+        shutil.rmtree(os.path.join(directory, 'src'), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the copy backends")
+    parser.add_argument("directories", nargs="*", help="Directories to benchmark in (e.g. a tmpfs mount)")
+    parser.add_argument("--loopback", action="append", default=[], help="Also benchmark on a loopback image of this file system type (ext4, btrfs, xfs)")
+    parser.add_argument("--loopback_size", type=int, default=2048, help="Size of the loopback images in MB")
+    parser.add_argument("--count", type=int, default=20, help="Number of files per run")
+    parser.add_argument("--size", type=int, default=25 * 1024 * 1024, help="Size of each file in bytes")
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        benchmark_directory(directory, args.count, args.size)
+
+    for fs_type in args.loopback:
+        work, mount_point = mount_loopback(fs_type, args.loopback_size)
+        try:
+            benchmark_directory(mount_point, args.count, args.size)
+        finally:
+            unmount_loopback(work, mount_point)
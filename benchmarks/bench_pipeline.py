@@ -0,0 +1,224 @@
+import os, io, sys, json, time, shutil, argparse, platform, statistics, tempfile
+from contextlib import redirect_stdout
+
+# Times every stage of the ingest pipeline on a synthetic library and compares the result with a stored baseline:
+#
+#   python benchmarks/bench_pipeline.py                                  # run and compare with benchmarks/baseline.json
+#   python benchmarks/bench_pipeline.py --output run.json --save_baseline
+#   python benchmarks/bench_pipeline.py --jpegs 20000 --raws 5000 --workers 1 4 16 auto
+#
+# Stages: collect_files_by_type, get_date_taken_pillow (threads and processes), get_date_taken_raw, exiftool (the exiftool pool against the
+# local stand-in in benchmarks/exiftool_stub.py), planning (date index + query), copy_files for every worker count (and to two
+# destinations at once) and
+# the streaming pipeline (scan + dates + copy in one go) for every worker count.
+# Every stage runs --repeat times and the fastest run is compared (the median is reported next to it). The page cache
+# is warm after the first run, so the numbers measure the CPU side of the pipeline rather than the disk.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import helpers
+from date_range_index import DateRangeIndex
+from exiftool_pool import ExifToolPool
+from file_transfer import copy_files
+from pipeline import ingest
+from progress import TransferProgress
+from concurrency import parse_workers
+from generate_library import generate_library
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+EXIFTOOL_STUB = os.path.join(BENCHMARK_DIR, 'exiftool_stub.py')
+
+# A stage counts as a regression (or an improvement) when it is this much slower (faster) than the baseline
+DEFAULT_THRESHOLD = 0.10
+
+# Changes smaller than this (in seconds) are timer noise and never count
+NOISE_FLOOR = 0.005
+
+
+# Helper method to time a function (fastest and median of repeat runs, the output of the pipeline is kept out of the report)
+def time_stage(function, repeat: int, setup=None) -> tuple:
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - start)
+    return min(timings), statistics.median(timings), result
+
+
+# Helper method to describe the machine a run was made on (numbers from different machines aren't comparable)
+def describe_environment() -> dict:
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run_benchmark(library: str, destination: str, workers: list, repeat: int, summary: dict) -> dict:
+    """
+    Runs every stage on the library and returns the timings: stage -> seconds (fastest run), median, files and files/s.
+
+    Parameters:
+        library (str): Folder with the generated library.
+        destination (str): Scratch folder the copies go to (emptied before every copy run).
+        workers (list): Worker counts (or 'auto') to run copy_files with.
+        repeat (int): Number of runs per stage.
+        summary (dict): What generate_library produced (used to check the stages found everything).
+    """
+    stages = {}
+
+    def record(name, seconds, median, files):
+        stages[name] = {'seconds': round(seconds, 4), 'median': round(median, 4), 'files': files, 'files_per_s': round(files / seconds, 1) if seconds else None}
+        print(f"  {name:<40} {seconds:8.3f}s (median {median:.3f}s) {files:8d} files {stages[name]['files_per_s'] or 0:10.1f} files/s")
+
+    stat_results = {}
+    seconds, median, collected = time_stage(lambda: helpers.collect_files_by_type(library, stat_results=stat_results), repeat)
+    imgs, raws_with_jpg, raws_without_jpg, others = collected
+    record('collect_files_by_type', seconds, median, len(imgs) + len(raws_with_jpg) + len(raws_without_jpg) + len(others))
+
+    seconds, median, _ = time_stage(lambda: helpers.get_date_taken_pillow(imgs, raws_with_jpg), repeat)
+    record('get_date_taken_pillow', seconds, median, len(imgs) + len(raws_with_jpg))
+
+    seconds, median, _ = time_stage(lambda: helpers.get_date_taken_pillow(imgs, raws_with_jpg, processes=True), repeat)
+    record('get_date_taken_pillow[processes]', seconds, median, len(imgs) + len(raws_with_jpg))
+
+    seconds, median, _ = time_stage(lambda: helpers.get_date_taken_raw(raws_without_jpg), repeat)
+    record('get_date_taken_raw', seconds, median, len(raws_without_jpg))
+
+    # The exiftool path on its own (the native parser handles the synthetic RAWs, so call the pool directly)
+    def run_exiftool():
+        with ExifToolPool(executable=EXIFTOOL_STUB, params=['-EXIF:DateTimeOriginal']) as pool:
+            return sum(1 for data in pool.iter_metadata(raws_without_jpg) if 'EXIF:DateTimeOriginal' in data)
+    seconds, median, found = time_stage(run_exiftool, repeat)
+    record('exiftool', seconds, median, len(raws_without_jpg))
+    if found != len(raws_without_jpg):
+        print(f"  warning: exiftool found dates for {found} of {len(raws_without_jpg)} RAW files")
+
+    # The whole date extraction as the GUI runs it (without the on-disk date index)
+    seconds, median, date_map = time_stage(lambda: helpers.get_creation_dates_for_directory(library), repeat)
+    found_files = sum(len(files) for files in date_map.values())
+    record('get_creation_dates', seconds, median, found_files)
+    if found_files != summary['files']:
+        print(f"  warning: found {found_files} of {summary['files']} generated files")
+
+    seconds, median, planned = time_stage(lambda: DateRangeIndex(date_map).query(None, None, None), repeat)
+    record('planning', seconds, median, len(planned))
+
+    date_index = DateRangeIndex(date_map)
+    for worker_count in workers:
+        seconds, median, _ = time_stage(
+            lambda: copy_files(date_index, library, destination, worker_count, progress=TransferProgress()),
+            repeat,
+            setup=lambda: shutil.rmtree(destination, ignore_errors=True)
+        )
+        record(f'copy_files[workers={worker_count}]', seconds, median, len(planned))
+
+    # One read of every file written to two destinations (compare with two copy_files runs)
+    destinations = [os.path.join(destination, 'a'), os.path.join(destination, 'b')]
+    seconds, median, _ = time_stage(
+        lambda: copy_files(date_index, library, destinations, workers[0], progress=TransferProgress()),
+        repeat,
+        setup=lambda: shutil.rmtree(destination, ignore_errors=True)
+    )
+    record(f'copy_files[2 destinations, workers={workers[0]}]', seconds, median, 2 * len(planned))
+
+    # The streaming pipeline does the date extraction and the copy together (compare with get_creation_dates + copy_files)
+    for worker_count in workers:
+        seconds, median, result = time_stage(
+            lambda: ingest(library, destination, worker_count, progress=TransferProgress()),
+            repeat,
+            setup=lambda: shutil.rmtree(destination, ignore_errors=True)
+        )
+        record(f'ingest[workers={worker_count}]', seconds, median, result.matched)
+    shutil.rmtree(destination, ignore_errors=True)
+
+    return stages
+
+
+# Helper method to compare a run with the baseline (returns the names of the stages that regressed)
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    if baseline.get('config') != result['config']:
+        print("Baseline was made with a different library/config, the comparison is only indicative")
+    if baseline.get('environment') != result['environment']:
+        print(f"Baseline was made on a different machine ({baseline.get('environment')}), the comparison is only indicative")
+
+    regressions = []
+    print(f"{'stage':<30} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, stage in result['stages'].items():
+        reference = baseline.get('stages', {}).get(name)
+        if reference is None or not reference['seconds']:
+            print(f"{name:<30} {'-':>10} {stage['seconds']:>9.3f}s")
+            continue
+        change = stage['seconds'] / reference['seconds'] - 1
+        verdict = ''
+        if abs(stage['seconds'] - reference['seconds']) < NOISE_FLOOR:
+            pass
+        elif change > threshold:
+            verdict = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            verdict = 'faster'
+        print(f"{name:<30} {reference['seconds']:>9.3f}s {stage['seconds']:>9.3f}s {change * 100:>+7.1f}% {verdict}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ingest pipeline on a synthetic photo library")
+    parser.add_argument("--library", help="Generate the library in this folder and keep it (default: a temporary folder)")
+    parser.add_argument("--jpegs", type=int, default=2000, help="Number of standalone JPEGs")
+    parser.add_argument("--raws", type=int, default=1000, help="Number of RAW files")
+    parser.add_argument("--paired", type=float, default=0.5, help="Share of the RAW files with a JPEG of the same name")
+    parser.add_argument("--others", type=int, default=200, help="Number of files without capture metadata")
+    parser.add_argument("--jpeg_size", type=int, default=32 * 1024, help="Size of each JPEG in bytes")
+    parser.add_argument("--raw_size", type=int, default=128 * 1024, help="Size of each RAW file in bytes")
+    parser.add_argument("--other_size", type=int, default=64 * 1024, help="Size of each other file in bytes")
+    parser.add_argument("--depth", type=int, default=2, help="Number of nested directory levels")
+    parser.add_argument("--files_per_dir", type=int, default=250, help="Number of files per leaf directory")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the library generator")
+    parser.add_argument("--workers", nargs="+", type=parse_workers, default=[1, 4, 8, 'auto'], help="Worker counts to run copy_files with")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per stage (the fastest run is compared)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline to compare with")
+    parser.add_argument("--save_baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    config = {
+        key: getattr(args, key)
+        for key in ['jpegs', 'raws', 'paired', 'others', 'jpeg_size', 'raw_size', 'other_size', 'depth', 'files_per_dir', 'seed', 'repeat']
+    }
+    work = tempfile.mkdtemp(prefix='bench_pipeline_')
+    library = args.library or os.path.join(work, 'library')
+    try:
+        # The library is regenerated from the seed for every run so stale files can't skew the numbers
+        shutil.rmtree(library, ignore_errors=True)
+        print(f"Generating library in {library}")
+        summary = generate_library(
+            library, args.jpegs, args.raws, args.paired, args.others, args.jpeg_size, args.raw_size, args.other_size,
+            args.depth, args.files_per_dir, args.seed
+        )
+        print(f"{summary['files']} files ({summary['bytes'] / 1e6:.1f} MB), {args.repeat} runs per stage")
+        stages = run_benchmark(library, os.path.join(work, 'destination'), args.workers, args.repeat, summary)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    result = {'environment': describe_environment(), 'config': config, 'stages': stages}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved the baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stages regressed: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        print(f"No baseline at {args.baseline} (run with --save_baseline to store one)")
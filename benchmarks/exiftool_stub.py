@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import os, sys, json
+
+# Minimal stand-in for exiftool's -stay_open protocol so the exiftool pool can be tested and benchmarked on Linux
+# without Perl/exiftool. Point EXIFTOOL_PATH (or the executable parameter) at this script.
+#
+# Supported: -ver, -j with a list of files, -echo4 (with ${status}), -execute[NUM] and -stay_open False.
+# Dates are read with the header-only parser, files it can't parse come back without any date tags.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from exif_reader import ExifParseError, read_date_taken, read_raw_date_taken, RAW_EXTENSIONS
+
+STUB_VERSION = '12.40'
+
+
+# Helper method to build the JSON record exiftool would return for a file
+def describe(file_path: str) -> dict:
+    record = {'SourceFile': file_path}
+    reader = read_raw_date_taken if file_path.split('.')[-1].lower() in RAW_EXTENSIONS else read_date_taken
+    try:
+        date_taken = reader(file_path)
+    except ExifParseError:
+        date_taken = None
+    if date_taken is not None:
+        record['EXIF:DateTimeOriginal'] = date_taken.strftime('%Y:%m:%d 00:00:00')
+    return record
+
+
+# Helper method to run one -execute batch (returns stdout text, stderr text and the exit status)
+def run_batch(args: list) -> tuple:
+    stdout, stderr, echoes, files = [], [], [], []
+    status = 0
+    json_output = False
+
+    position = 0
+    while position < len(args):
+        arg = args[position]
+        if arg == '-echo4':
+            position += 1
+            echoes.append(args[position] if position < len(args) else '')
+        elif arg == '-ver':
+            stdout.append(STUB_VERSION)
+        elif arg == '-j':
+            json_output = True
+        elif not arg.startswith('-'):
+            files.append(arg)
+        position += 1
+
+    records = []
+    for file_path in files:
+        if not os.path.isfile(file_path):
+            stderr.append(f"Error: File not found - {file_path}")
+            status = 1
+            continue
+        records.append(describe(file_path))
+
+    if json_output and records:
+        stdout.append(json.dumps(records))
+
+    stderr.extend(echo.replace('${status}', str(status)) for echo in echoes)
+    return '\n'.join(stdout), '\n'.join(stderr), status
+
+
+if __name__ == "__main__":
+    batch = []
+    previous = None
+    for line in sys.stdin:
+        line = line.rstrip('\r\n')
+
+        if previous == '-stay_open' and line.lower() == 'false':
+            break
+
+        if line.startswith('-execute'):
+            out, err, _ = run_batch(batch)
+            signal = line[len('-execute'):]
+            sys.stdout.write(f"{out}\n{{ready{signal}}}\n")
+            sys.stdout.flush()
+            sys.stderr.write(f"{err}\n")
+            sys.stderr.flush()
+            batch = []
+        else:
+            batch.append(line)
+        previous = line
@@ -0,0 +1,168 @@
+import os, io, random, struct, argparse
+from datetime import datetime, timedelta
+
+# Generates a synthetic photo library for the benchmarks:
+#
+#   python benchmarks/generate_library.py /tmp/library --jpegs 2000 --raws 1000 --paired 0.5 --others 200 --depth 2
+#
+# - JPEGs are real images (encoded with Pillow) with an EXIF DateTimeOriginal, padded after the EOI marker to the requested size
+# - RAWs are TIFF headers with an ExifIFD DateTimeOriginal (CR2/NEF/ARW extensions), padded to the requested size;
+#   a share of them gets a JPEG with the same name next to it, like a camera shooting RAW+JPEG
+# - others are random bytes (videos, sidecars) that fall back to the file creation time
+#
+# The same seed always produces the same library.
+
+# Extensions of the generated files
+RAW_EXTENSIONS = ['CR2', 'NEF', 'ARW']
+OTHER_EXTENSIONS = ['MOV', 'MP4', 'XMP', 'txt']
+
+# Number of days the capture dates are spread over (starting at FIRST_DATE)
+FIRST_DATE = datetime(2023, 1, 1, 9, 0, 0)
+DATE_SPREAD_DAYS = 90
+
+# TIFF/EXIF tags written into the RAW headers
+EXIF_IFD_POINTER = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+
+
+# Helper method to build a little endian TIFF header with an ExifIFD holding DateTimeOriginal
+def build_tiff_header(date_taken: datetime) -> bytes:
+    date_value = date_taken.strftime('%Y:%m:%d %H:%M:%S').encode('ascii') + b'\x00'
+    # IFD0 (one entry: the ExifIFD pointer) starts right after the 8 byte header, the ExifIFD right after IFD0
+    exif_offset = 8 + 2 + 12 + 4
+    data_offset = exif_offset + 2 + 12 + 4
+    ifd0 = struct.pack('<H', 1) + struct.pack('<HHII', EXIF_IFD_POINTER, 4, 1, exif_offset) + struct.pack('<I', 0)
+    exif_ifd = struct.pack('<H', 1) + struct.pack('<HHII', DATE_TIME_ORIGINAL, 2, len(date_value), data_offset) + struct.pack('<I', 0)
+    return b'II' + struct.pack('<HI', 42, 8) + ifd0 + exif_ifd + date_value
+
+
+# Helper method to encode a small JPEG with Pillow carrying an EXIF DateTimeOriginal
+def build_jpeg(date_taken: datetime, rng: random.Random, dimensions: tuple = (64, 48)) -> bytes:
+    from PIL import Image
+
+    image = Image.frombytes('RGB', dimensions, rng.randbytes(dimensions[0] * dimensions[1] * 3))
+    exif = Image.Exif()
+    exif.get_ifd(EXIF_IFD_POINTER)[DATE_TIME_ORIGINAL] = date_taken.strftime('%Y:%m:%d %H:%M:%S')
+    output = io.BytesIO()
+    image.save(output, format='JPEG', exif=exif.tobytes(), quality=85)
+    return output.getvalue()
+
+
+# Helper method to write a file padded with random bytes to the requested size
+def write_padded(path: str, header: bytes, size: int, padding: bytes) -> None:
+    with open(path, 'wb') as f:
+        f.write(header)
+        remaining = size - len(header)
+        while remaining > 0:
+            f.write(padding[:remaining])
+            remaining -= len(padding)
+
+
+# Helper method to pick the directory of the n-th file (files_per_dir files per leaf, nested depth levels deep)
+def directory_for(root: str, position: int, depth: int, files_per_dir: int) -> str:
+    if depth == 0:
+        return root
+    leaf = position // files_per_dir
+    parts = []
+    for level in range(depth):
+        parts.append(f"{100 + leaf % 10}_L{level}")
+        leaf //= 10
+    return os.path.join(root, *reversed(parts))
+
+
+def generate_library(root: str, jpegs: int = 1000, raws: int = 500, paired: float = 0.5, others: int = 100,
+                     jpeg_size: int = 256 * 1024, raw_size: int = 1024 * 1024, other_size: int = 512 * 1024,
+                     depth: int = 1, files_per_dir: int = 500, seed: int = 0) -> dict:
+    """
+    Writes a synthetic library to root and returns what was generated (counts, bytes and the number of
+    files per capture date) so the benchmark can check the pipeline found everything.
+
+    Parameters:
+        root (str): Folder to generate the library in.
+        jpegs (int): Number of standalone JPEGs.
+        raws (int): Number of RAW files.
+        paired (float): Share of the RAW files that get a JPEG with the same name.
+        others (int): Number of files without capture metadata.
+        jpeg_size (int): Size of each JPEG in bytes.
+        raw_size (int): Size of each RAW file in bytes.
+        other_size (int): Size of each other file in bytes.
+        depth (int): Number of nested directory levels.
+        files_per_dir (int): Number of files per leaf directory.
+        seed (int): Seed of the random generator.
+    """
+    rng = random.Random(seed)
+    padding = rng.randbytes(1024 * 1024)
+
+    # Encode one JPEG per capture date and reuse it (encoding is the slow part)
+    dates = [FIRST_DATE + timedelta(days=day, minutes=day * 7) for day in range(DATE_SPREAD_DAYS)]
+    jpeg_templates = {}
+
+    summary = {'files': 0, 'bytes': 0, 'jpegs': 0, 'raws': 0, 'paired_raws': 0, 'others': 0, 'dates': {}}
+
+    def add(kind, size, date_taken=None):
+        summary['files'] += 1
+        summary['bytes'] += size
+        summary[kind] += 1
+        if date_taken is not None:
+            key = date_taken.date().isoformat()
+            summary['dates'][key] = summary['dates'].get(key, 0) + 1
+
+    def write_jpeg(path, date_taken):
+        if date_taken not in jpeg_templates:
+            jpeg_templates[date_taken] = build_jpeg(date_taken, rng)
+        template = jpeg_templates[date_taken]
+        write_padded(path, template, max(jpeg_size, len(template)), padding)
+        add('jpegs', max(jpeg_size, len(template)), date_taken)
+
+    position = 0
+    paired_count = int(raws * paired)
+    for i in range(raws):
+        directory = directory_for(root, position, depth, files_per_dir)
+        os.makedirs(directory, exist_ok=True)
+        date_taken = dates[rng.randrange(len(dates))]
+        name = f"DSC{i:05d}"
+        write_padded(os.path.join(directory, f"{name}.{RAW_EXTENSIONS[i % len(RAW_EXTENSIONS)]}"), build_tiff_header(date_taken), raw_size, padding)
+        if i < paired_count:
+            add('paired_raws', raw_size, date_taken)
+            write_jpeg(os.path.join(directory, f"{name}.JPG"), date_taken)
+            position += 1
+        else:
+            add('raws', raw_size, date_taken)
+        position += 1
+
+    for i in range(jpegs):
+        directory = directory_for(root, position, depth, files_per_dir)
+        os.makedirs(directory, exist_ok=True)
+        write_jpeg(os.path.join(directory, f"IMG_{i:05d}.jpg"), dates[rng.randrange(len(dates))])
+        position += 1
+
+    for i in range(others):
+        directory = directory_for(root, position, depth, files_per_dir)
+        os.makedirs(directory, exist_ok=True)
+        write_padded(os.path.join(directory, f"CLIP_{i:05d}.{OTHER_EXTENSIONS[i % len(OTHER_EXTENSIONS)]}"), b'', other_size, padding)
+        add('others', other_size)
+        position += 1
+
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic photo library for the benchmarks")
+    parser.add_argument("root", help="Folder to generate the library in")
+    parser.add_argument("--jpegs", type=int, default=1000, help="Number of standalone JPEGs")
+    parser.add_argument("--raws", type=int, default=500, help="Number of RAW files")
+    parser.add_argument("--paired", type=float, default=0.5, help="Share of the RAW files with a JPEG of the same name")
+    parser.add_argument("--others", type=int, default=100, help="Number of files without capture metadata")
+    parser.add_argument("--jpeg_size", type=int, default=256 * 1024, help="Size of each JPEG in bytes")
+    parser.add_argument("--raw_size", type=int, default=1024 * 1024, help="Size of each RAW file in bytes")
+    parser.add_argument("--other_size", type=int, default=512 * 1024, help="Size of each other file in bytes")
+    parser.add_argument("--depth", type=int, default=1, help="Number of nested directory levels")
+    parser.add_argument("--files_per_dir", type=int, default=500, help="Number of files per leaf directory")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    args = parser.parse_args()
+
+    summary = generate_library(
+        args.root, args.jpegs, args.raws, args.paired, args.others, args.jpeg_size, args.raw_size, args.other_size,
+        args.depth, args.files_per_dir, args.seed
+    )
+    print(f"Generated {summary['files']} files ({summary['bytes'] / 1e6:.1f} MB) on {len(summary['dates'])} dates in {args.root}")
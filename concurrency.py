@@ -0,0 +1,245 @@
+import os, time, threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterable, List
+
+# Value accepted instead of a number of workers to let the controller pick the concurrency
+AUTO_WORKERS = 'auto'
+
+# Files at or above this size go to the "large" lane, everything else to the "small" lane
+LARGE_FILE_THRESHOLD = 8 * 1024 * 1024
+
+# Bounds and starting point of each lane
+DEFAULT_LIMITS = {
+    'small': (1, 64, 8),
+    'large': (1, 16, 2),
+}
+
+# How often the controller re-evaluates a lane, and how much a change has to matter to count
+SAMPLE_INTERVAL = 0.5
+MIN_SAMPLE_FILES = 4
+TOLERANCE = 0.05
+
+# Files a streamed run keeps queued ahead of its copies (the rest wait in the stream, so the producer feeding it stays bounded)
+STREAM_READ_AHEAD = 256
+
+
+# Helper method to parse a workers setting from the GUI/CLI ('auto' or a number)
+def parse_workers(value) -> int | str:
+    if isinstance(value, str) and value.strip().lower() == AUTO_WORKERS:
+        return AUTO_WORKERS
+    return int(value)
+
+
+class FileFeed:
+    """
+    Hands the files of a copy run to its dispatch loop: a list is available at once, any other iterable (e.g. a
+    generator reading the queue of a streaming pipeline) is pulled by a background thread and handed over as the
+    files arrive. signal is a future that completes once there are files to take (or the stream ended), so the
+    dispatch loop can wait for new files and finished copies at the same time.
+
+    Parameters:
+        files (Iterable[str]): Paths of the files to copy.
+        read_ahead (int): Most files of a stream held here before the stream is no longer pulled.
+    """
+
+    def __init__(self, files: Iterable[str], read_ahead: int = STREAM_READ_AHEAD):
+        self.streaming = not isinstance(files, (list, tuple))
+        self.read_ahead = read_ahead
+        self.signal = Future()
+        self._arrived = deque() if self.streaming else deque(files)
+        self._finished = not self.streaming
+        self._error = None
+        self._condition = threading.Condition()
+        if self.streaming:
+            threading.Thread(target=self._pull, args=(iter(files),), name='file_feed', daemon=True).start()
+        else:
+            self.signal.set_result(None)
+
+    # Helper method to pull a stream into the feed (waits while read_ahead files are waiting to be taken)
+    def _pull(self, files) -> None:
+        try:
+            for file_path in files:
+                with self._condition:
+                    while len(self._arrived) >= self.read_ahead:
+                        self._condition.wait()
+                    self._arrived.append(file_path)
+                    self._wake()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self._finished = True
+                self._wake()
+
+    # Helper method to complete the signal (called with the condition held)
+    def _wake(self) -> None:
+        if not self.signal.done():
+            self.signal.set_result(None)
+
+    def take(self, limit: int = None) -> tuple:
+        """
+        Returns (files, finished): up to limit of the files that arrived since the last call (None = all of them) and
+        whether the feed is exhausted. Raises the error of a stream that failed once its files are taken.
+        """
+        with self._condition:
+            count = len(self._arrived) if limit is None else min(limit, len(self._arrived))
+            files = [self._arrived.popleft() for _ in range(count)]
+            finished = self._finished and not self._arrived
+            if not self._arrived and not self._finished and self.signal.done():
+                self.signal = Future()
+            self._condition.notify()
+        if finished and self._error is not None:
+            raise self._error
+        return files, finished
+
+
+class AdaptiveConcurrency:
+    """
+    Hill-climbing controller for the number of in-flight copies of one lane.
+
+    Every sample interval it compares the lane's throughput (bytes/s for large files, files/s for small
+    files) with the previous interval. While throughput keeps improving it keeps moving the limit in the
+    same direction one step at a time. When throughput drops it reverses, and a reversal downwards
+    is multiplicative (AIMD), so a thrashing device backs off quickly.
+
+    Parameters:
+        name (str): Lane name used when logging changes.
+        min_limit (int): Lowest number of in-flight copies.
+        max_limit (int): Highest number of in-flight copies.
+        initial (int): Starting number of in-flight copies.
+        by_bytes (bool): Measure bytes/s (True) or files/s (False).
+    """
+
+    def __init__(self, name: str, min_limit: int, max_limit: int, initial: int, by_bytes: bool):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = max(min_limit, min(max_limit, initial))
+        self.by_bytes = by_bytes
+
+        self.direction = 1
+        self.previous_rate = None
+        self.history = [self.limit]
+
+        self._window_start = time.perf_counter()
+        self._window_bytes = 0
+        self._window_files = 0
+        self._window_latency = 0.0
+
+    def record(self, size: int, latency: float) -> None:
+        """Records a finished copy and adjusts the limit once a sample interval is complete."""
+        self._window_bytes += size
+        self._window_files += 1
+        self._window_latency += latency
+
+        elapsed = time.perf_counter() - self._window_start
+        if elapsed >= SAMPLE_INTERVAL and self._window_files >= MIN_SAMPLE_FILES:
+            self._adjust(elapsed)
+
+    def _adjust(self, elapsed: float) -> None:
+        rate = (self._window_bytes if self.by_bytes else self._window_files) / elapsed
+        mean_latency = self._window_latency / self._window_files
+        old_limit = self.limit
+
+        if self.previous_rate is None:
+            # First sample: probe upwards
+            self.limit += 1
+        elif rate > self.previous_rate * (1 + TOLERANCE):
+            # Still improving: keep going the same way
+            self.limit += self.direction
+        elif rate < self.previous_rate * (1 - TOLERANCE):
+            # Got worse: turn around (backing off is multiplicative)
+            self.direction = -self.direction
+            if self.direction < 0:
+                self.limit = int(self.limit * 0.75)
+            else:
+                self.limit += 1
+
+        self.limit = max(self.min_limit, min(self.max_limit, self.limit))
+        self.previous_rate = rate
+
+        if self.limit != old_limit:
+            unit = f"{rate / 1e6:.1f} MB/s" if self.by_bytes else f"{rate:.1f} files/s"
+            print(f"Auto concurrency ({self.name} files): {old_limit} -> {self.limit} in flight ({unit}, {mean_latency * 1000:.1f} ms/file)")
+            self.history.append(self.limit)
+
+        self._window_start = time.perf_counter()
+        self._window_bytes = 0
+        self._window_files = 0
+        self._window_latency = 0.0
+
+
+def run_adaptive(copy_fn: Callable[[str], object], files: Iterable[str], large_file_threshold: int = LARGE_FILE_THRESHOLD, limits: dict = DEFAULT_LIMITS, cancel: threading.Event = None,
+                 sizes: dict = None) -> list:
+    """
+    Runs copy_fn on every file with the number of in-flight copies picked by an AdaptiveConcurrency
+    controller per lane (small and large files), and returns the results in completion order.
+
+    Parameters:
+        copy_fn (Callable[[str], object]): Function copying a single file.
+        files (Iterable[str]): Paths of the files to copy, a list or a stream that is copied as it arrives (see FileFeed).
+        large_file_threshold (int): Size in bytes from which a file counts as large.
+        limits (dict): (min, max, initial) in-flight copies for the 'small' and 'large' lanes.
+        cancel (threading.Event): Once set, no new copies are started (the ones in flight finish, a stream is drained).
+        sizes (dict): Sizes already known for the files (path -> bytes), the others are stat'd here (the producer of a
+            stream can add the sizes of its files before handing them over).
+    """
+    sizes = {} if sizes is None else sizes
+    feed = FileFeed(files)
+    lanes = {
+        'small': (deque(), AdaptiveConcurrency('small', *limits['small'], by_bytes=False)),
+        'large': (deque(), AdaptiveConcurrency('large', *limits['large'], by_bytes=True)),
+    }
+
+    results = []
+    in_flight = {}
+    running = {lane: 0 for lane in lanes}
+    max_threads = limits['small'][1] + limits['large'][1]
+
+    with ThreadPoolExecutor(max_workers=max_threads) as executor:
+        while True:
+            # Sort the files that arrived into the lanes (a stream is only read ahead of the copies so far)
+            queued = sum(len(queue) for queue, _ in lanes.values())
+            arrived, finished = feed.take(max(0, STREAM_READ_AHEAD - queued) if feed.streaming else None)
+            for file_path in arrived:
+                size = sizes.get(file_path)
+                if size is None:
+                    try:
+                        size = os.path.getsize(file_path)
+                    except OSError:
+                        size = 0
+                lane = 'large' if size >= large_file_threshold else 'small'
+                lanes[lane][0].append((file_path, size))
+
+            # Drop whatever hasn't started yet once the run is cancelled
+            if cancel is not None and cancel.is_set():
+                for queue, _ in lanes.values():
+                    queue.clear()
+
+            # Top up every lane to its current limit
+            for lane, (queue, controller) in lanes.items():
+                while queue and running[lane] < controller.limit:
+                    file_path, size = queue.popleft()
+                    in_flight[executor.submit(copy_fn, file_path)] = (lane, size, time.perf_counter())
+                    running[lane] += 1
+
+            if not in_flight and finished:
+                break
+            # Wait for a copy to finish or (while there is room to queue them) for more files of the stream
+            waiting = list(in_flight)
+            if not finished and sum(len(queue) for queue, _ in lanes.values()) < STREAM_READ_AHEAD:
+                waiting.append(feed.signal)
+            done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future not in in_flight:
+                    continue
+                lane, size, started = in_flight.pop(future)
+                running[lane] -= 1
+                lanes[lane][1].record(size, time.perf_counter() - started)
+                results.append(future.result())
+
+    # Log where the controllers ended up so the setting can be pinned
+    summary = ', '.join(f"{lane}={controller.limit}" for lane, (_, controller) in lanes.items())
+    print(f"Auto concurrency settled at {summary}")
+    return results
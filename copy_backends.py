@@ -0,0 +1,351 @@
+import os, errno, queue, shutil, threading
+from collections import Counter
+from typing import List
+
+# fcntl (and with it FICLONE reflinks) only exists on Unix
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Copy backends, fastest first
+BACKEND_REFLINK = 'reflink'
+BACKEND_COPY_FILE_RANGE = 'copy_file_range'
+BACKEND_SENDFILE = 'sendfile'
+BACKEND_READINTO = 'readinto'
+BACKENDS = [BACKEND_REFLINK, BACKEND_COPY_FILE_RANGE, BACKEND_SENDFILE, BACKEND_READINTO]
+
+# Backends that copy without the data passing through user space, worth keeping when the file is hashed too
+# (the source is hashed in a separate read after the copy, see copy_file_fast)
+KERNEL_BACKENDS = {BACKEND_REFLINK, BACKEND_COPY_FILE_RANGE}
+
+# Backend of a single-read copy to several destinations (see copy_fanout)
+BACKEND_FANOUT = 'fanout'
+
+# ioctl number of FICLONE (_IOW(0x94, 9, int)) used for btrfs/XFS reflinks
+FICLONE = 0x40049409
+
+# Size of the reusable per-thread buffer of the readinto backend and of each kernel side copy call
+BUFFER_SIZE = 8 * 1024 * 1024
+
+# errno values meaning "this backend doesn't work for this pair of filesystems" rather than a real I/O error
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EOPNOTSUPP, errno.EBADF,
+    getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)
+}
+
+# Chunk size of a fan-out copy and the number of chunks in flight per file (the most a slow destination can fall
+# behind the fastest one before the source read waits for it)
+FANOUT_CHUNK_SIZE = 1024 * 1024
+FANOUT_BUFFERS = 8
+
+# Page cache hints (posix_fadvise only exists on Unix)
+ADVICE_SEQUENTIAL = getattr(os, 'POSIX_FADV_SEQUENTIAL', None)
+ADVICE_DONTNEED = getattr(os, 'POSIX_FADV_DONTNEED', None)
+
+# Backends found not to work per (source device, destination device) pair, so they're only probed once
+_unsupported = {}
+_unsupported_lock = threading.Lock()
+_local = threading.local()
+
+
+# Helper method to get the reusable copy buffer of the current thread
+def _get_buffer() -> bytearray:
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        buffer = _local.buffer = bytearray(BUFFER_SIZE)
+    return buffer
+
+
+# Helper method to give the kernel a page cache hint for a whole file (a no-op where posix_fadvise isn't available)
+def advise(fd: int, advice: int) -> None:
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, advice)
+    except OSError:
+        pass
+
+
+# Helper method to get the reusable fan-out buffers of the current thread
+def _get_fanout_buffers() -> list:
+    buffers = getattr(_local, 'fanout_buffers', None)
+    if buffers is None:
+        buffers = _local.fanout_buffers = [bytearray(FANOUT_CHUNK_SIZE) for _ in range(FANOUT_BUFFERS)]
+    return buffers
+
+
+def _copy_reflink(src, dst) -> None:
+    if fcntl is None:
+        raise OSError(errno.ENOSYS, "FICLONE is not available on this platform")
+    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy_file_range(src, dst) -> None:
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available on this platform")
+    while os.copy_file_range(src.fileno(), dst.fileno(), BUFFER_SIZE):
+        pass
+
+
+def _copy_sendfile(src, dst) -> None:
+    if not hasattr(os, 'sendfile'):
+        raise OSError(errno.ENOSYS, "sendfile is not available on this platform")
+    offset = 0
+    while True:
+        sent = os.sendfile(dst.fileno(), src.fileno(), offset, BUFFER_SIZE)
+        if sent == 0:
+            break
+        offset += sent
+
+
+def _copy_readinto(src, dst) -> None:
+    view = memoryview(_get_buffer())
+    while True:
+        read = src.readinto(view)
+        if not read:
+            break
+        written = 0
+        while written < read:
+            written += dst.write(view[written:read])
+
+
+_BACKEND_FUNCTIONS = {
+    BACKEND_REFLINK: _copy_reflink,
+    BACKEND_COPY_FILE_RANGE: _copy_file_range,
+    BACKEND_SENDFILE: _copy_sendfile,
+    BACKEND_READINTO: _copy_readinto,
+}
+
+
+# Helper method to get the backends worth trying for a pair of devices, fastest first
+def _candidate_backends(src_dev: int, dst_dev: int) -> list:
+    with _unsupported_lock:
+        unsupported = _unsupported.get((src_dev, dst_dev), set())
+    candidates = [backend for backend in BACKENDS if backend not in unsupported]
+
+    # copy_file_range is only used within the same filesystem
+    if src_dev != dst_dev and BACKEND_COPY_FILE_RANGE in candidates:
+        candidates.remove(BACKEND_COPY_FILE_RANGE)
+    return candidates
+
+
+def copy_file_fast(source_path: str, destination_path: str, backend: str = None, hasher=None, drop_cache: bool = False) -> str:
+    """
+    Copies a file with the fastest backend available for the source/destination pair and preserves
+    its metadata like shutil.copy2. Returns the name of the backend that was used.
+
+    Backends are tried in order (reflink, copy_file_range, sendfile, readinto). A backend that isn't
+    supported for a pair of devices is remembered so it isn't probed again for the next file.
+    The source is read with a sequential access hint (larger readahead).
+
+    With a hasher, only the kernel side backends (reflink, copy_file_range) and readinto are tried. A kernel
+    side copy is followed by one read of the source for the hash: for a reflink that read is all the I/O there
+    is, for copy_file_range it usually comes from the page cache. readinto hashes the data while copying it,
+    sendfile is left out since it would read the file twice without saving the copy through user space.
+
+    Parameters:
+        source_path (str): Path of the file to copy.
+        destination_path (str): Path to copy the file to.
+        backend (str): Force a single backend (e.g. for benchmarks) instead of picking one.
+        hasher: hashlib hasher fed with the data of the source (after a kernel side copy, or while it is
+            copied by readinto). The backend name gets a '+hash' suffix.
+        drop_cache (bool): Drop the file from the page cache once it is copied (for offloads larger than memory,
+            so they don't push everything else out of the cache; the destination's dirty pages start writeback).
+    """
+    with open(source_path, 'rb', buffering=0) as src, open(destination_path, 'wb', buffering=0) as dst:
+        advise(src.fileno(), ADVICE_SEQUENTIAL)
+        pair = (os.fstat(src.fileno()).st_dev, os.fstat(dst.fileno()).st_dev)
+        candidates = [backend] if backend else _candidate_backends(*pair)
+        # readinto comes last, so the hasher is only fed once a backend can't fail over anymore
+        if hasher is not None:
+            candidates = [name for name in candidates if name in KERNEL_BACKENDS] + [BACKEND_READINTO]
+
+        for position, name in enumerate(candidates):
+            try:
+                if hasher is None:
+                    _BACKEND_FUNCTIONS[name](src, dst)
+                    used = name
+                elif name == BACKEND_READINTO:
+                    while copy_range(src, dst, BUFFER_SIZE, hasher):
+                        pass
+                    used = name + '+hash'
+                else:
+                    _BACKEND_FUNCTIONS[name](src, dst)
+                    src.seek(0)
+                    _hash_file(src, hasher)
+                    used = name + '+hash'
+                break
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS or position == len(candidates) - 1:
+                    raise
+                with _unsupported_lock:
+                    _unsupported.setdefault(pair, set()).add(name)
+
+                # Start over with the next backend
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate(0)
+
+        if drop_cache:
+            advise(src.fileno(), ADVICE_DONTNEED)
+            advise(dst.fileno(), ADVICE_DONTNEED)
+
+    shutil.copystat(source_path, destination_path)
+    return used
+
+
+# Helper method to feed the rest of an open file to a hasher through the reusable buffer
+def _hash_file(src, hasher) -> None:
+    view = memoryview(_get_buffer())
+    while True:
+        read = src.readinto(view)
+        if not read:
+            break
+        hasher.update(view[:read])
+
+
+def copy_range(src, dst, length: int, hasher=None) -> int:
+    """
+    Copies up to length bytes from the current position of src to the current position of dst through the
+    reusable buffer, optionally feeding every byte to a hashlib hasher. Returns the number of bytes copied.
+    """
+    view = memoryview(_get_buffer())
+    copied = 0
+    while copied < length:
+        read = src.readinto(view[:min(len(view), length - copied)])
+        if not read:
+            break
+        if hasher is not None:
+            hasher.update(view[:read])
+        written = 0
+        while written < read:
+            written += dst.write(view[written:read])
+        copied += read
+    return copied
+
+
+def copy_fanout(source_path: str, destination_paths: List[str], hasher=None, drop_cache: bool = False) -> list:
+    """
+    Copies a file to several destinations reading the source only once, and preserves its metadata like
+    shutil.copy2. Returns one entry per destination: None if it was written, otherwise the OSError that
+    stopped it (a failing destination doesn't stop the others). Errors reading the source are raised.
+
+    Files that fit in one chunk are written to one destination after the other from the same buffer. Larger
+    files get a writer thread per destination, fed from a pool of FANOUT_BUFFERS reusable chunks: a slow
+    destination can fall behind the others by that many chunks before the read (and with it the others) waits.
+
+    Parameters:
+        source_path (str): Path of the file to copy.
+        destination_paths (List[str]): Paths to copy the file to.
+        hasher: hashlib hasher fed with the data once while it is read.
+        drop_cache (bool): Drop the file from the page cache once it is copied (see copy_file_fast).
+    """
+    errors = [None] * len(destination_paths)
+    outputs = [None] * len(destination_paths)
+    buffers = _get_fanout_buffers()
+
+    with open(source_path, 'rb', buffering=0) as src:
+        advise(src.fileno(), ADVICE_SEQUENTIAL)
+        try:
+            for position, destination_path in enumerate(destination_paths):
+                try:
+                    outputs[position] = open(destination_path, 'wb', buffering=0)
+                except OSError as e:
+                    errors[position] = e
+
+            # Helper method to write a chunk to one destination (a destination that fails is closed and left out from then on)
+            def write(position, view):
+                try:
+                    written = 0
+                    while written < len(view):
+                        written += outputs[position].write(view[written:])
+                except OSError as e:
+                    errors[position] = e
+                    outputs[position].close()
+
+            live = [position for position, output in enumerate(outputs) if output is not None]
+            if os.fstat(src.fileno()).st_size <= FANOUT_CHUNK_SIZE or len(live) < 2:
+                view = memoryview(buffers[0])
+                while True:
+                    read = src.readinto(view)
+                    if not read:
+                        break
+                    if hasher is not None:
+                        hasher.update(view[:read])
+                    for position in live:
+                        if errors[position] is None:
+                            write(position, view[:read])
+            else:
+                _fanout_chunks(src, buffers, live, write, errors, hasher)
+
+            if drop_cache:
+                advise(src.fileno(), ADVICE_DONTNEED)
+                for position in live:
+                    if errors[position] is None:
+                        advise(outputs[position].fileno(), ADVICE_DONTNEED)
+        finally:
+            for output in outputs:
+                if output is not None and not output.closed:
+                    output.close()
+
+    for position, destination_path in enumerate(destination_paths):
+        if errors[position] is None:
+            try:
+                shutil.copystat(source_path, destination_path)
+            except OSError as e:
+                errors[position] = e
+    return errors
+
+
+# Helper method to read a file once and hand every chunk to a writer thread per destination
+def _fanout_chunks(src, buffers: list, live: List[int], write, errors: list, hasher) -> None:
+    free = queue.Queue()
+    for buffer in buffers:
+        free.put(buffer)
+    # Number of writers still holding each chunk, the last one returns it to the pool
+    holders = {}
+    holders_lock = threading.Lock()
+    queues = {position: queue.Queue() for position in live}
+
+    def writer(position):
+        while True:
+            item = queues[position].get()
+            if item is None:
+                return
+            buffer, read = item
+            # A destination that failed keeps draining its queue so the chunks go back to the pool
+            if errors[position] is None:
+                write(position, memoryview(buffer)[:read])
+            with holders_lock:
+                holders[id(buffer)] -= 1
+                if not holders[id(buffer)]:
+                    free.put(buffer)
+
+    threads = [threading.Thread(target=writer, args=(position,), daemon=True) for position in live]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            # Waits while every chunk is still held by a (slow) destination
+            buffer = free.get()
+            read = src.readinto(buffer)
+            if not read:
+                break
+            if hasher is not None:
+                hasher.update(memoryview(buffer)[:read])
+            with holders_lock:
+                holders[id(buffer)] = len(live)
+            for position in live:
+                queues[position].put((buffer, read))
+    finally:
+        for position in live:
+            queues[position].put(None)
+        for thread in threads:
+            thread.join()
+
+
+# Helper method to summarize which backends were used for a batch of copies
+def summarize_backends(backends) -> str:
+    counts = Counter(backend for backend in backends if backend)
+    return ', '.join(f"{name}: {count}" for name, count in counts.most_common()) or 'none'
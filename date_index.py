@@ -0,0 +1,205 @@
+import os, sqlite3
+from datetime import date
+
+# Default location of the on-disk capture date index (shared by the GUI and the CLI)
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.file_transfer', 'date_index.sqlite3')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode    INTEGER NOT NULL,
+    ordinal  INTEGER
+)
+"""
+
+
+# Helper method to build the key used to decide whether a cached row is still valid
+def _stat_key(stat_result: os.stat_result) -> tuple:
+    return (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino)
+
+
+# Helper method to get the (low, high) bounds covering every indexed path below a directory
+def _prefix_bounds(directory: str) -> tuple:
+    prefix = os.path.join(os.path.abspath(directory), '')
+    return prefix, prefix + '\U0010ffff'
+
+
+class DateIndex:
+    """
+    Persistent, incremental index of capture dates keyed by path, size, mtime and inode.
+
+    A row is only trusted when the size, mtime and inode recorded for a path still match
+    the file on disk, so a rescan only needs to extract dates for new or changed files.
+    Files that were extracted but had no capture date are stored with a NULL date so they
+    count as hits on the next scan as well.
+
+    Parameters:
+        db_path (str): Path to the SQLite database (created if it doesn't exist).
+    """
+
+    def __init__(self, db_path: str = DEFAULT_INDEX_PATH):
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+
+        # Hit/miss counters (reset with reset_counters)
+        self.hits = 0
+        self.misses = 0
+
+        # Rows preloaded for a directory so lookups don't need a query per file
+        self._preloaded = {}
+        self._preloaded_roots = []
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def preload(self, directory: str) -> int:
+        """
+        Loads every row below a directory into memory with a single query.
+        Returns the number of rows loaded.
+        """
+        low, high = _prefix_bounds(directory)
+        rows = self.conn.execute(
+            'SELECT path, size, mtime_ns, inode, ordinal FROM files WHERE path >= ? AND path < ?',
+            (low, high)
+        )
+        for path, size, mtime_ns, inode, ordinal in rows:
+            self._preloaded[path] = ((size, mtime_ns, inode), ordinal)
+        self._preloaded_roots.append(low)
+        return len(self._preloaded)
+
+    def lookup(self, path: str, stat_result: os.stat_result = None):
+        """
+        Looks up the capture date of a file.
+
+        Returns a (found, date) tuple. found is False on a miss (new or changed file), in which
+        case the date has to be extracted and passed to store(). On a hit date may be None if the
+        file is known to have no capture date.
+        """
+        key_path = os.path.abspath(path)
+        if stat_result is None:
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                self.misses += 1
+                return False, None
+
+        row = self._preloaded.get(key_path)
+        if row is None and not any(key_path.startswith(root) for root in self._preloaded_roots):
+            found = self.conn.execute(
+                'SELECT size, mtime_ns, inode, ordinal FROM files WHERE path = ?', (key_path,)
+            ).fetchone()
+            if found is not None:
+                row = (tuple(found[:3]), found[3])
+
+        if row is not None and row[0] == _stat_key(stat_result):
+            self.hits += 1
+            ordinal = row[1]
+            return True, date.fromordinal(ordinal) if ordinal is not None else None
+
+        self.misses += 1
+        return False, None
+
+    def store(self, path: str, date_taken, stat_result: os.stat_result = None) -> None:
+        """
+        Records the capture date of a file (date_taken may be None for files without one).
+        Writes are buffered until commit() is called.
+        """
+        if stat_result is None:
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                return
+
+        ordinal = date_taken.toordinal() if date_taken is not None else None
+        key_path = os.path.abspath(path)
+        self._pending.append((key_path, *_stat_key(stat_result), ordinal))
+        if key_path in self._preloaded:
+            self._preloaded[key_path] = (_stat_key(stat_result), ordinal)
+
+    def commit(self) -> None:
+        """Flushes buffered writes to disk in a single transaction."""
+        if self._pending:
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, ordinal) VALUES (?, ?, ?, ?, ?)',
+                    self._pending
+                )
+            self._pending.clear()
+
+    def prune(self, directory: str = None) -> int:
+        """
+        Removes rows for files that no longer exist (optionally only below a directory).
+        Returns the number of rows removed.
+        """
+        self.commit()
+        if directory is None:
+            rows = self.conn.execute('SELECT path FROM files')
+        else:
+            rows = self.conn.execute('SELECT path FROM files WHERE path >= ? AND path < ?', _prefix_bounds(directory))
+
+        missing = [(path,) for (path,) in rows if not os.path.exists(path)]
+        with self.conn:
+            self.conn.executemany('DELETE FROM files WHERE path = ?', missing)
+        for (path,) in missing:
+            self._preloaded.pop(path, None)
+        return len(missing)
+
+    def invalidate(self, directory: str = None) -> int:
+        """
+        Drops every row (optionally only below a directory) so the next scan re-extracts all dates.
+        Returns the number of rows removed.
+        """
+        self._pending.clear()
+        self._preloaded.clear()
+        self._preloaded_roots.clear()
+        with self.conn:
+            if directory is None:
+                cursor = self.conn.execute('DELETE FROM files')
+            else:
+                cursor = self.conn.execute('DELETE FROM files WHERE path >= ? AND path < ?', _prefix_bounds(directory))
+        return cursor.rowcount
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and the number of indexed files."""
+        total = self.conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': total}
+
+    def close(self) -> None:
+        self.commit()
+        self._preloaded.clear()
+        self._preloaded_roots.clear()
+        self.conn.close()
+
+
+# Maintenance entry point for the index (prune stale rows, invalidate a folder or print stats)
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the on-disk capture date index")
+    parser.add_argument("mode", choices=["prune", "invalidate", "stats"], help="prune: drop rows for deleted files, invalidate: drop all rows, stats: print counters")
+    parser.add_argument("directory", nargs="?", help="Only touch rows below this directory")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Path to the index database")
+    args = parser.parse_args()
+
+    with DateIndex(args.index) as index:
+        if args.mode == "prune":
+            print(f"Pruned {index.prune(args.directory)} stale entries")
+        elif args.mode == "invalidate":
+            print(f"Invalidated {index.invalidate(args.directory)} entries")
+        print(index.stats())
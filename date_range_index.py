@@ -0,0 +1,92 @@
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Dict, Iterable, List
+
+
+# Helper method to normalize a file type filter ('.JPG', 'jpg' -> 'jpg')
+def normalize_file_type(file_type: str) -> str:
+    if not file_type:
+        return None
+    return file_type.lower().lstrip('.')
+
+
+# Helper method to get the lower case extension of a path (without the dot)
+def _get_extension(path: str) -> str:
+    name = path.replace('\\', '/').rsplit('/', 1)[-1]
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+
+
+# Helper method to turn a date/datetime bound into a date ordinal
+def _to_ordinal(value) -> int:
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal()
+
+
+class DateRangeIndex:
+    """
+    Sorted index of capture dates used to plan transfers.
+
+    Date ordinals are kept in a sorted list next to the files for each date, so a date range is found
+    with two bisects and only the k matching files are touched (O(log n + k)). A per-extension sub index
+    with the same layout is built the first time an extension is queried.
+
+    Parameters:
+        date_file_map (dict[date, List[str]]): Map of dates to file paths (e.g. from get_creation_dates_for_directory).
+    """
+
+    def __init__(self, date_file_map: Dict[date, List[str]] = None):
+        self._ordinals, self._files = self._build((date_taken.toordinal(), files) for date_taken, files in (date_file_map or {}).items())
+        self._by_extension = {}
+
+    # Helper method to build the sorted (ordinals, files) columns
+    @staticmethod
+    def _build(items: Iterable) -> tuple:
+        merged = {}
+        for ordinal, files in items:
+            if files:
+                merged.setdefault(ordinal, []).extend(files)
+        ordinals = sorted(merged)
+        return ordinals, [merged[ordinal] for ordinal in ordinals]
+
+    # Helper method to get (and build on first use) the sub index for a single extension
+    def _extension_index(self, extension: str) -> tuple:
+        if extension not in self._by_extension:
+            self._by_extension[extension] = self._build(
+                (ordinal, [path for path in files if _get_extension(path) == extension])
+                for ordinal, files in zip(self._ordinals, self._files)
+            )
+        return self._by_extension[extension]
+
+    def __len__(self) -> int:
+        return sum(len(files) for files in self._files)
+
+    def __contains__(self, value) -> bool:
+        ordinal = _to_ordinal(value)
+        position = bisect_left(self._ordinals, ordinal)
+        return position < len(self._ordinals) and self._ordinals[position] == ordinal
+
+    def dates(self) -> List[date]:
+        """Returns every date that has files, in ascending order."""
+        return [date.fromordinal(ordinal) for ordinal in self._ordinals]
+
+    def query(self, start_date=None, end_date=None, file_type: str = None) -> List[str]:
+        """
+        Returns the de-duplicated list of files taken between start_date and end_date (inclusive).
+
+        Parameters:
+            start_date (date | datetime): First date to include (None = no lower bound).
+            end_date (date | datetime): Last date to include (None = no upper bound).
+            file_type (str): Extension filter (e.g. ".jpg" or "jpg", case insensitive).
+        """
+        extension = normalize_file_type(file_type)
+        ordinals, files = self._extension_index(extension) if extension else (self._ordinals, self._files)
+
+        low = bisect_left(ordinals, _to_ordinal(start_date)) if start_date is not None else 0
+        high = bisect_right(ordinals, _to_ordinal(end_date)) if end_date is not None else len(ordinals)
+
+        # dict.fromkeys keeps the order and drops duplicates in O(k)
+        plan = {}
+        for position in range(low, high):
+            plan.update(dict.fromkeys(files[position]))
+        return list(plan)
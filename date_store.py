@@ -0,0 +1,187 @@
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Dict, Iterator, List
+from date_range_index import _get_extension, _to_ordinal, normalize_file_type
+
+
+# Helper method to split a path into its directory prefix (with the trailing separator) and its name, so prefix + name is the original path
+def _split_path(path: str) -> tuple:
+    position = max(path.rfind('/'), path.rfind(os.sep))
+    return path[:position + 1], path[position + 1:]
+
+
+class DateStore:
+    """
+    Compact column store of the capture date of every file, for libraries with millions of files.
+
+    Instead of a list of full path strings per date, every file is one row spread over flat columns: the id
+    of its directory in an interned directory table, its name in a single utf-8 blob (with an offset array),
+    its date ordinal and the code of its extension. A row costs a few dozen bytes instead of a path string,
+    a list slot and a date object per file. Rows are sorted by date the first time the store is queried,
+    so date ranges are found with two bisects like in DateRangeIndex.
+
+    Parameters:
+        date_file_map (dict[date, List[str]]): Map of dates to file paths (e.g. from get_creation_dates_for_directory).
+    """
+
+    def __init__(self, date_file_map: Dict[date, List[str]] = None):
+        # Interned directory table and the directory of every row
+        self._directories = []
+        self._directory_ids = {}
+        self._directory_column = array('i')
+
+        # Names of all rows (utf-8, row i is _names[_name_offsets[i]:_name_offsets[i + 1]])
+        self._names = bytearray()
+        self._name_offsets = array('q', [0])
+
+        self._ordinals = array('i')
+
+        # Interned extension table and the extension of every row
+        self._extension_table = []
+        self._extension_ids = {}
+        self._extension_column = array('H')
+
+        # Rows in date order and their ordinals (rebuilt lazily after rows were added)
+        self._order = array('i')
+        self._sorted_ordinals = array('i')
+        self._sorted = True
+
+        if date_file_map:
+            self.update(date_file_map)
+
+    # Helper method to get (and add on first use) the id of a value in an interned table
+    @staticmethod
+    def _intern(value: str, table: list, ids: dict) -> int:
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = ids[value] = len(table)
+            table.append(value)
+        return value_id
+
+    def add(self, path: str, date_taken: date) -> None:
+        """Adds a file with its capture date."""
+        directory, name = _split_path(path)
+        self._directory_column.append(self._intern(directory, self._directories, self._directory_ids))
+        self._names += name.encode('utf-8', 'surrogatepass')
+        self._name_offsets.append(len(self._names))
+        self._ordinals.append(date_taken.toordinal())
+        self._extension_column.append(self._intern(_get_extension(name), self._extension_table, self._extension_ids))
+        self._sorted = False
+
+    def update(self, date_file_map: Dict[date, List[str]]) -> None:
+        """Adds every file of a map of dates to file paths."""
+        for date_taken, files in date_file_map.items():
+            for path in files:
+                self.add(path, date_taken)
+
+    def path(self, row: int) -> str:
+        """Returns the full path of a row."""
+        name = self._names[self._name_offsets[row]:self._name_offsets[row + 1]].decode('utf-8', 'surrogatepass')
+        return self._directories[self._directory_column[row]] + name
+
+    # Helper method to sort the rows by date (stable, so files keep the order they were added in within a date)
+    def _ensure_sorted(self) -> None:
+        if self._sorted:
+            return
+        self._order = array('i', sorted(range(len(self._ordinals)), key=self._ordinals.__getitem__))
+        self._sorted_ordinals = array('i', (self._ordinals[row] for row in self._order))
+        self._sorted = True
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    def __contains__(self, value) -> bool:
+        self._ensure_sorted()
+        ordinal = _to_ordinal(value)
+        position = bisect_left(self._sorted_ordinals, ordinal)
+        return position < len(self._sorted_ordinals) and self._sorted_ordinals[position] == ordinal
+
+    def dates(self) -> List[date]:
+        """Returns every date that has files, in ascending order."""
+        return self.select().dates()
+
+    def select(self, start_date=None, end_date=None, file_type: str = None) -> 'DateStoreView':
+        """
+        Returns a view of the files taken between start_date and end_date (inclusive), nothing is copied.
+
+        Parameters:
+            start_date (date | datetime): First date to include (None = no lower bound).
+            end_date (date | datetime): Last date to include (None = no upper bound).
+            file_type (str): Extension filter (e.g. ".jpg" or "jpg", case insensitive).
+        """
+        self._ensure_sorted()
+        low = bisect_left(self._sorted_ordinals, _to_ordinal(start_date)) if start_date is not None else 0
+        high = bisect_right(self._sorted_ordinals, _to_ordinal(end_date)) if end_date is not None else len(self._sorted_ordinals)
+
+        extension = normalize_file_type(file_type)
+        if extension is None:
+            return DateStoreView(self, low, high)
+        # An extension that isn't in the store can't match anything
+        extension_code = self._extension_ids.get(extension)
+        return DateStoreView(self, low, high if extension_code is not None else low, extension_code)
+
+    def query(self, start_date=None, end_date=None, file_type: str = None) -> List[str]:
+        """Returns the list of files taken between start_date and end_date (inclusive), like DateRangeIndex.query."""
+        return list(self.select(start_date, end_date, file_type))
+
+
+class DateStoreView:
+    """
+    Lightweight view of a date range (and optional extension) of a DateStore. Paths are built from the
+    columns while iterating, so a view costs the same no matter how many files it covers.
+    """
+
+    def __init__(self, store: DateStore, low: int, high: int, extension_code: int = None):
+        self._store = store
+        self._low = low
+        self._high = high
+        self._extension_code = extension_code
+
+    # Helper method to iterate over the rows of the view (in date order)
+    def _rows(self) -> Iterator[int]:
+        order = self._store._order
+        extensions = self._store._extension_column
+        for position in range(self._low, self._high):
+            row = order[position]
+            if self._extension_code is None or extensions[row] == self._extension_code:
+                yield row
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._store.path(row) for row in self._rows())
+
+    def __len__(self) -> int:
+        if self._extension_code is None:
+            return self._high - self._low
+        return sum(1 for _ in self._rows())
+
+    def __bool__(self) -> bool:
+        return any(True for _ in self._rows())
+
+    def dates(self) -> List[date]:
+        """Returns every date in the view that has files, in ascending order."""
+        # Without an extension filter the sorted ordinals are walked one date at a time (a bisect per date, not a step per file)
+        if self._extension_code is None:
+            sorted_ordinals = self._store._sorted_ordinals
+            seen = []
+            position = self._low
+            while position < self._high:
+                seen.append(sorted_ordinals[position])
+                position = bisect_right(sorted_ordinals, sorted_ordinals[position], position, self._high)
+            return [date.fromordinal(ordinal) for ordinal in seen]
+
+        ordinals = self._store._ordinals
+        seen = []
+        for row in self._rows():
+            if not seen or seen[-1] != ordinals[row]:
+                seen.append(ordinals[row])
+        return [date.fromordinal(ordinal) for ordinal in seen]
+
+    def counts(self) -> Dict[date, int]:
+        """Returns the number of files per date in the view."""
+        ordinals = self._store._ordinals
+        counts = {}
+        for row in self._rows():
+            counts[ordinals[row]] = counts.get(ordinals[row], 0) + 1
+        return {date.fromordinal(ordinal): count for ordinal, count in counts.items()}
@@ -0,0 +1,218 @@
+import os, struct
+from datetime import date
+
+# Header-only EXIF reader used on the hot path instead of building a full Pillow Image.
+# Only the few KB holding the TIFF/IFD structure are read: IFD0 -> ExifIFD pointer -> DateTimeOriginal.
+
+# EXIF tags we care about
+EXIF_IFD_POINTER = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+
+# File extensions the header-only reader understands
+FAST_PATH_EXTENSIONS = {'jpg', 'jpeg', 'tif', 'tiff'}
+RAW_EXTENSIONS = {'cr2', 'nef', 'arw', 'orf', 'rw2', 'raf'}
+
+# TIFF magic numbers accepted after the byte order mark
+_TIFF_MAGICS = {42}
+
+# RAW containers that are TIFF with a vendor specific magic number (ORF: 'RO'/'RS', RW2: 0x55)
+_RAW_TIFF_MAGICS = {42, 0x4F52, 0x5352, 0x55}
+
+# Fujifilm RAF header: 16 byte magic, then a big endian (offset, length) pair for the embedded JPEG at byte 84
+_RAF_MAGIC = b'FUJIFILMCCD-RAW '
+_RAF_JPEG_POINTER = 84
+
+# Upper bounds so a corrupt file can't make us walk the whole thing
+_MAX_MARKER_SCAN = 256 * 1024
+_MAX_IFD_ENTRIES = 1024
+
+_TYPE_ASCII = 2
+_TYPE_LONG = 4
+_TYPE_IFD = 13
+
+
+class ExifParseError(ValueError):
+    """Raised when a file's header can't be parsed (the caller should fall back to Pillow/exiftool)."""
+
+
+# Helper method to convert an EXIF date string ('YYYY:MM:DD HH:MM:SS') into a date (None if it is blank or invalid)
+def parse_exif_date(value) -> date:
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'ignore')
+    value = value.strip('\x00 ')
+    if len(value) < 10:
+        return None
+    try:
+        return date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+    except ValueError:
+        return None
+
+
+# Helper method to find a single tag in an IFD (returns (type, count, raw 4 byte value) or None)
+def _find_tag(f, base: int, endian: str, ifd_offset: int, tag: int):
+    f.seek(base + ifd_offset)
+    raw_count = f.read(2)
+    if len(raw_count) < 2:
+        raise ExifParseError(f"IFD at offset {ifd_offset} is out of range")
+
+    (count,) = struct.unpack(endian + 'H', raw_count)
+    if count > _MAX_IFD_ENTRIES:
+        raise ExifParseError(f"IFD at offset {ifd_offset} has an implausible entry count ({count})")
+
+    entries = f.read(count * 12)
+    if len(entries) < count * 12:
+        raise ExifParseError(f"IFD at offset {ifd_offset} is truncated")
+
+    entry_format = endian + 'HHI4s'
+    for position in range(0, count * 12, 12):
+        entry_tag, entry_type, entry_count, value = struct.unpack_from(entry_format, entries, position)
+        if entry_tag == tag:
+            return entry_type, entry_count, value
+        # Entries are sorted by tag, so we can stop as soon as we are past the one we want
+        if entry_tag > tag:
+            break
+    return None
+
+
+# Helper method to read DateTimeOriginal from a TIFF structure starting at base (the byte order mark)
+def read_tiff_date(f, base: int = 0, magics=_TIFF_MAGICS) -> date:
+    f.seek(base)
+    header = f.read(8)
+    if len(header) < 8:
+        raise ExifParseError("TIFF header is truncated")
+
+    if header[:2] == b'II':
+        endian = '<'
+    elif header[:2] == b'MM':
+        endian = '>'
+    else:
+        raise ExifParseError("Missing TIFF byte order mark")
+
+    magic, ifd0_offset = struct.unpack(endian + 'HI', header[2:8])
+    if magic not in magics:
+        raise ExifParseError(f"Unexpected TIFF magic number {magic:#x}")
+
+    # IFD0 -> ExifIFD pointer
+    pointer = _find_tag(f, base, endian, ifd0_offset, EXIF_IFD_POINTER)
+    if pointer is None:
+        return None
+    if pointer[0] not in (_TYPE_LONG, _TYPE_IFD):
+        raise ExifParseError("ExifIFD pointer has an unexpected type")
+    (exif_offset,) = struct.unpack(endian + 'I', pointer[2])
+
+    # ExifIFD -> DateTimeOriginal
+    entry = _find_tag(f, base, endian, exif_offset, DATE_TIME_ORIGINAL)
+    if entry is None:
+        return None
+    entry_type, count, value = entry
+    if entry_type != _TYPE_ASCII:
+        raise ExifParseError("DateTimeOriginal has an unexpected type")
+
+    # Values that don't fit in 4 bytes are stored at an offset from the TIFF header
+    if count > 4:
+        (value_offset,) = struct.unpack(endian + 'I', value)
+        f.seek(base + value_offset)
+        value = f.read(count)
+    return parse_exif_date(value[:count])
+
+
+# Helper method to locate the TIFF header inside the APP1 Exif segment of a JPEG (returns its file offset)
+def find_jpeg_exif(f, start: int = 0) -> int:
+    f.seek(start)
+    if f.read(2) != b'\xff\xd8':
+        raise ExifParseError("Missing JPEG SOI marker")
+
+    position = start + 2
+    while position - start < _MAX_MARKER_SCAN:
+        f.seek(position)
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            raise ExifParseError("Malformed JPEG marker")
+
+        # Skip fill bytes between markers
+        if marker[1] == 0xFF:
+            position += 1
+            continue
+
+        # Start of scan / end of image means there is no Exif segment
+        if marker[1] in (0xDA, 0xD9):
+            return None
+
+        (length,) = struct.unpack('>H', marker[2:4])
+        if marker[1] == 0xE1 and f.read(6) == b'Exif\x00\x00':
+            return position + 10
+        position += 2 + length
+
+    raise ExifParseError("No Exif segment found in the JPEG header")
+
+
+# Helper method to read the date taken of a JPEG/TIFF file from its header only
+def read_date_taken(file_path: str) -> date:
+    """
+    Reads DateTimeOriginal from a JPEG or TIFF file without decoding the image.
+
+    Returns the date taken, or None if the file has no DateTimeOriginal tag.
+    Raises ExifParseError if the header can't be parsed so the caller can fall back to Pillow.
+    """
+    with open(file_path, 'rb') as f:
+        signature = f.read(2)
+        if signature == b'\xff\xd8':
+            tiff_offset = find_jpeg_exif(f)
+            if tiff_offset is None:
+                return None
+            return read_tiff_date(f, tiff_offset)
+        if signature in (b'II', b'MM'):
+            return read_tiff_date(f)
+    raise ExifParseError(f"Unsupported file signature {signature!r}")
+
+
+# Helper method to read the date taken of a RAW file from its header only
+def read_raw_date_taken(file_path: str) -> date:
+    """
+    Reads DateTimeOriginal from a CR2/NEF/ARW/ORF/RW2 (TIFF based) or RAF file without exiftool.
+
+    Returns the date taken, or None if the file has no DateTimeOriginal tag.
+    Raises ExifParseError if the header can't be parsed so the caller can fall back to exiftool.
+    """
+    with open(file_path, 'rb') as f:
+        signature = f.read(16)
+        if signature[:2] in (b'II', b'MM'):
+            return read_tiff_date(f, 0, _RAW_TIFF_MAGICS)
+
+        if signature == _RAF_MAGIC:
+            f.seek(_RAF_JPEG_POINTER)
+            pointer = f.read(8)
+            if len(pointer) < 8:
+                raise ExifParseError("RAF header is truncated")
+            jpeg_offset, _ = struct.unpack('>II', pointer)
+            tiff_offset = find_jpeg_exif(f, jpeg_offset)
+            if tiff_offset is None:
+                return None
+            return read_tiff_date(f, tiff_offset)
+    raise ExifParseError(f"Unsupported RAW signature {signature[:4]!r}")
+
+
+# Compare the header-only reader against Pillow for every JPEG/TIFF in a directory
+if __name__ == "__main__":
+    import sys, time, tracemalloc
+    from helpers import _get_date_taken_with_pillow
+
+    directory_path = sys.argv[1] if len(sys.argv) > 1 else "E:/DCIM/100_FUJI"
+    files = [
+        entry.path for entry in os.scandir(directory_path)
+        if entry.is_file() and entry.name.split('.')[-1].lower() in FAST_PATH_EXTENSIONS
+    ]
+
+    for label, reader in [("header-only", read_date_taken), ("pillow", _get_date_taken_with_pillow)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        for file_path in files:
+            try:
+                reader(file_path)
+            except Exception as e:
+                print(f"{label}: {file_path}: {e}")
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        per_file = elapsed / len(files) * 1e6 if files else 0
+        print(f"{label}: {len(files)} files in {elapsed:.3f}s ({per_file:.1f} us/file, peak {peak / 1024:.1f} KiB)")
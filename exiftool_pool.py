@@ -0,0 +1,133 @@
+import os, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, Iterator, List
+
+# Path to the exiftool executable (override with the EXIFTOOL_PATH environment variable, e.g. to point at a local stub on Linux)
+EXIFTOOL_PATH = os.environ.get('EXIFTOOL_PATH', os.path.join(os.path.dirname(__file__), 'bin', 'exiftool.exe'))
+
+# Defaults for the pool size and the number of paths sent to exiftool per call
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_CHUNK_SIZE = 64
+
+
+class ExifToolPool:
+    """
+    Pool of long-lived exiftool processes that work through chunks of paths in parallel.
+
+    Every worker thread owns its own -stay_open exiftool process, so N chunks are processed at once.
+    Results are streamed back as each chunk finishes and at most 2 * workers chunks are in flight,
+    so memory stays bounded no matter how many files are passed in. If exiftool fails on a chunk,
+    the chunk is retried file by file so a single bad file only loses itself.
+
+    Parameters:
+        executable (str): Path to the exiftool executable (or a compatible stand-in).
+        workers (int): Number of exiftool processes.
+        chunk_size (int): Number of paths sent to exiftool per call.
+        params (List[str]): Extra parameters passed to every get_metadata call (e.g. tag filters).
+    """
+
+    def __init__(self, executable: str = None, workers: int = DEFAULT_WORKERS, chunk_size: int = DEFAULT_CHUNK_SIZE, params: List[str] = None):
+        self.executable = executable or EXIFTOOL_PATH
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.params = params
+
+        # Files exiftool failed on even when retried on their own
+        self.failed = []
+
+        self._local = threading.local()
+        self._helpers = []
+        self._lock = threading.Lock()
+        # Chunks submitted by every iter_metadata call that haven't finished yet (close() waits for them)
+        self._in_flight = set()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='exiftool')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Helper method to get (or start) the exiftool process owned by the current worker thread
+    def _helper(self):
+        # pyexiftool is only imported once a batch actually needs exiftool
+        from exiftool import ExifToolHelper
+
+        helper = getattr(self._local, 'helper', None)
+        if helper is None or not helper.running:
+            helper = ExifToolHelper(executable=self.executable)
+            self._local.helper = helper
+            with self._lock:
+                self._helpers.append(helper)
+        return helper
+
+    # Helper method to run exiftool on a chunk, falling back to one file at a time if the chunk fails
+    def _run_chunk(self, chunk: List[str]) -> List[dict]:
+        try:
+            return self._helper().get_metadata(chunk, params=self.params)
+        except Exception as e:
+            if len(chunk) == 1:
+                print(f"Error retrieving metadata for {chunk[0]}: {e}")
+                with self._lock:
+                    self.failed.append(chunk[0])
+                return []
+
+        results = []
+        for file_path in chunk:
+            results.extend(self._run_chunk([file_path]))
+        return results
+
+    # Helper method to submit a chunk, tracked pool-wide until it finishes
+    def _submit(self, chunk: List[str]):
+        future = self._executor.submit(self._run_chunk, chunk)
+        with self._lock:
+            self._in_flight.add(future)
+        future.add_done_callback(self._finished)
+        return future
+
+    # Helper method to stop tracking a finished chunk (runs as the future's done callback)
+    def _finished(self, future) -> None:
+        with self._lock:
+            self._in_flight.discard(future)
+
+    def iter_metadata(self, files: Iterable[str]) -> Iterator[dict]:
+        """
+        Yields the exiftool metadata dict of every file, chunk by chunk as the chunks complete.
+        The order of the results is not guaranteed to match the order of the files.
+        Several calls can share the pool, every call only waits for (and yields) its own chunks.
+        """
+        pending = set()
+        chunk = []
+
+        def drain(block_until: int):
+            while len(pending) > block_until:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending.difference_update(done)
+                for future in done:
+                    yield from future.result()
+
+        for file_path in files:
+            chunk.append(file_path)
+            if len(chunk) == self.chunk_size:
+                pending.add(self._submit(chunk))
+                chunk = []
+                # Keep at most two chunks per worker in flight
+                yield from drain(self.workers * 2 - 1)
+
+        if chunk:
+            pending.add(self._submit(chunk))
+        yield from drain(0)
+
+    def close(self) -> None:
+        """Terminates every exiftool process and stops the worker threads."""
+        # Let chunks that are still running finish first (a generator may have been abandoned early)
+        with self._lock:
+            in_flight = list(self._in_flight)
+        wait(in_flight)
+
+        # exiftool processes are tied to the thread that started them, so they are terminated before the threads exit
+        for helper in self._helpers:
+            if helper.running:
+                helper.terminate()
+        self._helpers.clear()
+        self._executor.shutdown(wait=True)
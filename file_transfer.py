@@ -1,40 +1,72 @@
 import os
-import shutil
+import time
+import threading
+from contextlib import ExitStack
 from datetime import datetime as dt
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List
+from date_range_index import DateRangeIndex
+from date_store import DateStore
+from copy_backends import BACKEND_FANOUT, copy_fanout, copy_file_fast, summarize_backends
+from concurrency import AUTO_WORKERS, run_adaptive
+from io_scheduler import DROP_CACHE_BYTES, order_reads, run_scheduled
+from journal import RESUME_THRESHOLD, TransferJournal, copy_resumable_fanout, get_temp_path
+from manifest import Manifest, files_match, new_hasher
+from sync_planner import IDENTICAL, MISSING, DestinationListing, plan_sync
+from progress import COPIED, FAILED, FINISHED, SKIPPED, ConsoleRenderer, TransferEvent, TransferProgress
 
-def copy_files(date_file_map: dict[dt.date, List[str]], source_folder, destination_folder, max_workers=4, file_type=None, start_date=None, end_date=None):
+# Missing or unreadable source files are counted as failed and skipped, anything else stops the transfer
+SKIPPED_ERRORS = (FileNotFoundError, PermissionError)
+
+def copy_files(date_file_map: dict[dt.date, List[str]] | DateRangeIndex | DateStore, source_folder, destination_folder: str | List[str], max_workers=4, file_type=None, start_date=None, end_date=None, checksums=True, verify=False, progress: TransferProgress = None, cancel: threading.Event = None, dry_run=False):
     """
     Copies files from source_folder to destination_folder with optional filters.
 
     Parameters:
-        date_file_map (dict[dt.date, List[str]]): Map of dates to file paths.
+        date_file_map (dict[dt.date, List[str]] | DateRangeIndex | DateStore): Map of dates to file paths, or an index/store already built from one.
         source_folder (str): Path to the source directory.
-        destination_folder (str): Path to the destination directory.
-        max_workers (int): Number of threads for concurrent copying.
+        destination_folder (str | List[str]): Path to the destination directory, or a list of them (every file is
+            read once and written to all of them, each destination keeps its own journal, manifest and plan).
+        max_workers (int | str): Number of threads for concurrent copying, or 'auto' to adapt it while copying.
         file_type (str): File extension filter (e.g., ".txt").
-        start_date (datetime): Filter for files modified after or on this date.
-        end_date (datetime): Filter for files modified before or on this date.
+        start_date (datetime): Filter for files taken on or after this date (None = no lower bound).
+        end_date (datetime): Filter for files taken on or before this date (None = no upper bound).
+        checksums (bool): Hash every file and record it in the destination's manifest. On by default, since verify and the
+            identical file check rely on the manifest: reflink/copy_file_range copies stay kernel side and are followed by one
+            read of the source for the hash, other copies hash the data as it passes through user space (see copy_file_fast).
+        verify (bool): Re-read every file in the manifest after copying and report corrupted copies.
+        progress (TransferProgress): Receives the plan and an event per file (defaults to a rate limited console renderer).
+        cancel (threading.Event): Once set, no new copies are started; the copies in flight finish and the journal
+            keeps the rest for the next run.
+        dry_run (bool): Only print the plan (new, identical, conflicting and missing files) without copying anything.
+
+    Returns the number of files in the selection (with dry_run, the number of files that would be copied).
     """
-    os.makedirs(destination_folder, exist_ok=True)
+    # Use the sorted date index to find the files in the date range (and of the right type) without scanning every date
+    # (a DateStore hands out a view, so only the selected paths are built)
+    if isinstance(date_file_map, DateStore):
+        selection = date_file_map.select(start_date, end_date, file_type)
+    else:
+        date_index = date_file_map if isinstance(date_file_map, DateRangeIndex) else DateRangeIndex(date_file_map)
+        selection = date_index.query(start_date, end_date, file_type)
+    transfer_files = [_source_path(file_name, source_folder) for file_name in selection]
 
-    transfer_files = []
+    destination_folders = [destination_folder] if isinstance(destination_folder, str) else list(destination_folder)
 
-    # Get a set of the dates that are in the date_file_map
-    date_set = set(date_file_map.keys())
+    # A dry run only lists the destination and reads its journal and manifest, it doesn't create the folder or write anything
+    if dry_run:
+        to_copy = 0
+        for folder in destination_folders:
+            with TransferJournal(folder, read_only=True) as journal, Manifest(folder, read_only=True) as manifest:
+                plan = plan_sync(transfer_files, folder, manifest if checksums else None, journal=journal)
+            if len(destination_folders) > 1:
+                print(f"Destination {folder}:")
+            plan.print_report()
+            to_copy += len(plan.to_copy)
+        return to_copy
 
-    # Iterate through the set of dates to identify which files to copy
-    for date in date_set:
-        if date >= start_date.date() and date <= end_date.date():
-            # Get the list of files for this date
-            files = date_file_map[date]
-            for file in files:
-                # Check if the file type matches and the file is not already in the transfer list
-                if file_type is None or file.lower().endswith(file_type) and file not in transfer_files:
-                    transfer_files.append(file)
-                    print(f"Adding {file} to the transfer list")
+    if progress is None:
+        progress = TransferProgress([ConsoleRenderer()])
 
     # Filter files based on the file type and date range (Using the date_file_map)
     # transfer_files_old_method = [
@@ -44,48 +76,391 @@ def copy_files(date_file_map: dict[dt.date, List[str]], source_folder, destinati
     #     (end_date is None or datetime.fromtimestamp(os.path.getmtime(os.path.join(source_folder, f))) <= end_date)
     # ]
 
-    # Multithreaded file copying
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(copy_file, file_name, source_folder, destination_folder)
-            for file_name in transfer_files
-        ]
-        for future in as_completed(futures):
-            future.result()
-    
+    # Every destination keeps its own journal (so an interrupted run can pick up where it stopped), manifest and listing,
+    # several destinations are filled from a single read of every file
+    with ExitStack() as stack:
+        destinations = DestinationSet(destination_folders, stack, progress, checksums)
+
+        # List the destinations once and decide for every file up front (no per-file existence checks on the destinations)
+        # The stat result of every source file is kept for the copy, so each file is stat'd once
+        source_stats = {}
+        targets = destinations.plan(transfer_files, source_stats)
+
+        # Offloads larger than this don't keep the copied files in the page cache (it would push out everything else)
+        sizes = {source_path: source_stats[source_path].st_size if source_path in source_stats else 0 for source_path in targets}
+        drop_cache = sum(sizes.values()) >= DROP_CACHE_BYTES
+
+        # Files that haven't started when the run is cancelled are left for the next run
+        def copy_unless_cancelled(source_path):
+            if cancel is not None and cancel.is_set():
+                return None
+            return destinations.copy(source_path, targets[source_path], source_folder, source_stats.get(source_path), drop_cache)
+
+        # Multithreaded file copying, the files of each device in the order the device reads them fastest
+        # ('auto' lets the adaptive controller pick the number of in-flight copies, otherwise every device gets its own limit)
+        if max_workers == AUTO_WORKERS:
+            ordered = [file_path for queue in order_reads(list(targets), source_stats).values() for file_path, _ in queue]
+            backends = run_adaptive(copy_unless_cancelled, ordered, cancel=cancel, sizes=sizes)
+        else:
+            backends = run_scheduled(copy_unless_cancelled, list(targets), destination_folders, max_workers, cancel, source_stats)
+
+        destinations.compact()
+        progress.emit(TransferEvent(FINISHED))
+        print(f"Copy backends used: {summarize_backends(backends)}")
+
+        # Optional verify pass over the destinations (not for a cancelled run)
+        if verify and not (cancel is not None and cancel.is_set()):
+            destinations.verify()
+
     return len(transfer_files)
 
 
 # Helper function to copy a single file
-def copy_file(file_name, source_folder, destination_folder):
+def copy_file(file_name, source_folder, destination_folder, journal: TransferJournal = None, manifest: Manifest = None, progress: TransferProgress = None, destination_name: str = None,
+              drop_cache: bool = False, source_stat: os.stat_result = None):
     """
     Copies a single file from source_folder to destination_folder.
 
+    The file is written to a temporary name and renamed into place once it is complete, so an
+    interrupted copy never leaves a truncated file under the final name.
+
     Parameters:
-        file_name (str): Name of the file to copy.
+        file_name (str): Name of the file to copy (or its full path if it is in a sub directory of source_folder).
         source_folder (str): Path to the source directory.
         destination_folder (str): Path to the destination directory.
+        journal (TransferJournal): Journal of the destination folder (skips completed files, resumes large ones).
+        manifest (Manifest): Checksum manifest of the destination folder (hashes the file while it is copied).
+        progress (TransferProgress): Receives a copied, skipped or failed event for the file.
+        destination_name (str): Name picked by the sync planner (the destination isn't checked again), or None to check
+            whether the file exists in the destination and pick a free name on a conflict here.
+        drop_cache (bool): Drop the file from the page cache once it is copied (for offloads larger than memory).
+        source_stat (os.stat_result): Stat result of the source file fetched by the planner (None = stat it here).
+
+    Returns the name of the copy backend that was used (None if the file was skipped).
     """
+    source_path = _source_path(file_name, source_folder)
+    started = time.perf_counter()
+    stat_result = source_stat or _get_stat(source_path)
+    size = stat_result.st_size if stat_result is not None else 0
+
     # Get the basename of the file
-    file_name = os.path.basename(file_name)
+    file_name = destination_name or os.path.basename(file_name)
 
-    # Set the destination path
+    # Files the journal saw complete on an earlier run (and that haven't changed since) are skipped without touching the destination
+    if journal is not None and journal.is_done(source_path, stat_result):
+        _emit(progress, TransferEvent(SKIPPED, file_name, size))
+        return
+
+    # Set the destination path (reserved, so two source files with the same name in one run can't overwrite each other)
     destination_path = os.path.join(destination_folder, file_name)
+    reserved = _reserve(destination_path)
 
-    # Check if the file already exists in the destination folder
-    if os.path.exists(destination_path):
-        print(f"File {file_name} already exists in {destination_folder}. Skipping copy.")
-        return
+    # Check if the file already exists in the destination folder (size and mtime first, the content only on a tie)
+    # A name from the planner was already checked against the destination listing
+    if not reserved or (destination_name is None and os.path.exists(destination_path)):
+        if reserved:
+            try:
+                identical = files_match(source_path, destination_path, manifest)
+            except OSError:
+                identical = False
+            _release(destination_path)
+            if identical:
+                _emit(progress, TransferEvent(SKIPPED, file_name, size))
+                return
+
+        # A different file with the same name (e.g. camera counters like DSCF0001 wrapping) gets a new name
+        destination_path = _reserve_unique(destination_folder, file_name)
+        file_name = os.path.basename(destination_path)
     
-    # Copy the file
+    # Copy the file to a temporary name (with the fastest backend available for this pair of filesystems, metadata is kept like copy2)
+    # When a manifest is kept, the checksum is computed while the data is copied
+    temp_path = get_temp_path(destination_path)
+    hasher = new_hasher() if manifest is not None else None
+    # Large files are copied in journaled chunks, their temp file is kept when something fails so the next run resumes it
+    resumable = journal is not None and size >= RESUME_THRESHOLD
     try:
-        shutil.copy2(os.path.join(source_folder, file_name), destination_path)
-        print(f"Copied {file_name} to {destination_folder}")
-    except FileNotFoundError:
-        print(f"File {file_name} not found in {source_folder}. Skipping copy.")
-        return
-    except PermissionError:
-        print(f"Permission denied for {file_name}. Skipping copy.")
-        return
+        if resumable:
+            backend = journal.copy_resumable(source_path, temp_path, hasher, drop_cache, stat_result)
+        else:
+            backend = copy_file_fast(source_path, temp_path, hasher=hasher, drop_cache=drop_cache)
+
+        _finish_copy(source_path, stat_result, temp_path, destination_path, journal, manifest, hasher)
+        _emit(progress, TransferEvent(COPIED, file_name, size, time.perf_counter() - started, backend))
+        return backend
+    except Exception as e:
+        if not resumable:
+            _remove_quietly(temp_path)
+        _emit(progress, TransferEvent(FAILED, file_name, error=type(e).__name__))
+        if isinstance(e, SKIPPED_ERRORS):
+            return
+        raise
+    finally:
+        _release(destination_path)
+
+
+def copy_file_to_destinations(source_path: str, targets: List[tuple], progress: TransferProgress = None, checksums: bool = True, drop_cache: bool = False,
+                              source_stat: os.stat_result = None):
+    """
+    Copies a single file to several destinations, reading it only once (see copy_fanout).
+
+    Every destination is written to a temporary name and renamed into place once it is complete, and
+    reports its own copied or failed event: a destination that fails (full, unplugged, read-only) doesn't
+    stop the others. A source that can't be read fails the file for every destination. Files at or above
+    RESUME_THRESHOLD are written in fsync'd, journaled chunks (see copy_resumable_fanout), so every destination
+    of an interrupted copy resumes from its own last chunk.
+
+    Parameters:
+        source_path (str): Full path of the file to copy.
+        targets (List[tuple]): (destination folder, destination name, journal, manifest) of every destination
+            (journal and manifest may be None).
+        progress (TransferProgress): Receives a copied or failed event per destination.
+        checksums (bool): Hash the file while it is read (the digest is recorded in the manifest of every destination).
+        drop_cache (bool): Drop the file from the page cache once it is copied (for offloads larger than memory).
+        source_stat (os.stat_result): Stat result of the source file fetched by the planner (None = stat it here).
+
+    Returns the name of the copy backend that was used (None if the file couldn't be read).
+    """
+    started = time.perf_counter()
+    stat_result = source_stat or _get_stat(source_path)
+    size = stat_result.st_size if stat_result is not None else 0
+    temp_paths = [get_temp_path(os.path.join(folder, name)) for folder, name, _, _ in targets]
+    hasher = new_hasher() if checksums else None
+    # Large files are written in journaled chunks (still one read for every destination), so an interrupted copy resumes
+    # and their temp files are kept when something fails
+    resumable = size >= RESUME_THRESHOLD and all(journal is not None for _, _, journal, _ in targets)
+
+    try:
+        if resumable:
+            backend, errors = copy_resumable_fanout(
+                source_path, [(journal, temp_path) for (_, _, journal, _), temp_path in zip(targets, temp_paths)], hasher, drop_cache, stat_result
+            )
+        else:
+            errors = copy_fanout(source_path, temp_paths, hasher, drop_cache)
+            backend = BACKEND_FANOUT + ('+hash' if hasher is not None else '')
+    except Exception as e:
+        for (folder, name, _, _), temp_path in zip(targets, temp_paths):
+            if not resumable:
+                _remove_quietly(temp_path)
+            _emit(progress, TransferEvent(FAILED, name, error=type(e).__name__, destination=folder))
+        if isinstance(e, SKIPPED_ERRORS):
+            return None
+        raise
+
+    latency = time.perf_counter() - started
+    for (folder, name, journal, manifest), temp_path, error in zip(targets, temp_paths, errors):
+        if error is None:
+            try:
+                _finish_copy(source_path, stat_result, temp_path, os.path.join(folder, name), journal, manifest, hasher)
+            except OSError as e:
+                error = e
+        if error is not None:
+            if not resumable:
+                _remove_quietly(temp_path)
+            _emit(progress, TransferEvent(FAILED, name, error=type(error).__name__, destination=folder))
+            continue
+        _emit(progress, TransferEvent(COPIED, name, size, latency, backend, destination=folder))
+    return backend
+
+
+# Helper method to move a finished temp file into place and record it in the destination's manifest and journal
+# The data is on disk before the rename and the rename before the journal says the copy is done, so a power loss
+# leaves either the complete file or a temp file the next run replaces (never a truncated file under the final name)
+def _finish_copy(source_path: str, stat_result: os.stat_result, temp_path: str, destination_path: str, journal: TransferJournal, manifest: Manifest, hasher) -> None:
+    _fsync_path(temp_path)
+    os.replace(temp_path, destination_path)
+    _fsync_path(os.path.dirname(destination_path) or '.')
+    name = os.path.basename(destination_path)
+    if manifest is not None:
+        manifest.record(name, hasher.hexdigest())
+    if journal is not None:
+        journal.mark_done(source_path, name, stat_result)
+
+
+class DestinationSet:
+    """
+    The destinations of a transfer: every destination gets its own journal and manifest (opened on the given
+    ExitStack) and is listed once, and every file is checked against the listings to find the destinations
+    that still need it. Files are planned up front (plan) or one at a time as they stream in (route).
+    Events only name their destination when there are several.
+
+    Parameters:
+        destination_folders (List[str]): Folders the files are copied to (created if needed).
+        stack (ExitStack): Closes the journals and manifests.
+        progress (TransferProgress): Receives the plan and an event per file and destination.
+        checksums (bool): Hash every file while it is copied and record it in the destinations' manifests.
+    """
+
+    def __init__(self, destination_folders: List[str], stack: ExitStack, progress: TransferProgress, checksums: bool = True):
+        self.progress = progress
+        self.checksums = checksums
+        # (folder, journal, manifest, listing) of every destination
+        self.destinations = []
+        for folder in destination_folders:
+            os.makedirs(folder, exist_ok=True)
+            journal = stack.enter_context(TransferJournal(folder))
+            manifest = stack.enter_context(Manifest(folder))
+            self.destinations.append((folder, journal, manifest, DestinationListing(folder)))
+        self.multiple = len(self.destinations) > 1
+
+    # Helper method to classify a file against every destination (returns (destination, category, name, size) per destination)
+    def _classify(self, file_path: str, stat_result: os.stat_result) -> list:
+        classified = []
+        for destination in self.destinations:
+            _, journal, manifest, listing = destination
+            category, name, size = listing.classify(file_path, stat_result, manifest if self.checksums else None, journal)
+            classified.append((destination, category, name, size))
+        return classified
+
+    # Helper method to report the destinations a file is skipped or missing for and return the (folder, name, journal, manifest) of the others
+    def _targets(self, file_path: str, classified: list) -> list:
+        targets = []
+        for (folder, journal, manifest, _), category, name, size in classified:
+            destination = folder if self.multiple else None
+            if category == IDENTICAL:
+                self.progress.emit(TransferEvent(SKIPPED, name, size, destination=destination))
+            elif category == MISSING:
+                self.progress.emit(TransferEvent(FAILED, os.path.basename(file_path), error=FileNotFoundError.__name__, destination=destination))
+            else:
+                targets.append((folder, name, journal, manifest if self.checksums else None))
+        return targets
+
+    def plan(self, source_paths: List[str], source_stats: dict = None) -> dict:
+        """
+        Plans a whole selection up front (one journal write per destination) and returns source path -> the
+        (folder, name, journal, manifest) of the destinations it has to be copied to. Files already in a destination
+        are reported as skipped, missing files as failed. source_stats (path -> os.stat_result) is filled with the
+        stat result of every file, so the copy doesn't stat them again.
+        """
+        source_stats = {} if source_stats is None else source_stats
+        classified = {}
+        for source_path in source_paths:
+            if source_path not in source_stats:
+                try:
+                    source_stats[source_path] = os.stat(source_path)
+                except OSError:
+                    # classify reports it as missing
+                    pass
+            classified[source_path] = self._classify(source_path, source_stats.get(source_path))
+
+        # Every (file, destination) pair counts as one file of the transfer
+        self.progress.plan(len(source_paths) * len(self.destinations), sum(size for results in classified.values() for *_, size in results))
+
+        targets = {}
+        planned = {id(journal): [] for _, journal, _, _ in self.destinations}
+        for source_path, results in classified.items():
+            file_targets = self._targets(source_path, results)
+            if file_targets:
+                targets[source_path] = file_targets
+            for _, _, journal, _ in file_targets:
+                planned[id(journal)].append(source_path)
+        for _, journal, _, _ in self.destinations:
+            journal.plan(planned[id(journal)])
+        return targets
+
+    def route(self, file_path: str, stat_result: os.stat_result = None) -> list:
+        """
+        Plans a single file as it streams in and returns the (folder, name, journal, manifest) of the destinations it
+        has to be copied to (files already in a destination are reported as skipped, missing files as failed).
+        """
+        classified = self._classify(file_path, stat_result)
+        self.progress.plan(len(classified), sum(size for *_, size in classified))
+        targets = self._targets(file_path, classified)
+        for _, _, journal, _ in targets:
+            journal.plan([file_path])
+        return targets
+
+    def copy(self, file_path: str, targets: list, source_folder: str, stat_result: os.stat_result = None, drop_cache: bool = False):
+        """
+        Copies a planned file to its destinations (one read for all of them) and returns the copy backend (None if it wasn't copied).
+        stat_result is the stat result the file was planned with (None = stat it again).
+        """
+        if self.multiple:
+            return copy_file_to_destinations(file_path, targets, self.progress, self.checksums, drop_cache, stat_result)
+        folder, name, journal, file_manifest = targets[0]
+        return copy_file(file_path, source_folder, folder, journal, file_manifest, self.progress, name, drop_cache, stat_result)
+
+    def compact(self) -> None:
+        for _, journal, manifest, _ in self.destinations:
+            journal.compact()
+            manifest.compact()
+
+    def verify(self) -> None:
+        """Re-reads every file in the destinations' manifests and raises if any copy is corrupted."""
+        failures = []
+        for folder, _, manifest, _ in self.destinations:
+            folder_failures = manifest.verify()
+            print(f"Verified {len(manifest.entries)} files" + (f" in {folder}" if self.multiple else '') + f", {len(folder_failures)} failed")
+            failures.extend(os.path.join(folder, name) if self.multiple else name for name in folder_failures)
+        if failures:
+            raise RuntimeError(f"{len(failures)} files failed verification: {', '.join(failures[:10])}")
+
+
+# Helper method to flush a file or a directory (the names in it) to disk
+def _fsync_path(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except (IsADirectoryError, PermissionError):
+        # Directories can't be opened (and don't need to be flushed) on Windows
+        if os.path.isdir(path):
+            return
+        raise
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Helper method to delete a file if it exists (cleanup after a failed copy)
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Helper method to get the path of a source file (files found in sub directories of the source folder come in with their full path)
+def _source_path(file_name: str, source_folder: str) -> str:
+    return file_name if os.path.dirname(file_name) else os.path.join(source_folder, file_name)
+
+
+# Helper method to stat a source file before it is copied (None if it can't be read, the copy reports the error)
+def _get_stat(path: str) -> os.stat_result:
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _emit(progress: TransferProgress, event: TransferEvent) -> None:
+    if progress is not None:
+        progress.emit(event)
+
+
+# Destination paths that are being written in this run
+_reserved_paths = set()
+_reserved_lock = threading.Lock()
+
+
+# Helper method to reserve a destination path (returns False if another copy in this run already has it)
+def _reserve(destination_path: str) -> bool:
+    with _reserved_lock:
+        if destination_path in _reserved_paths:
+            return False
+        _reserved_paths.add(destination_path)
+        return True
+
+
+def _release(destination_path: str) -> None:
+    with _reserved_lock:
+        _reserved_paths.discard(destination_path)
+
 
-    
\ No newline at end of file
+# Helper method to find and reserve a free name for a file whose name is taken ('name_1.ext', 'name_2.ext', ...)
+def _reserve_unique(destination_folder: str, file_name: str) -> str:
+    base_name, ext = os.path.splitext(file_name)
+    counter = 1
+    while True:
+        candidate = os.path.join(destination_folder, f"{base_name}_{counter}{ext}")
+        if not os.path.exists(candidate) and _reserve(candidate):
+            return candidate
+        counter += 1
@@ -1,64 +1,211 @@
-import helpers, os, platform
+import helpers, multiprocessing, os, queue, platform, threading, time
 import tkinter as tk
 import sv_ttk
-from tkinter import Tk, Label, Entry, Button, filedialog, StringVar, messagebox, ttk, Toplevel, PhotoImage, Frame
+from tkinter import Tk, Label, Entry, Button, Checkbutton, filedialog, StringVar, BooleanVar, messagebox, ttk, Toplevel, PhotoImage, Frame
 from tkcalendar import Calendar
-from datetime import datetime
+from datetime import datetime, timedelta
 from file_transfer import copy_files
+from date_index import DateIndex
+from date_store import DateStore
+from thumbnail_cache import ThumbnailCache, pick_previews
+from concurrency import parse_workers
+from progress import FINISHED, TransferProgress, format_eta
 from PIL import Image, ImageTk
-from collections import defaultdict
+from io import BytesIO
 
 
-# Adding a global variable to store the map of the dates to the file paths
-global_date_map = defaultdict(list)
+# Compact store of the capture date of every file of the last scan (shared by the calendar highlighting and the copy)
+global_date_store = DateStore()
+
+# Background scans and copies post their updates here, the Tk loop picks them up with after()
+ui_queue = queue.Queue()
+UI_POLL_MS = 100
+
+# Minimum time between two progress updates posted by a copy
+PROGRESS_INTERVAL = 0.2
+
+# Thumbnails shown under the calendar for the selected date (generated in the background and cached in memory and on disk)
+thumbnail_cache = ThumbnailCache()
+PREVIEW_COUNT = 8
+
+# Scans date the images in worker processes. Processes re-import the main module on Windows/macOS, which is safe from
+# main.py (it only opens the window under __name__ == "__main__") but would open a second window if gui.py is run directly
+EXTRACT_PROCESSES = __name__ != "__main__" or multiprocessing.get_start_method() == 'fork'
+
+# Set by the Cancel button (a new one is created for every background job)
+cancel_event = threading.Event()
+job_running = False
+# Status shown while the running job is being cancelled
+cancel_status = ""
 
 # Function to open a file dialog and set the selected folder in the entry field
-def browse_folder(entry_var, creation_dates=None):
+def browse_folder(entry_var, scan=False):
+    if job_running:
+        messagebox.showerror("Error", "Wait for the running scan/copy to finish (or cancel it) first")
+        return
     folder = filedialog.askdirectory()
     if folder:
         entry_var.set(folder)
-        if creation_dates is not None:
-            # Clear the previous dates
-            creation_dates.clear()
-            global_date_map.clear()
-            # Efficient batch processing
-            file_date_map = helpers.get_creation_dates_for_directory(folder)
-
-            for date, file_path in file_date_map.items():
-                # Update the global map
-                global_date_map[date].extend(file_path)
-
-                # Update the creation_dates dictionary
-                date_str = date.strftime("%Y-%m-%d")
-                if date_str not in creation_dates:
-                    creation_dates[date_str] = [date]
+        if scan:
+            # Scan in the background so the window stays responsive
+            start_job("Scanning...", "Cancelling the scan (the previous dates are kept)...", scan_worker, folder)
+
+
+# Background job scanning the source folder for the capture dates
+def scan_worker(folder, cancel):
+    # Efficient batch processing (unchanged files are loaded from the on-disk date index)
+    # The index is opened in this thread since sqlite connections can't be shared between threads
+    # The scan and the extraction check the cancel event, so a cancelled scan stops early instead of reading the whole folder
+    with DateIndex() as index:
+        file_date_map = helpers.get_creation_dates_for_directory(folder, index, processes=EXTRACT_PROCESSES, cancel=cancel)
+    if cancel.is_set():
+        ui_queue.put(('scan_cancelled', None))
+        return
+    # The path lists are packed into the compact store here, so the Tk thread only swaps it in
+    date_store = DateStore(file_date_map)
+    del file_date_map
+    ui_queue.put(('scanned', date_store))
+
+
+# Method to take over the result of a scan (runs on the Tk thread)
+def apply_scan(date_store):
+    global global_date_store
+    # Replace the dates of the previous scan
+    global_date_store = date_store
+    dates = date_store.dates()
+
+    print("Unique dates found:", len(dates))
+    status_var.set(f"Found {len(date_store)} files on {len(dates)} dates")
+
+
+# Method to run a background job (only one at a time), the job gets the cancel event as its last argument
+# cancelling is the status shown once the Cancel button is pressed
+def start_job(status, cancelling, target, *args):
+    global cancel_event, job_running, cancel_status
+    cancel_event = threading.Event()
+    cancel_status = cancelling
+    job_running = True
+    set_busy(True, status)
+
+    def run():
+        try:
+            target(*args, cancel_event)
+        except Exception as e:
+            ui_queue.put(('error', str(e)))
+        finally:
+            ui_queue.put(('finished', None))
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+# Method to switch the buttons and the progress bar between idle and busy
+def set_busy(busy, status=""):
+    global job_running
+    job_running = busy
+    start_button.config(state="disabled" if busy else "normal")
+    cancel_button.config(state="normal" if busy else "disabled")
+    if busy:
+        progress_bar.config(mode="indeterminate", value=0)
+        progress_bar.start(10)
+        status_var.set(status)
+    else:
+        progress_bar.stop()
+
+
+# Method to cancel the running job (work in flight is finished, nothing new is started)
+def cancel_job():
+    cancel_event.set()
+    cancel_button.config(state="disabled")
+    status_var.set(cancel_status)
+
+
+# Method to apply the updates posted by the background jobs (runs on the Tk thread every UI_POLL_MS)
+def poll_queue():
+    try:
+        while True:
+            kind, payload = ui_queue.get_nowait()
+            if kind == 'scanned':
+                apply_scan(payload)
+            elif kind == 'scan_cancelled':
+                status_var.set(f"Scan cancelled, showing the {len(global_date_store)} files of the previous scan")
+            elif kind == 'progress':
+                show_progress(payload)
+            elif kind == 'copied':
+                set_busy(False)
+                if cancel_event.is_set():
+                    messagebox.showinfo("Cancelled", f"Transfer cancelled after {payload} files, the rest will be copied on the next run")
                 else:
-                    creation_dates[date_str].append(date)
+                    messagebox.showinfo("Success", f"Transferred {payload} files successfully!")
+            elif kind == 'error':
+                set_busy(False)
+                messagebox.showerror("Error", payload)
+            elif kind == 'finished':
+                set_busy(False)
+            elif kind == 'thumbnail':
+                show_thumbnail(*payload)
+    except queue.Empty:
+        pass
+    root.after(UI_POLL_MS, poll_queue)
+
+
+# Method to show a progress snapshot of a copy
+def show_progress(snapshot):
+    done = snapshot['copied_files'] + snapshot['skipped_files'] + snapshot['failed_files']
+    if progress_bar['mode'] != 'determinate':
+        progress_bar.stop()
+        progress_bar.config(mode="determinate")
+    progress_bar.config(maximum=max(1, snapshot['planned_files']), value=done)
+    status_var.set(
+        f"{done}/{snapshot['planned_files']} files, {snapshot['bytes_per_s'] / 1e6:.1f} MB/s, "
+        f"{snapshot['files_per_s']:.1f} files/s, ETA {format_eta(snapshot['eta'])}"
+        + (f", {snapshot['failed_files']} failed" if snapshot['failed_files'] else "")
+    )
+
+
+# Progress listener posting a snapshot to the UI queue at most every PROGRESS_INTERVAL (and always at the end)
+class QueueProgress:
+    def __init__(self):
+        self._last = 0.0
+        self._lock = threading.Lock()
 
-            print("Updated creation_dates:", creation_dates)
-            print("Unique dates found:", len(creation_dates))
+    def __call__(self, event, progress):
+        now = time.perf_counter()
+        with self._lock:
+            if event.kind != FINISHED and now - self._last < PROGRESS_INTERVAL:
+                return
+            self._last = now
+        ui_queue.put(('progress', progress.snapshot()))
 
 
 
-def open_calendar(parent, entry_var, creation_dates=None):
+def open_calendar(parent, entry_var):
     """
     Opens a pop-up calendar and updates the entry field with the selected date upon click.
-    Highlights dates based on the creation_dates dictionary.
+    Highlights the dates that have files in the last scan and shows thumbnails of the selected date's photos.
     """
     def select_date(event):
         selected_date = cal.selection_get()
         entry_var.set(selected_date.strftime("%Y-%m-%d"))
-        top.destroy()
+        show_previews(preview_strip, selected_date)
 
     def highlight_dates():
         """Highlight dates with files created on those dates."""
         cal.tag_config("highlight", background="yellow", foreground="black")
-        for date_str in creation_dates:
-            try:
-                parsed_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-                cal.calevent_create(parsed_date, "Files Exist", "highlight")
-            except ValueError:
-                print(f"Error parsing date: {date_str}")
+        for file_date in global_date_store.dates():
+            cal.calevent_create(file_date, "Files Exist", "highlight")
+
+    def prefetch_month(event=None):
+        """Generate the previews of the displayed month in the background (replaces the prefetch of the previous month)."""
+        # A running copy reads the same card, so it gets the disk to itself
+        if job_running or not global_date_store:
+            return
+        month, year = cal.get_displayed_month()
+        first = datetime(year, month, 1).date()
+        last = (first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        thumbnail_cache.prefetch([
+            path for file_date in global_date_store.select(first, last).dates()
+            for path in pick_previews(global_date_store.select(file_date, file_date), PREVIEW_COUNT)
+        ])
 
     top = tk.Toplevel(parent)
     top.title("Select Date")
@@ -72,14 +219,55 @@ def open_calendar(parent, entry_var, creation_dates=None):
     )
     cal.pack(fill="both", expand=True, padx=10, pady=10)
 
-    if creation_dates:
+    # Thumbnails of the selected date, so it's clear what is on a day before copying it
+    preview_strip = Frame(top)
+    preview_strip.pack(fill="x", padx=10)
+    Button(top, text="OK", command=top.destroy).pack(pady=(5, 10))
+
+    if global_date_store:
         highlight_dates()
+        prefetch_month()
 
     cal.bind("<<CalendarSelected>>", select_date)
+    cal.bind("<<CalendarMonthChanged>>", prefetch_month)
+
 
+# Method to fill the preview strip with the thumbnails of a date (cached ones right away, the others as they are generated)
+def show_previews(preview_strip, selected_date):
+    for widget in preview_strip.winfo_children():
+        widget.destroy()
 
+    view = global_date_store.select(selected_date, selected_date)
+    paths = pick_previews(view, PREVIEW_COUNT)
+    if not paths:
+        Label(preview_strip, text=f"{len(view)} files, no previews" if view else "No files on this date").pack(side="left")
+        return
 
-def create_date_entry(parent, label_text, entry_var, creation_dates):
+    for path in paths:
+        label = Label(preview_strip, text="...", width=12)
+        label.pack(side="left", padx=2)
+        data = thumbnail_cache.get(path)
+        if data is not None:
+            show_thumbnail(label, data)
+        else:
+            # The worker posts the thumbnail to the UI queue (Tk images can only be created on the Tk thread)
+            thumbnail_cache.request(path, lambda _, data, label=label: ui_queue.put(('thumbnail', (label, data))))
+
+
+# Method to show a thumbnail in its label (runs on the Tk thread, the label may be gone if another date was selected)
+def show_thumbnail(label, data):
+    if not label.winfo_exists():
+        return
+    if data is None:
+        label.config(text="no preview")
+        return
+    photo = ImageTk.PhotoImage(Image.open(BytesIO(data)))
+    label.config(image=photo, text="", width=0)
+    # Keep reference to prevent garbage collection
+    label.photo = photo
+
+
+def create_date_entry(parent, label_text, entry_var):
     """
     Creates a labeled entry with a resized calendar icon.
     """
@@ -99,7 +287,7 @@ def create_date_entry(parent, label_text, entry_var, creation_dates):
     calendar_icon = ImageTk.PhotoImage(calendar_icon)
 
     # Button with the resized calendar icon
-    Button(frame, image=calendar_icon, command=lambda: open_calendar(parent, entry_var, creation_dates)).pack(side="left")
+    Button(frame, image=calendar_icon, command=lambda: open_calendar(parent, entry_var)).pack(side="left")
     
     # Keep reference to prevent garbage collection
     frame.calendar_icon = calendar_icon  
@@ -108,7 +296,7 @@ def create_date_entry(parent, label_text, entry_var, creation_dates):
 def start_copy():
     source = source_var.get()
     destination = destination_var.get()
-    workers = int(workers_var.get())
+    workers = parse_workers(workers_var.get())
     file_type = file_type_var.get() if file_type_var.get() else None
     start_date = datetime.strptime(start_date_var.get(), "%Y-%m-%d") if start_date_var.get() else None
     end_date = datetime.strptime(end_date_var.get(), "%Y-%m-%d") if end_date_var.get() else None
@@ -124,20 +312,25 @@ def start_copy():
         return
 
     # Make sure the start date isn't greater than the end date
-    if start_date > end_date:
+    if start_date and end_date and start_date > end_date:
         messagebox.showerror("Error", "Start Date cannot be greater than the End Date")
         return
 
-    try:
-        file_count = copy_files(global_date_map, source, destination, workers, file_type, start_date, end_date)
-        messagebox.showinfo("Success", f"Transferred {file_count} files successfully!")
-    except Exception as e:
-        messagebox.showerror("Error", str(e))
+    # Copy in the background so the window stays responsive (preview generation stops so the copy has the source to itself)
+    thumbnail_cache.cancel_prefetch()
+    start_job("Copying...", "Cancelling (copies in flight are finished first)...", copy_worker, global_date_store, source, destination, workers, file_type, start_date, end_date, verify_var.get())
+
+
+# Background job copying the files (the progress is posted to the UI queue)
+def copy_worker(date_store, source, destination, workers, file_type, start_date, end_date, verify, cancel):
+    progress = TransferProgress([QueueProgress()])
+    copy_files(date_store, source, destination, workers, file_type, start_date, end_date, verify=verify, progress=progress, cancel=cancel)
+    ui_queue.put(('copied', progress.copied_files))
 
 # Tkinter GUI setup
 root = Tk()
 root.title("File Transfer Tool")
-root.geometry("600x300")
+root.geometry("600x400")
 
 style = ttk.Style(root)
 
@@ -156,30 +349,43 @@ workers_var = StringVar(value="4")
 file_type_var = StringVar()
 start_date_var = StringVar()
 end_date_var = StringVar()
-creation_dates = defaultdict(list)
+verify_var = BooleanVar(value=False)
 
 # Layout
 Label(root, text="Source Folder:").grid(row=0, column=0, sticky="w", padx=10, pady=5)
 Entry(root, textvariable=source_var, width=30).grid(row=0, column=1, padx=10, pady=5)
-Button(root, text="Browse", command=lambda: browse_folder(source_var, creation_dates)).grid(row=0, column=2, padx=5)
+Button(root, text="Browse", command=lambda: browse_folder(source_var, scan=True)).grid(row=0, column=2, padx=5)
 
 Label(root, text="Destination Folder:").grid(row=1, column=0, sticky="w", padx=10, pady=5)
 Entry(root, textvariable=destination_var, width=30).grid(row=1, column=1, padx=10, pady=5)
 Button(root, text="Browse", command=lambda: browse_folder(destination_var)).grid(row=1, column=2, padx=5)
 
-Label(root, text="Number of Workers:").grid(row=2, column=0, sticky="w", padx=10, pady=5)
+Label(root, text="Number of Workers (or auto):").grid(row=2, column=0, sticky="w", padx=10, pady=5)
 Entry(root, textvariable=workers_var, width=10).grid(row=2, column=1, sticky="w", padx=10, pady=5)
 
 Label(root, text="File Type (e.g., .txt):").grid(row=3, column=0, sticky="w", padx=10, pady=5)
 Entry(root, textvariable=file_type_var, width=10).grid(row=3, column=1, sticky="w", padx=10, pady=5)
 
 # Create date entries with calendar icons
-create_date_entry(root, "Start Date:", start_date_var, creation_dates)
-create_date_entry(root, "End Date:", end_date_var, creation_dates)
+create_date_entry(root, "Start Date:", start_date_var)
+create_date_entry(root, "End Date:", end_date_var)
+
+# Re-read every copied file and compare it with the checksum taken during the copy
+Checkbutton(root, text="Verify after copy", variable=verify_var).grid(row=6, column=0, sticky="w", padx=10)
 
 # Only show the Start Copy button if the user has selected a source and destination folder
 start_button = Button(root, text="Start Copy", command=start_copy, bg="green", fg="white")
 start_button.grid(row=6, column=1, pady=20)
+cancel_button = Button(root, text="Cancel", command=cancel_job, state="disabled")
+cancel_button.grid(row=6, column=2, pady=20)
+
+# Progress of the running scan/copy
+status_var = StringVar()
+progress_bar = ttk.Progressbar(root, orient="horizontal", length=560, mode="determinate")
+progress_bar.grid(row=7, column=0, columnspan=3, padx=10, pady=5)
+Label(root, textvariable=status_var).grid(row=8, column=0, columnspan=3, sticky="w", padx=10)
+
+root.after(UI_POLL_MS, poll_queue)
 
 if __name__ == "__main__":
     root.mainloop()
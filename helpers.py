@@ -1,85 +1,169 @@
 from collections import defaultdict
 from datetime import datetime as dt
 import json
-from PIL import Image
-from PIL.ExifTags import TAGS
-import os, time, pathlib, platform, time, exiftool
+import os, time, pathlib, platform, time, threading
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List
-from exiftool import ExifToolHelper
+from exiftool_pool import EXIFTOOL_PATH, DEFAULT_WORKERS, ExifToolPool
+from date_index import DateIndex
+from exif_reader import FAST_PATH_EXTENSIONS, ExifParseError, parse_exif_date, read_date_taken, read_raw_date_taken
+from scanner import DEFAULT_IGNORE_PATTERNS, KIND_IMAGE, KIND_PAIRED_RAW, KIND_UNPAIRED_RAW, scan_directory
 
-# Path to the exiftool executable
-EXIFTOOL_PATH = os.path.join(os.path.dirname(__file__), 'bin', 'exiftool.exe')
+# Parallel date extraction of the Pillow supported images: files per batch handed to a worker, number of workers, and the
+# number of files below which everything is dated in the calling thread (a pool costs more than it saves on a few hundred headers)
+EXTRACT_BATCH_SIZE = 256
+DEFAULT_EXTRACT_WORKERS = min(32, os.cpu_count() or 1)
+PARALLEL_EXTRACT_THRESHOLD = 512
 
-# Helper method to sort all files by type in a directory (Pillow supported images, RAW files with a corresponding jpg, RAW files without a corresponding jpg, and others)
-def collect_files_by_type(directory: str):
+# Tags exiftool is asked for to date a RAW file (the first one found wins), and the matching exiftool parameters
+# (an ExifToolPool handed to get_date_taken_raw has to be opened with RAW_DATE_PARAMS)
+RAW_DATE_TAGS = [
+    'EXIF:DateTimeOriginal',
+    'QuickTime:CreationDate',
+    'EXIF:CreateDate',
+    'XMP:CreateDate'
+]
+RAW_DATE_PARAMS = [f'-{tag}' for tag in RAW_DATE_TAGS]
+
+
+# Helper method to check if a (possibly missing) cancel event is set
+def _cancelled(cancel: threading.Event) -> bool:
+    return cancel is not None and cancel.is_set()
+
+# Helper method to sort all files by type in a directory tree (Pillow supported images, RAW files with a corresponding jpg, RAW files without a corresponding jpg, and others)
+# Images and RAW files are keyed by their path without the extension so files with the same name in different sub directories don't collide.
+# If stat_results is given, it is filled with the stat result scandir already fetched for every file (path -> os.stat_result)
+# Once cancel is set the scan stops (the files found so far are returned)
+def collect_files_by_type(directory: str, max_depth: int = None, ignore_patterns: List[str] = DEFAULT_IGNORE_PATTERNS, stat_results: dict = None,
+                          cancel: threading.Event = None):
     pillow_supported_imgs = {}
     raws_with_jpg = {}
     raws_without_jpg = []
     others = []
 
-    # temporary mapping raw file bases to their full paths
-    raw_candidates = {}
-
-    # Start iterating through all of the the files in the directory
-    with os.scandir(directory) as entries:
-        for entry in entries:
-            if entry.is_file():
-                name = entry.name
-                ext = name.split('.')[-1].lower()
-                base_name = os.path.splitext(name)[0]
-
-                # Check if the file is a Pillow supported image
-                if ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff']:
-                    pillow_supported_imgs[base_name] = entry.path
-                elif ext in ['cr2', 'nef', 'arw', 'orf', 'rw2', 'raf']:
-                    raw_candidates[base_name] = entry.path
-                else:
-                    others.append(entry.path)
+    # The scanner walks the sub directories concurrently and pairs RAW files with jpgs within each directory
+    for entry in scan_directory(directory, max_depth, ignore_patterns):
+        if _cancelled(cancel):
+            break
+        if stat_results is not None:
+            stat_results[entry.path] = entry.stat
 
-    # Iterate through the raw candidates to see if they have a jpg file in the same directory
-    for base_name, raw_path in raw_candidates.items():
-        # If the base name is in the pillow supported images, then we can add it to the lookup table
-        if base_name in pillow_supported_imgs:
-            raws_with_jpg[base_name] = raw_path
+        if entry.kind == KIND_IMAGE:
+            pillow_supported_imgs[entry.key] = entry.path
+        elif entry.kind == KIND_PAIRED_RAW:
+            raws_with_jpg[entry.key] = entry.path
+        elif entry.kind == KIND_UNPAIRED_RAW:
+            raws_without_jpg.append(entry.path)
         else:
-            raws_without_jpg.append(raw_path)    
+            others.append(entry.path)
 
     return pillow_supported_imgs, raws_with_jpg, raws_without_jpg, others
 
 
+# Helper method to get the date taken of a single file with Pillow (fallback for files the header-only reader can't parse)
+def _get_date_taken_with_pillow(file_path: str) -> dt.date:
+    # Pillow is only imported once a file needs it, so headless runs over JPEG/TIFF/RAW files never load it
+    from PIL import Image
+    from PIL.ExifTags import TAGS
+
+    # Open the image file using Pillow
+    with Image.open(file_path) as img:
+        # Get the EXIF data
+        exif_data = img._getexif()
+        if exif_data is not None:
+            # Iterate through the EXIF data to find the DateTimeOriginal tag
+            for tag_id, value in exif_data.items():
+                tag = TAGS.get(tag_id, tag_id)
+                if tag == 'DateTimeOriginal':
+                    return dt.strptime(value, '%Y:%m:%d %H:%M:%S').date()
+    return None
+
+
+# Helper method to get the date taken of a single Pillow supported image
+# JPEG/TIFF headers are parsed directly, anything else (or anything odd) goes through Pillow
+def get_image_date_taken(file_path: str) -> dt.date:
+    if file_path.split('.')[-1].lower() in FAST_PATH_EXTENSIONS:
+        try:
+            return read_date_taken(file_path)
+        except ExifParseError:
+            pass
+    return _get_date_taken_with_pillow(file_path)
+
+
+# Helper method to date a batch of Pillow supported images (runs in a worker process or thread)
+# Every file has its own error handling, so an unreadable file only loses itself. Returns the partial map of dates to
+# image keys and the (path, error) of the files that failed
+def _date_image_batch(batch: List[tuple]) -> tuple:
+    partial_map = defaultdict(list)
+    errors = []
+    for key, file_path in batch:
+        try:
+            date_taken = get_image_date_taken(file_path)
+        except Exception as e:
+            errors.append((file_path, str(e)))
+            continue
+        if date_taken is not None:
+            partial_map[date_taken].append(key)
+    return partial_map, errors
+
+
 # Helper method to get the date taken of Pillow supported files and corresponding RAW files (Will return a map of dates to the file paths)
-def get_date_taken_pillow(pillow_supported_imgs: dict, raws_with_jpg: dict) -> dict[dt.date, List[str]]:
+# The images are split into batches that are dated in parallel, by worker processes if processes is set (CPU bound, e.g. many
+# files going through Pillow) or by threads otherwise (the header-only reader mostly waits on I/O). Processes re-import the
+# main module on Windows/macOS, so only entry points guarded by __name__ == "__main__" (main.py, standalone.py) should ask for them
+# If failed is given, it is filled with the paths of the images that couldn't be read
+# Once cancel is set no new batches are started (the map only has the batches dated until then)
+def get_date_taken_pillow(pillow_supported_imgs: dict, raws_with_jpg: dict, workers: int = DEFAULT_EXTRACT_WORKERS, processes: bool = False,
+                          failed: set = None, cancel: threading.Event = None) -> dict[dt.date, List[str]]:
+    # Initialize a map to store the date taken values
+    date_map = defaultdict(list)
+
+    items = list(pillow_supported_imgs.items())
+    batches = [items[i:i + EXTRACT_BATCH_SIZE] for i in range(0, len(items), EXTRACT_BATCH_SIZE)]
+
+    # Small libraries aren't worth the start up of a pool
+    executor = None
+    if len(items) < PARALLEL_EXTRACT_THRESHOLD or workers <= 1:
+        results = map(_date_image_batch, batches)
+    else:
+        if processes:
+            try:
+                executor = ProcessPoolExecutor(max_workers=min(workers, len(batches)))
+            except (OSError, NotImplementedError) as e:
+                print(f"Can't start worker processes ({e}), dating the images with threads")
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=min(workers, len(batches)))
+        results = executor.map(_date_image_batch, batches)
+
+    # Merge the partial maps (in batch order, so the result doesn't depend on which worker finished first)
     try:
-        # Initialize a map to store the date taken values
-        date_map = defaultdict(list)
-
-        for file_name, file_path in pillow_supported_imgs.items():
-            # Open the image file using Pillow
-            with Image.open(file_path) as img:
-                # Get the EXIF data
-                exif_data = img._getexif()
-                if exif_data is not None:
-                    # Iterate through the EXIF data to find the DateTimeOriginal tag
-                    for tag_id, value in exif_data.items():
-                        tag = TAGS.get(tag_id, tag_id)
-                        if tag == 'DateTimeOriginal':
-                            date_taken = dt.strptime(value, '%Y:%m:%d %H:%M:%S').date()
-                            date_map[date_taken].append(file_path)
-
-                            # Check if the base name is in the RAW files with jpgs loookup table
-                            base_name = os.path.splitext(file_name)[0]
-                            corresponding_raw_path = raws_with_jpg[base_name]
-                            if corresponding_raw_path:
-                                date_map[date_taken].append(corresponding_raw_path)
-                            break
-    except Exception as e:
-        print(f"Error retrieving date taken for {file_name}: {e}")
-        return None
+        for partial_map, errors in results:
+            if _cancelled(cancel):
+                break
+            for file_path, error in errors:
+                print(f"Error retrieving date taken for {file_path}: {error}")
+                if failed is not None:
+                    failed.add(file_path)
+            for date_taken, keys in partial_map.items():
+                for key in keys:
+                    date_map[date_taken].append(pillow_supported_imgs[key])
+
+                    # Check if the base name is in the RAW files with jpgs loookup table
+                    corresponding_raw_path = raws_with_jpg.get(key)
+                    if corresponding_raw_path:
+                        date_map[date_taken].append(corresponding_raw_path)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
 
     return date_map
 
 # Helper method to get the date taken of the RAW files that don't have a corresponding jpg (Will return a map of dates to the file paths)
-def get_date_taken_raw(raw_files) -> dict[dt.date, List[str]]:
+# Callers dating files one at a time (the watch) pass a pool that stays open, otherwise a pool is started for this batch
+# Once cancel is set no more files are read (the map only has the files dated until then)
+def get_date_taken_raw(raw_files, executable: str = None, workers: int = DEFAULT_WORKERS, pool: ExifToolPool = None,
+                       cancel: threading.Event = None) -> dict[dt.date, List[str]]:
     # Set for all the datetimes
     date_map = defaultdict(list)
 
@@ -88,34 +172,46 @@ def get_date_taken_raw(raw_files) -> dict[dt.date, List[str]]:
         print("No RAW files found that don't have a corresponding jpg")
         return date_map
 
-    # Set the needed tags for the batch exiftool call
-    tags = [
-        'EXIF:DateTimeOriginal',
-        'QuickTime:CreationDate',
-        'EXIF:CreateDate',
-        'XMP:CreateDate'
-    ]
+    # Read the dates straight from the RAW headers where we can, exiftool only gets the files the native parser can't handle
+    exiftool_files = []
+    for raw_path in raw_files:
+        if _cancelled(cancel):
+            return date_map
+        try:
+            date_taken = read_raw_date_taken(raw_path)
+        except (ExifParseError, OSError):
+            date_taken = None
 
-    params = [f'-{tag}' for tag in tags]
+        if date_taken is None:
+            exiftool_files.append(raw_path)
+        else:
+            date_map[date_taken].append(raw_path)
 
-    # Use the Exiftool in Batch mode to get the creation date for all files
+    if not exiftool_files:
+        return date_map
+
+    # Use a pool of exiftool processes to get the creation date for the remaining files (results stream back per chunk)
     try:
-        with ExifToolHelper(executable=EXIFTOOL_PATH) as et:
-            metadata = et.get_metadata(raw_files, params=params)
-
-        for data in metadata:
-            # Check if the file has EXIF data
-            for tag in ['EXIF:DateTimeOriginal', 'QuickTime:CreationDate', 'EXIF:CreateDate', 'XMP:CreateDate']:
-                if tag in data.keys():
-                    date_taken = data[tag]
-                    # Convert to datetime object and update the date_map
+        with ExitStack() as stack:
+            if pool is None:
+                pool = stack.enter_context(ExifToolPool(executable=executable, workers=workers, params=RAW_DATE_PARAMS))
+            for data in pool.iter_metadata(exiftool_files):
+                if _cancelled(cancel):
+                    break
+                # Check if the file has EXIF data
+                for tag in RAW_DATE_TAGS:
+                    date_taken = data.get(tag)
+                    # Convert to a date object and update the date_map
                     if isinstance(date_taken, str):
-                        date_taken = dt.strptime(date_taken, '%Y:%m:%d %H:%M:%S').date()
-                        date_map[date_taken].append(data['SourceFile'])
+                        date_taken = parse_exif_date(date_taken)
                     elif isinstance(date_taken, dt):
-                        dates_taken = date_taken.date()
-                        date_map[dates_taken].append(data['SourceFile'])
-                    break
+                        date_taken = date_taken.date()
+                    else:
+                        continue
+
+                    if date_taken is not None:
+                        date_map[date_taken].append(data['SourceFile'])
+                        break
 
     except Exception as e:
         print(f"Error retrieving dates for the RAW files: {e}")
@@ -123,18 +219,75 @@ def get_date_taken_raw(raw_files) -> dict[dt.date, List[str]]:
     return date_map
 
 
-# Helper method to get the creation dates for all files in a directory (Will return a set of dates and a map of dates to the file paths)
-def get_creation_dates_for_directory(directory) -> dict[dt.date, List[str]]:
+# Helper method to load files from the date index (returns False if any of the paths is new or has changed)
+def _load_from_index(index: DateIndex, paths: List[str], date_map: dict, stat_results: dict) -> bool:
+    results = [index.lookup(path, stat_results.get(path)) for path in paths]
+    if not all(found for found, _ in results):
+        return False
+
+    for path, (_, date_taken) in zip(paths, results):
+        if date_taken is not None:
+            date_map[date_taken].append(path)
+    return True
+
+
+# Helper method to record freshly extracted dates in the date index
+# Files in failed couldn't be read (permissions, I/O errors, a file still being written), so they aren't recorded and get read again next time
+def _store_in_index(index: DateIndex, paths: List[str], extracted: dict, store_missing: bool, stat_results: dict, failed: set = frozenset()) -> None:
+    dates_by_path = {path: date_taken for date_taken, file_paths in extracted.items() for path in file_paths}
+    for path in paths:
+        if path in failed:
+            continue
+        date_taken = dates_by_path.get(path)
+        if date_taken is not None or store_missing:
+            index.store(path, date_taken, stat_results.get(path))
+
+
+# Helper method to get the creation time of a file from its stat result (creation time on Windows/macOS, otherwise the modification time)
+def get_creation_time(stat: os.stat_result) -> float:
+    if platform.system() == 'Windows':
+        return stat.st_ctime
+    return stat.st_birthtime if hasattr(stat, 'st_birthtime') else stat.st_mtime
+
+
+# Helper method to get the creation dates for all files in a directory tree (Will return a set of dates and a map of dates to the file paths)
+# If a DateIndex is given, only new or changed files are read and everything else is loaded from the index
+# If stat_results is given, it is filled with the stat result of every file (path -> os.stat_result) for later stages
+# workers and processes are passed on to get_date_taken_pillow
+# Once cancel is set the scan and the extraction stop early and the (incomplete) map is returned, only the dates that were read are stored in the index
+def get_creation_dates_for_directory(directory, index: DateIndex = None, max_depth: int = None, ignore_patterns: List[str] = DEFAULT_IGNORE_PATTERNS, stat_results: dict = None,
+                                     workers: int = DEFAULT_EXTRACT_WORKERS, processes: bool = False, cancel: threading.Event = None) -> dict[dt.date, List[str]]:
 
     # Return a map of dates to the file paths
     date_map = defaultdict(list)
     
+    # Stat results fetched by the scanner, reused for the index and the creation dates of the other files
+    stat_results = {} if stat_results is None else stat_results
 
     # Collect all the files in the directory by type
-    pillow_supported_imgs, raws_with_jpg, raws_without_jpg, others = collect_files_by_type(directory)
+    pillow_supported_imgs, raws_with_jpg, raws_without_jpg, others = collect_files_by_type(directory, max_depth, ignore_patterns, stat_results, cancel)
+    if _cancelled(cancel):
+        return date_map
+
+    # Load unchanged files from the index so only the misses have to be extracted
+    if index is not None:
+        index.reset_counters()
+        index.preload(directory)
+        pillow_supported_imgs = {
+            base_name: file_path for base_name, file_path in pillow_supported_imgs.items()
+            if not _load_from_index(index, [file_path] + ([raws_with_jpg[base_name]] if base_name in raws_with_jpg else []), date_map, stat_results)
+        }
+        raws_with_jpg = {base_name: raw_path for base_name, raw_path in raws_with_jpg.items() if base_name in pillow_supported_imgs}
+        raws_without_jpg = [raw_path for raw_path in raws_without_jpg if not _load_from_index(index, [raw_path], date_map, stat_results)]
 
     # Get the date taken for the Pillow supported images
-    pillow_date_map = get_date_taken_pillow(pillow_supported_imgs, raws_with_jpg)
+    failed = set()
+    pillow_date_map = get_date_taken_pillow(pillow_supported_imgs, raws_with_jpg, workers, processes, failed, cancel)
+    # Images without a DateTimeOriginal are recorded as such (so they aren't read again), images that failed (and their RAW files) aren't
+    failed.update(raws_with_jpg[key] for key, image_path in pillow_supported_imgs.items() if image_path in failed and key in raws_with_jpg)
+    # A cancelled extraction doesn't say which images were never read, so nothing is recorded as missing
+    if index is not None and not _cancelled(cancel):
+        _store_in_index(index, list(pillow_supported_imgs.values()) + list(raws_with_jpg.values()), pillow_date_map, store_missing=True, stat_results=stat_results, failed=failed)
     if pillow_date_map:
         for date_taken, file_paths in pillow_date_map.items():
             if date_map.get(date_taken) is None:
@@ -143,25 +296,27 @@ def get_creation_dates_for_directory(directory) -> dict[dt.date, List[str]]:
                 date_map[date_taken].extend(file_paths)
 
     # Get the date taken for the RAW files (no need to process raws with jpgs)
-    if raws_without_jpg:
-        raw_date_map = get_date_taken_raw(raws_without_jpg)
+    if raws_without_jpg and not _cancelled(cancel):
+        raw_date_map = get_date_taken_raw(raws_without_jpg, cancel=cancel)
         if raw_date_map:
+            # Batch errors are swallowed by get_date_taken_raw, so only the dates that were found are recorded
+            if index is not None:
+                _store_in_index(index, raws_without_jpg, raw_date_map, store_missing=False, stat_results=stat_results)
             for date_taken, file_paths in raw_date_map.items():
                 if date_map.get(date_taken) is None:
                     date_map[date_taken] = file_paths
                 else:
                     date_map[date_taken].extend(file_paths)
 
+    if index is not None:
+        index.commit()
+        print(f"Date index: {index.hits} hits, {index.misses} misses")
+
     # Get the date taken for the other files (we will default to the file creation date)
-    is_windows = platform.system() == 'Windows'
     for file_path in others:
         try:
-            # Get the file creation time
-            if is_windows:
-                creation_time = os.path.getctime(file_path)
-            else:
-                stat = os.stat(file_path)
-                creation_time = stat.st_birthtime if hasattr(stat, 'st_birthtime') else stat.st_mtime
+            # Get the file creation time (from the stat result the scanner already has)
+            creation_time = get_creation_time(stat_results[file_path])
 
             # Convert to datetime object and update the date map
             date_taken = dt.fromtimestamp(creation_time).date()
@@ -0,0 +1,238 @@
+import os, heapq, struct, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List
+from concurrency import STREAM_READ_AHEAD, FileFeed
+
+# fcntl (and with it FIEMAP) only exists on Unix
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Kinds of block devices and the number of copies in flight per device of that kind: a spinning disk or a card
+# reader seeks/stalls with more than one or two streams at once. SSDs and anything not positively identified
+# (network shares, virtual disks) aren't capped, they get as many copies as the caller's max_workers allows
+DEVICE_ROTATIONAL = 'rotational'
+DEVICE_REMOVABLE = 'removable'
+DEVICE_SSD = 'ssd'
+DEVICE_UNKNOWN = 'unknown'
+DEVICE_LIMITS = {
+    DEVICE_ROTATIONAL: 1,
+    DEVICE_REMOVABLE: 2,
+}
+
+# Transfers at least this large are dropped from the page cache as they go (see copy_file_fast)
+DROP_CACHE_BYTES = 1024 * 1024 * 1024
+
+# ioctl number of FS_IOC_FIEMAP (_IOWR('f', 11, struct fiemap)) and the layout of struct fiemap / struct fiemap_extent
+FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP_HEADER = struct.Struct('=QQIIII')
+_FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')
+_FIEMAP_MAX_LENGTH = 0xFFFFFFFFFFFFFFFF
+
+# Kinds found per device, and devices whose filesystem doesn't support FIEMAP (so it's only probed once)
+_device_kinds = {}
+_no_fiemap = set()
+_lock = threading.Lock()
+
+
+# Helper method to read a flag of a block device from sysfs (partitions keep their queue settings on the parent disk)
+def _sysfs_flag(device: int, name: str) -> bool:
+    base = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+    for folder in (base, os.path.join(base, '..')):
+        try:
+            with open(os.path.join(folder, name)) as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    return None
+
+
+# Helper method to check whether a block device is virtual (its sysfs node isn't backed by real hardware)
+def _is_virtual(device: int) -> bool:
+    node = os.path.realpath(f"/sys/dev/block/{os.major(device)}:{os.minor(device)}")
+    return '/virtual/' in node or '/virtio' in node
+
+
+def device_kind(device: int) -> str:
+    """Returns whether a device (st_dev) is a spinning disk, a removable device (card readers, USB sticks), an SSD or unknown."""
+    with _lock:
+        if device in _device_kinds:
+            return _device_kinds[device]
+
+    kind = DEVICE_UNKNOWN
+    # Only Linux exposes this in sysfs, virtual filesystems (major 0: NFS, SMB, tmpfs, overlay) have no block device
+    # Virtual disks (virtio, loop, zram) report whatever the driver defaults to (virtio disks claim to rotate), so they stay unknown
+    if hasattr(os, 'major') and os.path.isdir('/sys/dev/block') and os.major(device) != 0 and not _is_virtual(device):
+        rotational = _sysfs_flag(device, 'queue/rotational')
+        if _sysfs_flag(device, 'removable'):
+            kind = DEVICE_REMOVABLE
+        elif rotational:
+            kind = DEVICE_ROTATIONAL
+        elif rotational is not None:
+            kind = DEVICE_SSD
+
+    with _lock:
+        _device_kinds[device] = kind
+    return kind
+
+
+def device_limit(device: int, max_workers: int) -> int:
+    """Returns the number of copies allowed in flight on a device (max_workers unless it is a spinning disk or a removable device)."""
+    return max(1, min(max_workers, DEVICE_LIMITS.get(device_kind(device), max_workers)))
+
+
+def physical_offset(path: str, device: int) -> int:
+    """Returns where the first extent of a file is on its device (FIEMAP, Linux), or None if that isn't known."""
+    if fcntl is None or device in _no_fiemap:
+        return None
+    request = bytearray(_FIEMAP_HEADER.pack(0, _FIEMAP_MAX_LENGTH, 0, 0, 1, 0) + bytes(_FIEMAP_EXTENT.size))
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, request)
+    except OSError as e:
+        # Filesystems without FIEMAP (e.g. network shares) don't get asked again, a missing file is reported by the copy
+        if not isinstance(e, (FileNotFoundError, PermissionError)):
+            _no_fiemap.add(device)
+        return None
+    if not _FIEMAP_HEADER.unpack_from(request)[3]:
+        # No extents (empty or inline files)
+        return None
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP_HEADER.size)[1]
+
+
+# Helper method to group files by their source device with the key their device reads them fastest in (see order_reads)
+# Returns device -> list of (key, path, size)
+def _read_keys(files: List[str], stats: dict) -> Dict[int, list]:
+    groups = {}
+    for file_path in files:
+        try:
+            stat_result = stats.get(file_path) or os.stat(file_path)
+            device, inode, size = stat_result.st_dev, stat_result.st_ino, stat_result.st_size
+        except OSError:
+            # The copy reports missing files, they go first since they take no time
+            device, inode, size = -1, -1, 0
+        groups.setdefault(device, []).append((inode, file_path, size))
+
+    keyed = {}
+    for device, entries in groups.items():
+        if device != -1 and device_kind(device) in (DEVICE_ROTATIONAL, DEVICE_REMOVABLE):
+            # Files without an extent map sort by inode after the ones with one
+            keyed[device] = []
+            for inode, file_path, size in entries:
+                offset = physical_offset(file_path, device)
+                keyed[device].append(((0, offset) if offset is not None else (1, inode), file_path, size))
+        else:
+            keyed[device] = [((1, inode), file_path, size) for inode, file_path, size in entries]
+    return keyed
+
+
+def order_reads(files: List[str], stats: dict = None) -> Dict[int, deque]:
+    """
+    Groups files by their source device and orders each group the way the device reads it fastest:
+    by physical offset (FIEMAP) on spinning disks and removable devices, by inode number otherwise
+    (and where FIEMAP isn't available), which on most filesystems follows the allocation order.
+    Returns device -> deque of (path, size).
+
+    Parameters:
+        files (List[str]): Paths of the files to read.
+        stats (dict): Stat results already fetched for the files (path -> os.stat_result), the others are stat'd here.
+    """
+    ordered = {}
+    for device, entries in _read_keys(files, stats or {}).items():
+        entries.sort()
+        ordered[device] = deque((file_path, size) for _, file_path, size in entries)
+    return ordered
+
+
+def run_scheduled(copy_fn: Callable[[str], object], files: Iterable[str], destination_folder: str | List[str], max_workers: int = 4,
+                  cancel: threading.Event = None, stats: dict = None) -> list:
+    """
+    Runs copy_fn on every file with the copies grouped by device: each source device is read in physical
+    order (see order_reads) and every device, the source devices and the destination devices, has its own
+    limit of copies in flight (see device_limit), so a spinning disk or card reader isn't hit with random
+    concurrent reads while an SSD still gets a deep queue. Returns the results in completion order.
+
+    A stream of files (see FileFeed) is copied as it arrives, the files waiting for a device are read in
+    physical order of what has arrived so far.
+
+    Parameters:
+        copy_fn (Callable[[str], object]): Function copying a single file.
+        files (Iterable[str]): Paths of the files to copy, a list or a stream.
+        destination_folder (str | List[str]): Folder(s) the files are copied to (their devices get a limit too).
+        max_workers (int): Highest number of copies in flight overall.
+        cancel (threading.Event): Once set, no new copies are started (the ones in flight finish, a stream is drained).
+        stats (dict): Stat results already fetched for the files (path -> os.stat_result), the producer of a stream
+            can add the stat results of its files before handing them over.
+    """
+    stats = {} if stats is None else stats
+    feed = FileFeed(files)
+    destination_devices = set()
+    for folder in [destination_folder] if isinstance(destination_folder, str) else destination_folder:
+        try:
+            destination_devices.add(os.stat(folder).st_dev)
+        except OSError:
+            pass
+
+    # Source device -> heap of (read order key, arrival number, path) of the files waiting for it
+    queues = {}
+    limits = {device: device_limit(device, max_workers) for device in destination_devices}
+    arrivals = 0
+    logged = set()
+    results = []
+    in_flight = {}
+    running = {device: 0 for device in limits}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # Queue the files that arrived with their device's read order (a stream is only read ahead of the copies so far)
+            queued = sum(len(queue) for queue in queues.values())
+            arrived, finished = feed.take(max(0, STREAM_READ_AHEAD - queued) if feed.streaming else None)
+            for device, entries in _read_keys(arrived, stats).items():
+                if device not in limits:
+                    limits[device] = device_limit(device, max_workers) if device != -1 else max_workers
+                    running[device] = 0
+                for key, file_path, _ in entries:
+                    heapq.heappush(queues.setdefault(device, []), (key, arrivals, file_path))
+                    arrivals += 1
+            # Every device is logged once (a stream logs the devices its files come from as they show up)
+            unlogged = [device for device in limits if device != -1 and device not in logged]
+            if unlogged:
+                print("Copies in flight per device: " + ', '.join(f"{device} ({device_kind(device)}): {limits[device]}" for device in unlogged))
+                logged.update(unlogged)
+
+            # Drop whatever hasn't started yet once the run is cancelled
+            if cancel is not None and cancel.is_set():
+                for queue in queues.values():
+                    queue.clear()
+
+            # Start the next file of every source device that (together with the destination devices) has a free slot
+            started = True
+            while started and len(in_flight) < max_workers:
+                started = False
+                for device, queue in queues.items():
+                    devices = {device} | destination_devices
+                    if not queue or len(in_flight) >= max_workers or any(running[d] >= limits[d] for d in devices):
+                        continue
+                    file_path = heapq.heappop(queue)[2]
+                    in_flight[executor.submit(copy_fn, file_path)] = devices
+                    for d in devices:
+                        running[d] += 1
+                    started = True
+
+            if not in_flight and finished:
+                break
+            # Wait for a copy to finish or (while there is room to queue them) for more files of the stream
+            waiting = list(in_flight)
+            if not finished and sum(len(queue) for queue in queues.values()) < STREAM_READ_AHEAD:
+                waiting.append(feed.signal)
+            done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future not in in_flight:
+                    continue
+                for d in in_flight.pop(future):
+                    running[d] -= 1
+                results.append(future.result())
+
+    return results
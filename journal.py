@@ -0,0 +1,304 @@
+import os, json, shutil, hashlib, threading
+from typing import List
+from copy_backends import ADVICE_DONTNEED, ADVICE_SEQUENTIAL, BUFFER_SIZE, advise
+
+# Name of the journal kept in every destination folder
+JOURNAL_NAME = '.file_transfer_journal.jsonl'
+
+# Files at or above this size are copied in chunks that are fsync'd and journaled, so they can resume
+RESUME_THRESHOLD = 256 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Journal record types
+PLANNED = 'planned'
+STARTED = 'started'
+CHUNK = 'chunk'
+DONE = 'done'
+
+
+# Helper method to get the temporary name a file is written to before it is renamed into place
+def get_temp_path(destination_path: str) -> str:
+    directory, name = os.path.split(destination_path)
+    return os.path.join(directory, f".{name}.part")
+
+
+# Helper method to hash a chunk of a file (used to verify the last journaled chunk before resuming)
+def _hash_range(path: str, offset: int, length: int) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        _feed(f, length, hasher)
+    return hasher.hexdigest()
+
+
+# Helper method to feed the next length bytes of an open file to a hasher
+def _feed(f, length: int, hasher) -> None:
+    remaining = length
+    while remaining > 0:
+        data = f.read(min(remaining, 1024 * 1024))
+        if not data:
+            break
+        hasher.update(data)
+        remaining -= len(data)
+
+
+# Helper method to build the journal record of a completed copy from its (name, size, mtime_ns)
+def _done_record(source_path: str, completed: tuple) -> dict:
+    name, size, mtime_ns = completed
+    return {'op': DONE, 'source': source_path, 'name': name, 'size': size, 'mtime_ns': mtime_ns}
+
+
+class TransferJournal:
+    """
+    Append-only journal of planned, in-progress and completed copies for one destination folder.
+
+    Completed source files that haven't changed since (same size and mtime) are skipped on a rerun without
+    touching the destination, and large files
+    record a verified offset after every fsync'd chunk so an interrupted copy resumes from there
+    instead of starting from zero.
+
+    Parameters:
+        destination_folder (str): Folder the journal belongs to (the journal file is stored in it).
+        read_only (bool): Only load the journal (e.g. for a dry run), nothing is created or written in the folder.
+    """
+
+    def __init__(self, destination_folder: str, read_only: bool = False):
+        self.path = os.path.join(destination_folder, JOURNAL_NAME)
+        self._lock = threading.Lock()
+
+        # source path -> (destination name, size, mtime_ns) of completed copies (the size and mtime of the source when it was copied)
+        self.completed = {}
+        # source path -> last verified chunk record of an unfinished chunked copy
+        self.chunks = {}
+        self._load()
+        self._file = None if read_only else open(self.path, 'a', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Helper method to replay the journal (a torn last line from a crash is ignored)
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                source = record.get('source')
+                if record.get('op') == DONE:
+                    self.completed[source] = (record['name'], record.get('size'), record.get('mtime_ns'))
+                    self.chunks.pop(source, None)
+                elif record.get('op') == STARTED:
+                    self.completed.pop(source, None)
+                    self.chunks.pop(source, None)
+                elif record.get('op') == CHUNK:
+                    self.chunks[source] = record
+
+    # Helper method to append records to the journal
+    def _append(self, *records: dict) -> None:
+        lines = ''.join(json.dumps(record) + '\n' for record in records)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+
+    def plan(self, source_paths: List[str]) -> None:
+        """Records the files planned for this run in a single write."""
+        self._append(*({'op': PLANNED, 'source': source} for source in source_paths))
+
+    def completed_name(self, source_path: str, stat_result: os.stat_result) -> str:
+        """Returns the destination name of a completed copy, or None if there is none or the source changed since (size or mtime)."""
+        record = self.completed.get(source_path)
+        if record is None or stat_result is None or record[1:] != (stat_result.st_size, stat_result.st_mtime_ns):
+            return None
+        return record[0]
+
+    def is_done(self, source_path: str, stat_result: os.stat_result) -> bool:
+        return self.completed_name(source_path, stat_result) is not None
+
+    def mark_done(self, source_path: str, name: str, stat_result: os.stat_result) -> None:
+        """Records a completed copy with the size and mtime of the source it was copied from (stat_result, taken before the copy)."""
+        self.completed[source_path] = (name, stat_result.st_size, stat_result.st_mtime_ns)
+        self.chunks.pop(source_path, None)
+        self._append(_done_record(source_path, self.completed[source_path]))
+
+    # Helper method to get the offset a chunked copy can resume from (0 if the temp file can't be trusted)
+    def _verified_offset(self, source_path: str, temp_path: str, stat_result: os.stat_result) -> int:
+        record = self.chunks.get(source_path)
+        if record is None or record['size'] != stat_result.st_size or record['mtime_ns'] != stat_result.st_mtime_ns:
+            return 0
+        try:
+            if os.path.getsize(temp_path) < record['offset']:
+                return 0
+        except OSError:
+            return 0
+
+        # Re-hash the last journaled chunk of the temp file before trusting anything up to its end
+        chunk_start = record['offset'] - record['length']
+        if _hash_range(temp_path, chunk_start, record['length']) != record['digest']:
+            return 0
+        return record['offset']
+
+    def copy_resumable(self, source_path: str, temp_path: str, hasher=None, drop_cache: bool = False, stat_result: os.stat_result = None) -> str:
+        """
+        Copies a large file to temp_path in fsync'd chunks, journaling the offset and hash of each chunk,
+        and resumes from the last verified chunk of an earlier interrupted run. Returns the backend name.
+        If a hashlib hasher is given it is fed the whole file (the part copied by an earlier run is re-read
+        from temp_path). With drop_cache, every chunk is dropped from the page cache once it is on disk.
+        stat_result is the source's stat if the caller already has it.
+        """
+        backend, errors = copy_resumable_fanout(source_path, [(self, temp_path)], hasher, drop_cache, stat_result)
+        if errors[0] is not None:
+            raise errors[0]
+        return backend
+
+    def compact(self) -> None:
+        """Rewrites the journal with only the completed copies (and unfinished chunked copies) of the last replay."""
+        with self._lock:
+            self._file.close()
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for source, completed in self.completed.items():
+                    f.write(json.dumps(_done_record(source, completed)) + '\n')
+                for record in self.chunks.values():
+                    f.write(json.dumps(record) + '\n')
+            os.replace(temp_path, self.path)
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+
+
+# Helper method to write all of data to a file opened without buffering
+def _write_all(output, data) -> None:
+    written = 0
+    while written < len(data):
+        written += output.write(data[written:])
+
+
+class _ChunkedTarget:
+    """One destination of copy_resumable_fanout: its temp file, how far it got and the chunk it is writing."""
+
+    def __init__(self, journal: TransferJournal, temp_path: str, offset: int):
+        self.journal = journal
+        self.temp_path = temp_path
+        self.resumed_from = self.offset = self.chunk_start = offset
+        self.chunk_hasher = hashlib.blake2b(digest_size=16)
+        self.output = None
+        self.error = None
+
+    # Helper method to fsync the chunk written since the last one and journal its offset and hash
+    def commit(self, source_path: str, stat_result: os.stat_result, drop_cache: bool) -> None:
+        # The data has to be on disk before the journal claims it is
+        os.fsync(self.output.fileno())
+        if drop_cache:
+            advise(self.output.fileno(), ADVICE_DONTNEED)
+        record = {
+            'op': CHUNK, 'source': source_path, 'offset': self.offset, 'length': self.offset - self.chunk_start,
+            'digest': self.chunk_hasher.hexdigest(), 'size': stat_result.st_size, 'mtime_ns': stat_result.st_mtime_ns
+        }
+        self.journal.chunks[source_path] = record
+        self.journal._append(record)
+        self.chunk_start = self.offset
+        self.chunk_hasher = hashlib.blake2b(digest_size=16)
+
+
+def copy_resumable_fanout(source_path: str, targets: List[tuple], hasher=None, drop_cache: bool = False, stat_result: os.stat_result = None) -> tuple:
+    """
+    Copies a large file to several destinations reading it once, in chunks that are fsync'd and journaled in every
+    destination (see TransferJournal.copy_resumable). Every destination resumes from its own last verified chunk and
+    the source is read from the earliest of them. Returns (backend name, errors): errors has one entry per destination,
+    None if it was written, otherwise the OSError that stopped it (its temp file and journaled chunks are kept so the
+    next run resumes it). Errors reading the source are raised.
+
+    Parameters:
+        source_path (str): Path of the file to copy.
+        targets (List[tuple]): (journal, temp path) of every destination.
+        hasher: hashlib hasher fed with the whole file once (the part every destination already has is re-read from a temp file).
+        drop_cache (bool): Drop every chunk from the page cache once it is on disk.
+        stat_result (os.stat_result): Stat result of the source if the caller already has it.
+    """
+    stat_result = stat_result or os.stat(source_path)
+    chunked = [_ChunkedTarget(journal, temp_path, journal._verified_offset(source_path, temp_path, stat_result)) for journal, temp_path in targets]
+    try:
+        for target in chunked:
+            if target.offset:
+                print(f"Resuming {os.path.basename(source_path)} in {os.path.dirname(target.temp_path)} at {target.offset / 1e6:.1f} MB")
+            else:
+                target.journal._append({'op': STARTED, 'source': source_path})
+            try:
+                target.output = open(target.temp_path, 'r+b' if target.offset else 'wb', buffering=0)
+                target.output.seek(target.offset)
+                target.output.truncate(target.offset)
+            except OSError as e:
+                target.error = e
+
+        live = [target for target in chunked if target.error is None]
+        if live:
+            _copy_chunks(source_path, live, hasher, drop_cache, stat_result)
+    finally:
+        for target in chunked:
+            if target.output is not None:
+                target.output.close()
+
+    for target in chunked:
+        if target.error is None:
+            try:
+                shutil.copystat(source_path, target.temp_path)
+            except OSError as e:
+                target.error = e
+    resumed = any(target.resumed_from for target in chunked)
+    return 'resumed' if resumed else 'chunked', [target.error for target in chunked]
+
+
+# Helper method to read the source once from the earliest offset of the targets and write every block to the targets still missing it
+def _copy_chunks(source_path: str, targets: List[_ChunkedTarget], hasher, drop_cache: bool, stat_result: os.stat_result) -> None:
+    position = min(target.offset for target in targets)
+    if hasher is not None and position:
+        # Every destination already has the data up to position, the one that is furthest behind gives it to the hasher
+        with open(min(targets, key=lambda target: target.offset).temp_path, 'rb') as f:
+            _feed(f, position, hasher)
+
+    # Blocks are a fraction of a chunk, so every chunk is committed as soon as its last block is written
+    view = memoryview(bytearray(min(BUFFER_SIZE, CHUNK_SIZE)))
+    with open(source_path, 'rb', buffering=0) as src:
+        advise(src.fileno(), ADVICE_SEQUENTIAL)
+        src.seek(position)
+        while True:
+            read = src.readinto(view)
+            if not read:
+                break
+            if hasher is not None:
+                hasher.update(view[:read])
+            end = position + read
+            for target in targets:
+                if target.error is not None or target.offset >= end:
+                    continue
+                block = view[target.offset - position:read]
+                try:
+                    _write_all(target.output, block)
+                    target.chunk_hasher.update(block)
+                    target.offset = end
+                    if target.offset - target.chunk_start >= CHUNK_SIZE:
+                        target.commit(source_path, stat_result, drop_cache)
+                except OSError as e:
+                    target.error = e
+            position = end
+            if drop_cache and position % CHUNK_SIZE == 0:
+                advise(src.fileno(), ADVICE_DONTNEED)
+
+        # The last (short) chunk
+        for target in targets:
+            if target.error is None and target.offset > target.chunk_start:
+                try:
+                    target.commit(source_path, stat_result, drop_cache)
+                except OSError as e:
+                    target.error = e
+        if drop_cache:
+            advise(src.fileno(), ADVICE_DONTNEED)
@@ -1,4 +1,5 @@
-from gui import root
-
+# The GUI is only imported here, so the worker processes dating the images (which re-import this module on Windows/macOS)
+# don't open a window of their own
 if __name__ == "__main__":
+    from gui import root
     root.mainloop()
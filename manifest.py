@@ -0,0 +1,159 @@
+import os, json, hashlib, threading
+
+# xxhash is optional: it is several times faster than BLAKE2, which is used when it isn't installed
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Name of the checksum manifest kept in every destination folder
+MANIFEST_NAME = '.file_transfer_manifest.jsonl'
+
+# Size of the sequential reads used when hashing/verifying files
+READ_SIZE = 8 * 1024 * 1024
+
+# Modification times closer than this count as equal (FAT/exFAT cards only store mtimes to 2 seconds)
+MTIME_TOLERANCE_NS = 2 * 1_000_000_000
+
+
+# Hash used for copies and the manifest (recorded with every entry so digests of different hashes are never compared)
+HASH_ALGORITHM = 'xxh3_128' if xxhash is not None else 'blake2b'
+
+
+# Helper method to create the hasher used for copies and the manifest
+def new_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=20)
+
+
+# Helper method to hash a whole file with large sequential reads
+def hash_file(path: str) -> str:
+    hasher = new_hasher()
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        # Tell the kernel we are streaming through the file once
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            read = f.readinto(view)
+            if not read:
+                break
+            hasher.update(view[:read])
+    return hasher.hexdigest()
+
+
+class Manifest:
+    """
+    Append-only manifest of the files copied into a destination folder: name -> size, mtime and digest
+    (xxh3_128 if xxhash is installed, BLAKE2 otherwise).
+
+    The digest is computed while the file is copied, so the data is only read once. The manifest is used
+    to settle skip decisions on a size tie and by verify() to find corrupted copies.
+
+    Parameters:
+        destination_folder (str): Folder the manifest belongs to (the manifest file is stored in it).
+        read_only (bool): Only load the manifest (e.g. for a dry run), nothing is created or written in the folder.
+    """
+
+    def __init__(self, destination_folder: str, read_only: bool = False):
+        self.destination_folder = destination_folder
+        self.path = os.path.join(destination_folder, MANIFEST_NAME)
+        self.entries = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[record['name']] = record
+        self._file = None if read_only else open(self.path, 'a', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def record(self, name: str, digest: str) -> None:
+        """Records the digest of a file that was just copied (size and mtime are read from the destination)."""
+        stat_result = os.stat(os.path.join(self.destination_folder, name))
+        record = {'name': name, 'size': stat_result.st_size, 'mtime_ns': stat_result.st_mtime_ns, 'algorithm': HASH_ALGORITHM, 'digest': digest}
+        with self._lock:
+            self.entries[name] = record
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def digest_of(self, name: str, stat_result: os.stat_result) -> str:
+        """Returns the digest of a destination file, from the manifest if it still matches the file, otherwise by hashing it."""
+        record = self.entries.get(name)
+        if (record is not None and record.get('algorithm') == HASH_ALGORITHM
+                and record['size'] == stat_result.st_size and record['mtime_ns'] == stat_result.st_mtime_ns):
+            return record['digest']
+        return hash_file(os.path.join(self.destination_folder, name))
+
+    def verify(self) -> list:
+        """
+        Re-reads every file in the manifest with large sequential reads and returns the names of the
+        files that are missing or whose content no longer matches their digest.
+        """
+        failures = []
+        for name, record in self.entries.items():
+            path = os.path.join(self.destination_folder, name)
+            if record.get('algorithm') != HASH_ALGORITHM:
+                print(f"Skipping {name}: recorded with {record.get('algorithm')}, not {HASH_ALGORITHM}")
+                continue
+            try:
+                if hash_file(path) != record['digest']:
+                    print(f"Checksum mismatch for {name}")
+                    failures.append(name)
+            except OSError as e:
+                print(f"Error verifying {name}: {e}")
+                failures.append(name)
+        return failures
+
+    def compact(self) -> None:
+        """Rewrites the manifest with the latest record of every file."""
+        with self._lock:
+            self._file.close()
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for record in self.entries.values():
+                    f.write(json.dumps(record) + '\n')
+            os.replace(temp_path, self.path)
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+
+
+# Helper method to compare two files by their stat results (True/False, or None if only the content can tell)
+def stats_match(source_stat: os.stat_result, destination_stat: os.stat_result) -> bool:
+    if source_stat.st_size != destination_stat.st_size:
+        return False
+    if abs(source_stat.st_mtime_ns - destination_stat.st_mtime_ns) < MTIME_TOLERANCE_NS:
+        return True
+    return None
+
+
+# Helper method to decide whether an existing destination file holds the same content as the source (size/mtime first, hash only on a tie)
+def files_match(source_path: str, destination_path: str, manifest: Manifest = None, source_stat: os.stat_result = None, destination_stat: os.stat_result = None) -> bool:
+    source_stat = source_stat or os.stat(source_path)
+    destination_stat = destination_stat or os.stat(destination_path)
+
+    match = stats_match(source_stat, destination_stat)
+    if match is not None:
+        return match
+
+    # Same size but different modification times: compare the content
+    if manifest is not None:
+        destination_digest = manifest.digest_of(os.path.basename(destination_path), destination_stat)
+    else:
+        destination_digest = hash_file(destination_path)
+    return hash_file(source_path) == destination_digest
@@ -0,0 +1,350 @@
+import os, queue, threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from collections import Counter
+from datetime import datetime as dt
+from typing import List, NamedTuple
+import helpers
+from concurrency import AUTO_WORKERS, run_adaptive
+from copy_backends import summarize_backends
+from date_index import DateIndex
+from date_range_index import _get_extension, _to_ordinal, normalize_file_type
+from exif_reader import RAW_EXTENSIONS, ExifParseError, read_raw_date_taken
+from exiftool_pool import ExifToolPool
+from file_transfer import DestinationSet
+from io_scheduler import run_scheduled
+from progress import FINISHED, ConsoleRenderer, TransferEvent, TransferProgress
+from scanner import DEFAULT_IGNORE_PATTERNS, KIND_IMAGE, KIND_OTHER, KIND_PAIRED_RAW, KIND_UNPAIRED_RAW, PILLOW_EXTENSIONS, get_extension, scan_directory
+
+# Maximum number of files waiting between two stages (memory is bounded by these, not by the size of the library)
+EXTRACT_QUEUE_SIZE = 1024
+COPY_QUEUE_SIZE = 256
+
+# Most files an extraction thread takes off the queue at once (one round trip to a worker process dates all of them)
+EXTRACT_STREAM_BATCH = 32
+
+# Marks the end of the stream on a queue
+_DONE = None
+
+
+class IngestResult(NamedTuple):
+    """
+    Summary of an ingest run: scanned is the number of files found, matched the number of files that passed
+    the date/type filter (and went to the copy stage), date_counts the number of files per capture date.
+    """
+    scanned: int
+    matched: int
+    date_counts: Counter
+
+
+class CaptureFilter:
+    """Date range and file type filter applied between date extraction and the copy stage (shared with the watch)."""
+
+    def __init__(self, start_date=None, end_date=None, file_type: str = None):
+        self.low = _to_ordinal(start_date) if start_date is not None else None
+        self.high = _to_ordinal(end_date) if end_date is not None else None
+        self.extension = normalize_file_type(file_type)
+
+    def __call__(self, file_path: str, date_taken) -> bool:
+        if date_taken is None:
+            return False
+        ordinal = date_taken.toordinal()
+        if self.low is not None and ordinal < self.low:
+            return False
+        if self.high is not None and ordinal > self.high:
+            return False
+        return self.extension is None or _get_extension(file_path) == self.extension
+
+
+# Helper method to extract the date of an image or unpaired RAW file (returns (found, date), RAW files the native parser can't read aren't found)
+def _extract(kind: str, file_path: str) -> tuple:
+    if kind == KIND_IMAGE:
+        return True, helpers.get_image_date_taken(file_path)
+    try:
+        date_taken = read_raw_date_taken(file_path)
+    except (ExifParseError, OSError):
+        date_taken = None
+    return date_taken is not None, date_taken
+
+
+# Helper method to get the capture date of a single file the way the pipeline dates it (the image or RAW header,
+# exiftool for RAW files the native parser can't read, the creation time for anything else)
+# kind defaults to the kind the scanner gives a file with this extension (RAW files are dated on their own),
+# callers dating files one at a time (the watch) pass an exiftool pool that stays open
+def date_file(file_path: str, stat_result: os.stat_result, kind: str = None, pool: ExifToolPool = None):
+    if kind is None:
+        ext = get_extension(os.path.basename(file_path))
+        kind = KIND_IMAGE if ext in PILLOW_EXTENSIONS else KIND_UNPAIRED_RAW if ext in RAW_EXTENSIONS else KIND_OTHER
+    if kind == KIND_OTHER:
+        return dt.fromtimestamp(helpers.get_creation_time(stat_result)).date()
+    try:
+        found, date_taken = _extract(kind, file_path)
+    except Exception as e:
+        print(f"Error retrieving date taken for {file_path}: {e}")
+        return None
+    if found:
+        return date_taken
+    for date_taken in helpers.get_date_taken_raw([file_path], pool=pool):
+        return date_taken
+    return None
+
+
+# Helper method to extract the dates of a batch of (kind, path) (runs in a worker process or an extraction thread)
+# Every file has its own error handling, so an unreadable file only loses itself. Returns (found, date, error) per file
+def _extract_batch(batch: List[tuple]) -> List[tuple]:
+    results = []
+    for kind, file_path in batch:
+        try:
+            results.append(_extract(kind, file_path) + (None,))
+        except Exception as e:
+            results.append((True, None, str(e)))
+    return results
+
+
+def ingest(source_folder: str, destination_folder: str | List[str], max_workers: int | str = 4, file_type: str = None, start_date=None, end_date=None,
+           index: DateIndex = None, max_depth: int = None, ignore_patterns: List[str] = DEFAULT_IGNORE_PATTERNS, checksums: bool = True, verify: bool = False,
+           progress: TransferProgress = None, cancel: threading.Event = None, extract_workers: int = helpers.DEFAULT_EXTRACT_WORKERS,
+           processes: bool = False) -> IngestResult:
+    """
+    Scans, dates, filters and copies files as one streaming pipeline, so copying starts as soon as the first
+    matching file has a date instead of after the whole library was scanned.
+
+    The scan runs in the calling thread (together with the date index lookups, since the index's sqlite
+    connection belongs to it). Index misses go through a bounded queue to the date extraction threads (which hand
+    small batches to worker processes if processes is set, like get_date_taken_pillow), files
+    that pass the date/type filter are checked against a listing of every destination taken once at the start
+    and go through a second bounded queue to the copy stage, which is dispatched like copy_files (per-device
+    limits and read order, or the adaptive controller with 'auto') and reads each file once for all destinations.
+    A full queue blocks the stage in front of it, so memory stays bounded by the queue sizes. RAW files the native parser can't read are collected and
+    sent through exiftool in one batch once the scan is done.
+
+    Parameters:
+        source_folder (str): Path to the source directory (scanned recursively).
+        destination_folder (str | List[str]): Path to the destination directory, or a list of them (every file is read
+            once and written to all of them, each destination keeps its own journal, manifest and listing).
+        max_workers (int | str): Highest number of copies in flight (every device gets its own limit, see run_scheduled),
+            or 'auto' to let the adaptive controller pick it (see run_adaptive).
+        file_type (str): File extension filter (e.g., ".jpg").
+        start_date (datetime): Filter for files taken on or after this date (None = no lower bound).
+        end_date (datetime): Filter for files taken on or before this date (None = no upper bound).
+        index (DateIndex): On-disk date index (unchanged files skip the extraction and new dates are stored in it).
+        max_depth (int): How many levels of sub directories to descend into (None = unlimited).
+        ignore_patterns (List[str]): fnmatch patterns for file and folder names to skip.
+        checksums (bool): Hash every file while it is copied and record it in the destination's manifest.
+        verify (bool): Re-read every file in the manifest after copying and raise if any copy is corrupted.
+        progress (TransferProgress): Receives the files as they are planned and an event per file (defaults to a console renderer).
+        cancel (threading.Event): Once set, the scan stops and no new copies are started (the ones in flight finish).
+        extract_workers (int): Number of date extraction threads (and worker processes).
+        processes (bool): Date the files in worker processes (CPU bound, e.g. many files going through Pillow). Processes
+            re-import the main module on Windows/macOS, so only callers guarded by __name__ == "__main__" should ask for them.
+    """
+    destination_folders = [destination_folder] if isinstance(destination_folder, str) else list(destination_folder)
+    if progress is None:
+        progress = TransferProgress([ConsoleRenderer()])
+    cancel = cancel or threading.Event()
+    matches = CaptureFilter(start_date, end_date, file_type)
+
+    extract_queue = queue.Queue(maxsize=EXTRACT_QUEUE_SIZE)
+    copy_queue = queue.Queue(maxsize=COPY_QUEUE_SIZE)
+    date_counts = Counter()
+    exiftool_files = []
+    exiftool_stats = {}
+    counts_lock = threading.Lock()
+    errors = []
+    # Path -> (targets, stat result) of the files handed to the copy stage, and their stat results/sizes for the scheduler
+    planned = {}
+    copy_stats = {}
+    copy_sizes = {}
+    matched = 0
+    scanned = 0
+
+    with ExitStack() as stack:
+        # Every destination is listed once, every matching file is checked against the listings instead of the destinations
+        destinations = DestinationSet(destination_folders, stack, progress, checksums)
+
+        # Filter stage: count the date and hand matching files that aren't in every destination yet to the copy threads
+        # (blocks while the copy queue is full)
+        def route(file_path, date_taken, stat_result=None):
+            nonlocal matched
+            with counts_lock:
+                if date_taken is not None:
+                    date_counts[date_taken] += 1
+                if not matches(file_path, date_taken):
+                    return
+                matched += 1
+            targets = destinations.route(file_path, stat_result)
+            if targets:
+                with counts_lock:
+                    planned[file_path] = (targets, stat_result)
+                    if stat_result is not None:
+                        copy_stats[file_path] = stat_result
+                        copy_sizes[file_path] = stat_result.st_size
+                copy_queue.put(file_path)
+
+        # Worker processes for the date extraction (the extraction threads feed them and route the results)
+        executor = None
+        if processes and extract_workers > 1:
+            try:
+                executor = stack.enter_context(ProcessPoolExecutor(max_workers=extract_workers))
+            except (OSError, NotImplementedError) as e:
+                print(f"Can't start worker processes ({e}), dating the files with threads")
+
+        # Helper method to date a batch of entries (in a worker process if there is a pool)
+        def extract_batch(batch):
+            items = [(entry.kind, entry.path) for entry in batch]
+            if executor is None:
+                return _extract_batch(items)
+            try:
+                return executor.submit(_extract_batch, items).result()
+            except Exception as e:
+                # A broken pool loses the batch, the files are read again next time
+                return [(True, None, str(e))] * len(items)
+
+        def extract_worker():
+            done = False
+            while not done:
+                entry = extract_queue.get()
+                if entry is _DONE:
+                    return
+                # Take what is already queued along, without waiting for more files
+                batch = [entry]
+                while len(batch) < EXTRACT_STREAM_BATCH:
+                    try:
+                        entry = extract_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if entry is _DONE:
+                        done = True
+                        break
+                    batch.append(entry)
+                if cancel.is_set():
+                    continue
+
+                for entry, (found, date_taken, error) in zip(batch, extract_batch(batch)):
+                    if error is not None:
+                        print(f"Error retrieving date taken for {entry.path}: {error}")
+                    if not found:
+                        with counts_lock:
+                            exiftool_files.append(entry.path)
+                            exiftool_stats[entry.path] = entry.stat
+                        continue
+                    try:
+                        # Files that couldn't be read aren't recorded, so they are read again next time (not cached as undated)
+                        if index is not None and error is None:
+                            index.store(entry.path, date_taken, entry.stat)
+                            if entry.pair:
+                                index.store(entry.pair, date_taken, entry.pair_stat)
+                        route(entry.path, date_taken, entry.stat)
+                        # The RAW file of a RAW+JPEG pair gets the date of its image
+                        if entry.pair:
+                            route(entry.pair, date_taken, entry.pair_stat)
+                    except Exception as e:
+                        # The worker has to keep draining its queue, so errors stop the run instead of the thread
+                        errors.append(e)
+                        cancel.set()
+
+        # The copy queue as a stream for the scheduler (ends with _DONE)
+        def queued_files():
+            while True:
+                file_path = copy_queue.get()
+                if file_path is _DONE:
+                    return
+                yield file_path
+
+        def copy(file_path):
+            with counts_lock:
+                targets, stat_result = planned.pop(file_path)
+                copy_stats.pop(file_path, None)
+                copy_sizes.pop(file_path, None)
+            if cancel.is_set():
+                return None
+            try:
+                return destinations.copy(file_path, targets, source_folder, stat_result)
+            except Exception as e:
+                # Unexpected errors stop the run (the copies in flight finish, the scheduler keeps draining the queue)
+                errors.append(e)
+                cancel.set()
+                return None
+
+        # Copy stage: the same dispatch as copy_files, fed with the files as they are routed
+        backends = []
+        def copy_stage():
+            if max_workers == AUTO_WORKERS:
+                backends.extend(run_adaptive(copy, queued_files(), cancel=cancel, sizes=copy_sizes))
+            else:
+                backends.extend(run_scheduled(copy, queued_files(), destination_folders, max_workers, cancel, copy_stats))
+
+        extractors = [threading.Thread(target=extract_worker, name=f'extract_{i}', daemon=True) for i in range(extract_workers)]
+        copier = threading.Thread(target=copy_stage, name='copy_stage', daemon=True)
+        for thread in extractors + [copier]:
+            thread.start()
+
+        try:
+            # Scan stage (index hits skip the extraction and go straight to the filter)
+            if index is not None:
+                index.reset_counters()
+                index.preload(source_folder)
+            for entry in scan_directory(source_folder, max_depth, ignore_patterns):
+                if cancel.is_set():
+                    break
+                scanned += 1
+                # Paired RAW files are dated (and routed) together with their image
+                if entry.kind == KIND_PAIRED_RAW:
+                    continue
+                # Other files default to their creation time, which the scanner's stat result already has
+                if entry.kind == KIND_OTHER:
+                    route(entry.path, date_file(entry.path, entry.stat, KIND_OTHER), entry.stat)
+                    continue
+                if index is not None:
+                    found, date_taken = index.lookup(entry.path, entry.stat)
+                    if found and entry.pair:
+                        found = index.lookup(entry.pair, entry.pair_stat)[0]
+                    if found:
+                        route(entry.path, date_taken, entry.stat)
+                        if entry.pair:
+                            route(entry.pair, date_taken, entry.pair_stat)
+                        continue
+                extract_queue.put(entry)
+        finally:
+            for _ in extractors:
+                extract_queue.put(_DONE)
+            for thread in extractors:
+                thread.join()
+            # The worker processes aren't needed for the rest of the run
+            if executor is not None:
+                executor.shutdown()
+
+            # RAW files the native parser couldn't read go through exiftool in one batch
+            if exiftool_files and not cancel.is_set():
+                raw_date_map = helpers.get_date_taken_raw(exiftool_files)
+                dated = set()
+                for date_taken, file_paths in raw_date_map.items():
+                    for file_path in file_paths:
+                        dated.add(file_path)
+                        route(file_path, date_taken, exiftool_stats.get(file_path))
+                if index is not None:
+                    for date_taken, file_paths in raw_date_map.items():
+                        for file_path in file_paths:
+                            index.store(file_path, date_taken, exiftool_stats.get(file_path))
+                for file_path in exiftool_files:
+                    if file_path not in dated:
+                        route(file_path, None, exiftool_stats[file_path])
+
+            copy_queue.put(_DONE)
+            copier.join()
+
+            if index is not None:
+                index.commit()
+                print(f"Date index: {index.hits} hits, {index.misses} misses")
+            destinations.compact()
+            progress.emit(TransferEvent(FINISHED))
+            print(f"Copy backends used: {summarize_backends(backends)}")
+
+        if errors:
+            raise errors[0]
+
+        # Optional verify pass over the destinations (not for a cancelled run)
+        if verify and not cancel.is_set():
+            destinations.verify()
+
+    return IngestResult(scanned, matched, date_counts)
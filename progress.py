@@ -0,0 +1,283 @@
+import os, sys, json, time, threading
+from collections import Counter, deque
+from typing import Callable, NamedTuple
+
+# Event kinds
+PLANNED = 'planned'
+COPIED = 'copied'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+FINISHED = 'finished'
+
+# Length of the sliding window the throughput (and with it the ETA) is measured over
+WINDOW_SECONDS = 5.0
+
+# Upper bounds (in ms) of the per-file latency histogram buckets (anything slower lands in the last, open bucket)
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+# Minimum time between two lines of the console renderer / two records of the metrics sink
+RENDER_INTERVAL = 1.0
+
+
+class TransferEvent(NamedTuple):
+    kind: str
+    file_name: str = None
+    size: int = 0
+    latency: float = 0.0
+    backend: str = None
+    error: str = None
+    # Number of files of a PLANNED event
+    files: int = 0
+    # Destination folder of the event when a transfer writes to several destinations (None otherwise)
+    destination: str = None
+
+
+# Helper method to find the histogram bucket of a latency
+def _bucket(latency: float) -> int:
+    latency_ms = latency * 1000
+    for position, bound in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= bound:
+            return position
+    return len(LATENCY_BUCKETS_MS)
+
+
+# Helper method to label the histogram buckets ('<=1ms', ..., '>5000ms')
+def _bucket_labels() -> list:
+    return [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+
+
+class TransferProgress:
+    """
+    Collects the events of a transfer (planned, copied, skipped and failed files) and keeps the counters
+    the GUI, the CLI and the metrics sink are built on: totals, sliding window bytes/s and files/s, ETA,
+    per-file latency histogram and error counts by type (and, for transfers to several destinations,
+    the copied/skipped/failed files per destination).
+
+    Every event is passed on to the listeners (callables taking the event and this object) after the
+    counters are updated. Events come from the copy threads, so listeners have to be thread safe and cheap;
+    the renderers below rate limit themselves.
+
+    Parameters:
+        listeners (list): Callables called with (event, progress) for every event.
+    """
+
+    def __init__(self, listeners: list = None):
+        self.listeners = list(listeners or [])
+        self._lock = threading.Lock()
+
+        self.planned_files = 0
+        self.planned_bytes = 0
+        self.copied_files = 0
+        self.copied_bytes = 0
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.failed_files = 0
+        self.errors = Counter()
+        self.backends = Counter()
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        # Destination -> Counter of event kinds (only for events that name their destination)
+        self.destinations = {}
+
+        self.started = time.perf_counter()
+        self.finished = None
+        # (time, bytes) of the files completed in the last WINDOW_SECONDS
+        self._window = deque()
+        self._window_bytes = 0
+
+    def add_listener(self, listener: Callable[[TransferEvent, 'TransferProgress'], None]) -> None:
+        self.listeners.append(listener)
+
+    def plan(self, files: int, total_bytes: int) -> None:
+        """Reports the files (and their size) planned for the transfer."""
+        self.emit(TransferEvent(PLANNED, size=total_bytes, files=files))
+
+    def emit(self, event: TransferEvent) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            if event.kind == PLANNED:
+                # A streaming transfer plans file by file, the clock starts with the first one
+                if not self.planned_files:
+                    self.started = now
+                self.planned_files += event.files
+                self.planned_bytes += event.size
+            elif event.kind == COPIED:
+                self.copied_files += 1
+                self.copied_bytes += event.size
+                self.backends[event.backend] += 1
+                self.latency_histogram[_bucket(event.latency)] += 1
+                self._window.append((now, event.size))
+                self._window_bytes += event.size
+            elif event.kind == SKIPPED:
+                self.skipped_files += 1
+                self.skipped_bytes += event.size
+            elif event.kind == FAILED:
+                self.failed_files += 1
+                self.errors[event.error] += 1
+            elif event.kind == FINISHED:
+                self.finished = now
+            if event.destination is not None and event.kind in (COPIED, SKIPPED, FAILED):
+                self.destinations.setdefault(event.destination, Counter())[event.kind] += 1
+            self._trim(now)
+
+        for listener in self.listeners:
+            listener(event, self)
+
+    # Helper method to drop the completions that fell out of the sliding window
+    def _trim(self, now: float) -> None:
+        while self._window and self._window[0][0] < now - WINDOW_SECONDS:
+            _, size = self._window.popleft()
+            self._window_bytes -= size
+
+    @property
+    def done_files(self) -> int:
+        return self.copied_files + self.skipped_files + self.failed_files
+
+    def snapshot(self) -> dict:
+        """Returns the current counters (throughput over the sliding window, ETA in seconds or None)."""
+        now = self.finished or time.perf_counter()
+        with self._lock:
+            self._trim(now)
+            elapsed = now - self.started
+            window = min(WINDOW_SECONDS, elapsed) or 1e-9
+            bytes_per_s = self._window_bytes / window
+            files_per_s = len(self._window) / window
+
+            # Estimate from whichever rate we have (bytes are better when the sizes are known)
+            remaining_bytes = max(0, self.planned_bytes - self.copied_bytes - self.skipped_bytes)
+            remaining_files = max(0, self.planned_files - self.done_files)
+            if bytes_per_s > 0 and remaining_bytes:
+                eta = remaining_bytes / bytes_per_s
+            elif files_per_s > 0:
+                eta = remaining_files / files_per_s
+            else:
+                eta = None if remaining_files else 0.0
+
+            return {
+                'elapsed': round(elapsed, 3),
+                'planned_files': self.planned_files,
+                'planned_bytes': self.planned_bytes,
+                'copied_files': self.copied_files,
+                'copied_bytes': self.copied_bytes,
+                'skipped_files': self.skipped_files,
+                'skipped_bytes': self.skipped_bytes,
+                'failed_files': self.failed_files,
+                'bytes_per_s': round(bytes_per_s, 1),
+                'files_per_s': round(files_per_s, 2),
+                'eta': round(eta, 1) if eta is not None else None,
+                'errors': dict(self.errors),
+                'backends': dict(self.backends),
+                'latency_histogram': dict(zip(_bucket_labels(), self.latency_histogram)),
+                'destinations': {destination: dict(counts) for destination, counts in self.destinations.items()},
+            }
+
+
+# Helper method to format a number of seconds as h:mm:ss
+def format_eta(seconds: float) -> str:
+    if seconds is None:
+        return '--:--'
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class ConsoleRenderer:
+    """
+    Listener printing one progress line at most every interval seconds (failures are printed as they
+    happen) and a summary with the latency histogram when the transfer finishes.
+
+    Parameters:
+        interval (float): Minimum time between two progress lines.
+        stream: File the lines are written to.
+    """
+
+    def __init__(self, interval: float = RENDER_INTERVAL, stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, event: TransferEvent, progress: TransferProgress) -> None:
+        if event.kind == FAILED:
+            target = f" to {event.destination}" if event.destination else ''
+            self._write(f"Failed to copy {event.file_name}{target}: {event.error}")
+        elif event.kind == FINISHED:
+            self._write_summary(progress.snapshot())
+        else:
+            # A streaming transfer plans file by file, so plans are rate limited like the progress lines
+            now = time.perf_counter()
+            with self._lock:
+                if now - self._last < self.interval:
+                    return
+                self._last = now
+            if event.kind == PLANNED and not progress.done_files:
+                self._write(f"Planned {progress.planned_files} files ({progress.planned_bytes / 1e6:.1f} MB) for transfer")
+            else:
+                self._write(self._format(progress.snapshot()))
+
+    def _format(self, snapshot: dict) -> str:
+        done = snapshot['copied_files'] + snapshot['skipped_files'] + snapshot['failed_files']
+        return (
+            f"{done}/{snapshot['planned_files']} files, {(snapshot['copied_bytes'] + snapshot['skipped_bytes']) / 1e6:.1f}"
+            f"/{snapshot['planned_bytes'] / 1e6:.1f} MB, {snapshot['bytes_per_s'] / 1e6:.1f} MB/s, "
+            f"{snapshot['files_per_s']:.1f} files/s, ETA {format_eta(snapshot['eta'])}"
+        )
+
+    def _write_summary(self, snapshot: dict) -> None:
+        elapsed = snapshot['elapsed'] or 1e-9
+        self._write(
+            f"Copied {snapshot['copied_files']} files ({snapshot['copied_bytes'] / 1e6:.1f} MB) in {elapsed:.1f}s "
+            f"({snapshot['copied_bytes'] / elapsed / 1e6:.1f} MB/s), skipped {snapshot['skipped_files']}, failed {snapshot['failed_files']}"
+        )
+        for destination, counts in snapshot['destinations'].items():
+            self._write(f"  {destination}: copied {counts.get(COPIED, 0)}, skipped {counts.get(SKIPPED, 0)}, failed {counts.get(FAILED, 0)}")
+        if snapshot['errors']:
+            self._write("Errors: " + ', '.join(f"{name}: {count}" for name, count in snapshot['errors'].items()))
+        if snapshot['copied_files']:
+            buckets = ', '.join(f"{label}: {count}" for label, count in snapshot['latency_histogram'].items() if count)
+            self._write(f"Latency per file: {buckets}")
+
+    def _write(self, line: str) -> None:
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+class JsonLinesSink:
+    """
+    Listener appending a snapshot of the counters as one JSON line at most every interval seconds
+    (and always at the end of the transfer), for dashboards.
+
+    Parameters:
+        path (str): File the metrics are appended to.
+        interval (float): Minimum time between two records.
+    """
+
+    def __init__(self, path: str, interval: float = RENDER_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._last = 0.0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __call__(self, event: TransferEvent, progress: TransferProgress) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            if event.kind != FINISHED and now - self._last < self.interval:
+                return
+            self._last = now
+        record = {'time': time.time(), 'event': event.kind, **progress.snapshot()}
+        with self._lock:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,131 @@
+import os
+from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterator, List, NamedTuple
+from exif_reader import RAW_EXTENSIONS
+
+# File extensions Pillow can read the date taken from
+PILLOW_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff'}
+
+# Kinds of entries yielded by the scanner
+KIND_IMAGE = 'image'
+KIND_PAIRED_RAW = 'paired_raw'
+KIND_UNPAIRED_RAW = 'unpaired_raw'
+KIND_OTHER = 'other'
+
+# Names skipped by default (hidden files/folders and the usual OS/NAS clutter on cards and shares)
+DEFAULT_IGNORE_PATTERNS = ['.*', '$RECYCLE.BIN', 'System Volume Information', '@eaDir', 'Thumbs.db', 'desktop.ini']
+
+# Number of directories scanned at the same time
+DEFAULT_SCAN_WORKERS = 8
+
+
+class ScanEntry(NamedTuple):
+    """
+    A classified file found by scan_directory.
+
+    kind is one of KIND_IMAGE, KIND_PAIRED_RAW, KIND_UNPAIRED_RAW or KIND_OTHER. For images and paired RAW
+    files, pair holds the path of the other half of the pair (None otherwise). key is the path without its
+    extension, which is what RAW files are paired on. stat (and pair_stat for the other half of a pair) is
+    the stat result already fetched by scandir.
+    """
+    kind: str
+    path: str
+    key: str
+    pair: str
+    stat: os.stat_result
+    pair_stat: os.stat_result = None
+
+
+# Helper method to get the lower case extension of a file name
+def get_extension(name: str) -> str:
+    return name.split('.')[-1].lower()
+
+
+# Helper method to check a file or folder name against the ignore patterns
+def is_ignored(name: str, ignore_patterns: List[str]) -> bool:
+    return any(fnmatch(name, pattern) for pattern in ignore_patterns)
+
+
+# Helper method to scan a single directory (returns the classified entries and the sub directories to descend into)
+def _scan_one(path: str, ignore_patterns: List[str], is_root: bool):
+    images = {}
+    raws = {}
+    others = []
+    subdirs = []
+
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if is_ignored(entry.name, ignore_patterns):
+                    continue
+                try:
+                    # Symlinked folders are not followed so a link back up the tree can't loop forever
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    stat_result = entry.stat()
+                except OSError as e:
+                    print(f"Error reading {entry.path}: {e}")
+                    continue
+
+                ext = get_extension(entry.name)
+                key = os.path.splitext(entry.path)[0]
+                if ext in PILLOW_EXTENSIONS:
+                    images[key] = (entry.path, stat_result)
+                elif ext in RAW_EXTENSIONS:
+                    raws[key] = (entry.path, stat_result)
+                else:
+                    others.append(ScanEntry(KIND_OTHER, entry.path, key, None, stat_result))
+    except OSError as e:
+        # The folder the user picked has to be readable, anything below it is skipped with a warning
+        if is_root:
+            raise
+        print(f"Error scanning {path}: {e}")
+        return [], []
+
+    # Pair the RAW files with the images in the same directory
+    classified = []
+    for key, (image_path, stat_result) in images.items():
+        raw = raws.get(key)
+        classified.append(ScanEntry(KIND_IMAGE, image_path, key, raw[0] if raw else None, stat_result, raw[1] if raw else None))
+    for key, (raw_path, stat_result) in raws.items():
+        image = images.get(key)
+        if image:
+            classified.append(ScanEntry(KIND_PAIRED_RAW, raw_path, key, image[0], stat_result, image[1]))
+        else:
+            classified.append(ScanEntry(KIND_UNPAIRED_RAW, raw_path, key, None, stat_result))
+    classified.extend(others)
+
+    return classified, subdirs
+
+
+def scan_directory(directory: str, max_depth: int = None, ignore_patterns: List[str] = DEFAULT_IGNORE_PATTERNS, workers: int = DEFAULT_SCAN_WORKERS) -> Iterator[ScanEntry]:
+    """
+    Recursively scans a directory and yields classified files as each directory finishes.
+
+    Sub directories are scanned concurrently, RAW files are paired with images within each directory,
+    and the stat result fetched by scandir is kept on every entry so later stages don't stat again.
+
+    Parameters:
+        directory (str): Path to the directory to scan.
+        max_depth (int): How many levels of sub directories to descend into (0 = top level only, None = unlimited).
+        ignore_patterns (List[str]): fnmatch patterns for file and folder names to skip.
+        workers (int): Number of directories scanned at the same time.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='scan') as executor:
+        pending = {executor.submit(_scan_one, directory, ignore_patterns, True): 0}
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                depth = pending.pop(future)
+                classified, subdirs = future.result()
+
+                if max_depth is None or depth < max_depth:
+                    for subdir in subdirs:
+                        pending[executor.submit(_scan_one, subdir, ignore_patterns, False)] = depth + 1
+
+                yield from classified
@@ -1,61 +1,156 @@
-import os, shutil, argparse
+import sys, json, signal, argparse, threading
+from contextlib import nullcontext, redirect_stdout
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrency import parse_workers
+from date_index import DEFAULT_INDEX_PATH, DateIndex
+from progress import ConsoleRenderer, JsonLinesSink, TransferProgress
 
-# Coding up a solution to copy files of a certain type from one directory to another using the command line
-# If not provided a file type just move everything
-def copy_files(source_folder: str, destination_folder: str, max_workers: int=4, file_type: str=None, start_date: datetime=None, end_date: datetime=None) -> None:
+# Headless command line entry point (e.g. for cron jobs) sharing the capture date engine with the GUI:
+#
+#   python standalone.py /media/card /photos --start_date 2024-06-01 --workers auto
+#   python standalone.py /media/card /photos --dry-run --json > plan.json
+#   python standalone.py /media/card /ssd/work /mnt/backup      # one read of the card, written to both destinations
+#   python standalone.py /tethered /photos --watch               # copy new files as they land, until Ctrl+C/SIGTERM
+#
+# Files are scanned recursively with one stat per entry, dated by their capture date (EXIF/RAW headers, exiftool for
+# the rest, creation time for files without metadata) and copied with the journal, manifest and destination planner of
+# file_transfer. Tk is never imported and Pillow only when a file can't be dated from its header.
 
-    # Check to see if the destination folder exists
-    os.makedirs(destination_folder, exist_ok=True)
 
-    # Files to transfer and check if they already exist in the destination folder
-    transfer_files = [
-        f for f in os.listdir(source_folder)
-        if (file_type is None or f.lower().endswith(file_type)) and
-        (start_date is None or datetime.fromtimestamp(os.path.getmtime(os.path.join(source_folder, f))) >= start_date) and
-        (end_date is None or datetime.fromtimestamp(os.path.getmtime(os.path.join(source_folder, f))) <= end_date) and
-        not os.path.exists(os.path.join(destination_folder, f))
-    ]
+# Helper method to scan and date the source, then plan the selection against every destination without copying anything
+# (returns destination folder -> plan)
+def dry_run(source_folder: str, destination_folders: list, file_type: str = None, start_date: datetime = None, end_date: datetime = None,
+            index: DateIndex = None, max_depth: int = None) -> dict:
+    import helpers
+    from date_range_index import DateRangeIndex
+    from journal import TransferJournal
+    from manifest import Manifest
+    from sync_planner import plan_sync
 
-    print(f"Files to transfer: {transfer_files}")
+    # This entry point is guarded by __name__ == "__main__", so the images can be dated by worker processes
+    stat_results = {}
+    date_map = helpers.get_creation_dates_for_directory(source_folder, index, max_depth, stat_results=stat_results, processes=True)
+    selection = DateRangeIndex(date_map).query(start_date, end_date, file_type)
+    plans = {}
+    for folder in destination_folders:
+        # Checked against the same journal and manifest as the transfer (read only, a dry run doesn't write to the destination)
+        with TransferJournal(folder, read_only=True) as journal, Manifest(folder, read_only=True) as manifest:
+            plans[folder] = plan_sync(selection, folder, manifest, stat_results, journal=journal)
+    return plans
 
-    # Utilize Multithreading
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(copy_file, os.path.join(source_folder, file_name), os.path.join(destination_folder, file_name), file_name)
-            for file_name in transfer_files
-        ]
 
-        for future in as_completed(futures):
-            future.result()
+# Helper method to run the transfer (streaming scan, dating, filtering and copying)
+def transfer(source_folder: str, destination_folders: list, workers: int | str = 4, file_type: str = None, start_date: datetime = None,
+             end_date: datetime = None, index: DateIndex = None, max_depth: int = None, checksums: bool = True, verify: bool = False,
+             progress: TransferProgress = None):
+    from pipeline import ingest
 
-    
+    # This entry point is guarded by __name__ == "__main__", so the files can be dated by worker processes
+    return ingest(
+        source_folder, destination_folders, workers, file_type, start_date, end_date, index=index, max_depth=max_depth,
+        checksums=checksums, verify=verify, progress=progress, processes=True
+    )
 
-# Helper function that will copy a file from one destination to another
-def copy_file(source_path, destination_path, file_name):
-    shutil.copy2(source_path, destination_path)
-    print(f"Copied {file_name} to {destination_path}")
+
+# Helper method to copy the files landing in the source until SIGINT/SIGTERM (returns the landing to copied latency summary)
+def watch_source(source_folder: str, destination_folders: list, workers: int | str = 4, file_type: str = None, start_date: datetime = None,
+                 end_date: datetime = None, checksums: bool = True, progress: TransferProgress = None, debounce: float = None, polling: bool = False) -> dict:
+    from watch import DEFAULT_DEBOUNCE, watch
+
+    stop = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stop.set())
+    # Files arrive one at a time, 'auto' just gets the default number of copy threads
+    max_workers = workers if isinstance(workers, int) else 4
+    return watch(
+        source_folder, destination_folders, max_workers, file_type, start_date, end_date, checksums=checksums, progress=progress,
+        stop=stop, debounce=DEFAULT_DEBOUNCE if debounce is None else debounce, polling=polling
+    )
 
 
 # Main method
 if __name__ == "__main__":
     # Setting up the command line args
-    parser = argparse.ArgumentParser(description="Copy files from one directory to another optionally given a file type")
-    parser.add_argument("source_folder", help="Path to the source folder")
-    parser.add_argument("destination_folder", help="Path to the destination folder")
-    parser.add_argument("--workers", type=int, default=4, help="Number of threads used in the copying process")
+    parser = argparse.ArgumentParser(description="Copy photos and other files from one directory tree to another, optionally filtered by capture date and file type")
+    parser.add_argument("source_folder", help="Path to the source folder (scanned recursively)")
+    parser.add_argument("destination_folders", nargs="+", help="Path to the destination folder (several: every file is read once and written to all of them)")
+    parser.add_argument("--workers", type=parse_workers, default=4, help="Highest number of copies in flight, every device gets its own limit (or 'auto' to let the adaptive controller pick it)")
     parser.add_argument("--file_type", help="Specify what files you want to copy")
-    parser.add_argument("--start_date", help="Date to specify which files to copy (After or on that day)")
-    parser.add_argument("--end_date", help="Date to specify which files to copy(Before or on that day)")
+    parser.add_argument("--start_date", help="Copy files taken on or after this day (YYYY-MM-DD)")
+    parser.add_argument("--end_date", help="Copy files taken on or before this day (YYYY-MM-DD)")
+    parser.add_argument("--max_depth", type=int, help="How many levels of sub folders to descend into (default: all)")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Capture date index cache, so unchanged files aren't read again")
+    parser.add_argument("--no_index", action="store_true", help="Don't use the capture date index cache")
+    parser.add_argument("--no_checksums", action="store_true", help="Don't hash the files (saves the extra read of the source after a reflink/copy_file_range copy)")
+    parser.add_argument("--verify", action="store_true", help="Re-read every copied file and compare it with its checksum")
+    parser.add_argument("--dry-run", action="store_true", help="Only print which files would be copied, skipped or renamed")
+    parser.add_argument("--watch", action="store_true", help="Keep running and copy new files as they land in the source (until Ctrl+C)")
+    parser.add_argument("--debounce", type=float, help="With --watch: seconds a new file has to stay untouched before it is copied")
+    parser.add_argument("--poll", action="store_true", help="With --watch: poll the source instead of using inotify (e.g. network shares)")
+    parser.add_argument("--json", action="store_true", help="Print the plan/result as JSON on stdout (progress goes to stderr)")
+    parser.add_argument("--metrics", help="Append JSON lines with the transfer metrics to this file")
     args = parser.parse_args()
 
     # Parse the date if needed
     start_date = datetime.strptime(args.start_date, "%Y-%m-%d") if args.start_date else None
-    print(start_date)
     end_date = datetime.strptime(args.end_date, "%Y-%m-%d") if args.end_date else None
-    print(end_date)
 
-    # Run the function given the command line args
-    copy_files(args.source_folder, args.destination_folder, max_workers=args.workers, file_type=args.file_type, start_date=start_date, end_date=end_date)
-    print("Finished transferring all files")
\ No newline at end of file
+    # With --json only the JSON document goes to stdout
+    log = sys.stderr if args.json else sys.stdout
+    progress = TransferProgress([ConsoleRenderer(stream=log)])
+    metrics = JsonLinesSink(args.metrics) if args.metrics else None
+    if metrics is not None:
+        progress.add_listener(metrics)
+
+    failed = False
+    try:
+        with (nullcontext() if args.no_index else DateIndex(args.index)) as index, redirect_stdout(log):
+            if args.dry_run:
+                plans = dry_run(args.source_folder, args.destination_folders, args.file_type, start_date, end_date, index, args.max_depth)
+                if not args.json:
+                    for folder, plan in plans.items():
+                        if len(plans) > 1:
+                            print(f"Destination {folder}:")
+                        plan.print_report()
+                # A single destination keeps the 'plan' document, several get one plan per destination
+                if len(plans) == 1:
+                    output = {'plan': next(iter(plans.values())).to_dict()}
+                else:
+                    output = {'plans': {folder: plan.to_dict() for folder, plan in plans.items()}}
+            elif args.watch:
+                latency = watch_source(
+                    args.source_folder, args.destination_folders, args.workers, args.file_type, start_date, end_date,
+                    not args.no_checksums, progress, args.debounce, args.poll
+                )
+                snapshot = progress.snapshot()
+                failed = snapshot['failed_files'] > 0
+                output = {'latency': latency, 'progress': snapshot}
+            else:
+                result = transfer(
+                    args.source_folder, args.destination_folders, args.workers, args.file_type, start_date, end_date, index,
+                    args.max_depth, not args.no_checksums, args.verify, progress
+                )
+                snapshot = progress.snapshot()
+                failed = snapshot['failed_files'] > 0
+                output = {
+                    'scanned': result.scanned,
+                    'matched': result.matched,
+                    'dates': {date_taken.isoformat(): count for date_taken, count in sorted(result.date_counts.items())},
+                    'progress': snapshot,
+                }
+    except RuntimeError as e:
+        # Failed verification
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if metrics is not None:
+            metrics.close()
+
+    if args.json:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+    elif not args.dry_run:
+        print("Finished transferring all files")
+
+    # A non-zero exit code lets cron/monitoring pick up runs with failed files
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,171 @@
+import os, threading
+from typing import Dict, List
+from journal import JOURNAL_NAME, TransferJournal
+from manifest import MANIFEST_NAME, Manifest, files_match, stats_match
+
+# Plan categories
+NEW = 'new'
+IDENTICAL = 'identical'
+CONFLICTING = 'conflicting'
+MISSING = 'missing'
+CATEGORIES = [NEW, IDENTICAL, CONFLICTING, MISSING]
+
+
+class DestinationListing:
+    """
+    Snapshot of a destination folder taken with a single scandir pass (name -> stat result), used to decide
+    what to do with every source file without touching the destination again.
+
+    Names handed out by classify() are claimed, so two source files with the same name in one run can't end
+    up writing to the same destination file.
+
+    Parameters:
+        destination_folder (str): Folder the files are copied to (it doesn't have to exist yet).
+    """
+
+    def __init__(self, destination_folder: str):
+        self.destination_folder = destination_folder
+        self.entries = {}
+        # Names that can't be written to (sub folders, and names claimed by this run)
+        self._taken = set()
+        self._lock = threading.Lock()
+
+        try:
+            with os.scandir(destination_folder) as entries:
+                for entry in entries:
+                    # Our own bookkeeping files and unfinished temp files aren't part of the destination's content
+                    if entry.name in (JOURNAL_NAME, MANIFEST_NAME) or entry.name.endswith('.part'):
+                        continue
+                    try:
+                        if entry.is_file():
+                            self.entries[entry.name] = entry.stat()
+                        else:
+                            self._taken.add(entry.name)
+                    except OSError:
+                        self._taken.add(entry.name)
+        except FileNotFoundError:
+            pass
+
+    def classify(self, source_path: str, source_stat: os.stat_result = None, manifest: Manifest = None, journal: TransferJournal = None) -> tuple:
+        """
+        Decides what to do with a source file and returns (category, destination name, size).
+
+        new files keep their name, identical files are already in the destination, conflicting files
+        (same name, different content) get a free 'name_N.ext' name and missing files no longer exist
+        in the source. Only a size tie with different modification times needs the content to be hashed.
+        Files the journal saw complete on an earlier run count as identical as long as their copy is still there
+        and the source hasn't changed since (same size and mtime), otherwise they are compared like any other file.
+        """
+        name = os.path.basename(source_path)
+        if source_stat is None:
+            try:
+                source_stat = os.stat(source_path)
+            except OSError:
+                return MISSING, None, 0
+
+        completed_name = journal.completed_name(source_path, source_stat) if journal is not None else None
+        if completed_name is not None and completed_name in self.entries:
+            return IDENTICAL, completed_name, source_stat.st_size
+
+        with self._lock:
+            existing = self.entries.get(name)
+            if existing is None and name not in self._taken:
+                self._taken.add(name)
+                return NEW, name, source_stat.st_size
+            match = stats_match(source_stat, existing) if existing is not None and name not in self._taken else False
+
+        # Hashing happens outside the lock (it reads both files)
+        if match is None:
+            try:
+                match = files_match(source_path, os.path.join(self.destination_folder, name), manifest, source_stat, existing)
+            except OSError:
+                match = False
+        if match:
+            return IDENTICAL, name, source_stat.st_size
+
+        return CONFLICTING, self._claim_unique(name), source_stat.st_size
+
+    # Helper method to find and claim a free name for a file whose name is taken ('name_1.ext', 'name_2.ext', ...)
+    def _claim_unique(self, name: str) -> str:
+        base_name, ext = os.path.splitext(name)
+        counter = 1
+        with self._lock:
+            while True:
+                candidate = f"{base_name}_{counter}{ext}"
+                if candidate not in self.entries and candidate not in self._taken:
+                    self._taken.add(candidate)
+                    return candidate
+                counter += 1
+
+
+class SyncPlan:
+    """
+    Result of diffing a source selection against a destination listing: for every category the
+    (source path, destination name, size) of its files and the total number of bytes.
+    """
+
+    def __init__(self):
+        self.files = {category: [] for category in CATEGORIES}
+        self.bytes = {category: 0 for category in CATEGORIES}
+
+    def add(self, category: str, source_path: str, name: str, size: int) -> None:
+        self.files[category].append((source_path, name, size))
+        self.bytes[category] += size
+
+    @property
+    def to_copy(self) -> List[tuple]:
+        """The files that have to be copied (new and conflicting ones), with their destination names."""
+        return self.files[NEW] + self.files[CONFLICTING]
+
+    def summary(self) -> str:
+        return ', '.join(f"{len(self.files[category])} {category} ({self.bytes[category] / 1e6:.1f} MB)" for category in CATEGORIES)
+
+    def to_dict(self) -> Dict[str, dict]:
+        return {
+            category: {
+                'files': len(self.files[category]),
+                'bytes': self.bytes[category],
+                'paths': [{'source': source_path, 'name': name, 'size': size} for source_path, name, size in self.files[category]],
+            }
+            for category in CATEGORIES
+        }
+
+    def print_report(self, limit: int = 20) -> None:
+        """Prints the plan (dry run report) with up to limit files per category."""
+        print(f"Plan: {self.summary()}")
+        for category in CATEGORIES:
+            for source_path, name, size in self.files[category][:limit]:
+                target = f" -> {name}" if category == CONFLICTING else ''
+                print(f"  {category:<11} {source_path}{target} ({size / 1e6:.1f} MB)")
+            if len(self.files[category]) > limit:
+                print(f"  ... and {len(self.files[category]) - limit} more {category} files")
+
+
+def plan_sync(source_paths: List[str], destination_folder: str, manifest: Manifest = None, source_stats: dict = None,
+              listing: DestinationListing = None, journal: TransferJournal = None) -> SyncPlan:
+    """
+    Lists the destination once and classifies every source file as new, identical, conflicting or missing.
+
+    Parameters:
+        source_paths (List[str]): Full paths of the selected source files.
+        destination_folder (str): Folder the files are copied to.
+        manifest (Manifest): Checksum manifest of the destination (saves hashing the destination file on a size tie).
+        source_stats (dict): Stat results of the source files already fetched by a scan (path -> os.stat_result), filled
+            with the ones fetched here so the copy doesn't stat the files again.
+        listing (DestinationListing): Listing to reuse instead of scanning the destination.
+        journal (TransferJournal): Journal of the destination (files it saw complete are identical).
+    """
+    listing = listing or DestinationListing(destination_folder)
+    source_stats = {} if source_stats is None else source_stats
+    plan = SyncPlan()
+    for source_path in source_paths:
+        source_stat = source_stats.get(source_path)
+        if source_stat is None:
+            try:
+                source_stat = source_stats[source_path] = os.stat(source_path)
+            except OSError:
+                # classify reports it as missing
+                pass
+        category, name, size = listing.classify(source_path, source_stat, manifest, journal)
+        plan.add(category, source_path, name, size)
+    return plan
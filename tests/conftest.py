@@ -0,0 +1,16 @@
+import os, sys
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Helper method to write a small JPEG, with a DateTimeOriginal if date_taken ('YYYY:MM:DD HH:MM:SS') is given
+def write_jpeg(path: str, date_taken: str = None) -> str:
+    from PIL import Image
+
+    exif = Image.Exif()
+    if date_taken is not None:
+        # DateTimeOriginal lives in the Exif IFD
+        exif.get_ifd(0x8769)[0x9003] = date_taken
+    Image.new('RGB', (16, 16), (200, 100, 50)).save(path, format='JPEG', exif=exif.tobytes())
+    return path
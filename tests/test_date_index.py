@@ -0,0 +1,48 @@
+import os
+from datetime import date
+from date_index import DateIndex
+
+
+# Helper method to write a file with a given modification time
+def write(path: str, data: bytes, mtime_ns: int = 1_700_000_000_000_000_000) -> str:
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+def test_rescan_only_misses_new_or_changed_files(tmp_path):
+    photos = tmp_path / 'photos'
+    photos.mkdir()
+    dated = write(str(photos / 'dated.jpg'), b'dated')
+    undated = write(str(photos / 'undated.jpg'), b'undated')
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        index.store(dated, date(2024, 6, 1))
+        index.store(undated, None)
+
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        index.preload(str(photos))
+        assert index.lookup(dated) == (True, date(2024, 6, 1))
+        # A file without a capture date is a hit too, so it isn't read again
+        assert index.lookup(undated) == (True, None)
+        # Edited in place (same size, new mtime)
+        write(dated, b'DATED', 1_700_000_010_000_000_000)
+        assert index.lookup(dated) == (False, None)
+        assert index.lookup(write(str(photos / 'new.jpg'), b'new')) == (False, None)
+        assert (index.hits, index.misses) == (2, 2)
+
+
+def test_prune_and_invalidate(tmp_path):
+    photos = tmp_path / 'photos'
+    photos.mkdir()
+    kept = write(str(photos / 'kept.jpg'), b'kept')
+    deleted = write(str(photos / 'deleted.jpg'), b'deleted')
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        index.store(kept, date(2024, 6, 1))
+        index.store(deleted, date(2024, 6, 2))
+        os.remove(deleted)
+
+        assert index.prune(str(photos)) == 1
+        assert index.stats()['entries'] == 1
+        assert index.invalidate(str(photos)) == 1
+        assert index.lookup(kept) == (False, None)
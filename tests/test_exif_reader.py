@@ -0,0 +1,109 @@
+import struct
+from datetime import date
+import pytest
+from exif_reader import DATE_TIME_ORIGINAL, EXIF_IFD_POINTER, _RAF_JPEG_POINTER, _RAF_MAGIC, ExifParseError, read_date_taken, read_raw_date_taken
+
+DATE_VALUE = b'2023:07:14 09:30:00\x00'
+
+
+# Helper method to build a TIFF structure (IFD0 -> ExifIFD -> DateTimeOriginal) with the given byte order and magic number
+def build_tiff(endian: str = '<', magic: int = 42, date_value: bytes = DATE_VALUE) -> bytes:
+    exif_offset = 8 + 2 + 12 + 4
+    data_offset = exif_offset + 2 + 12 + 4
+    ifd0 = struct.pack(endian + 'H', 1) + struct.pack(endian + 'HHII', EXIF_IFD_POINTER, 4, 1, exif_offset) + struct.pack(endian + 'I', 0)
+    if date_value is None:
+        exif_ifd = struct.pack(endian + 'H', 0) + struct.pack(endian + 'I', 0) + bytes(12)
+    else:
+        exif_ifd = struct.pack(endian + 'H', 1) + struct.pack(endian + 'HHII', DATE_TIME_ORIGINAL, 2, len(date_value), data_offset) + struct.pack(endian + 'I', 0)
+    order = b'II' if endian == '<' else b'MM'
+    return order + struct.pack(endian + 'HI', magic, 8) + ifd0 + exif_ifd + (date_value or b'')
+
+
+# Helper method to wrap a TIFF structure in the APP1 Exif segment of a (header only) JPEG
+def build_jpeg(tiff: bytes) -> bytes:
+    app1 = b'Exif\x00\x00' + tiff
+    return b'\xff\xd8' + b'\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1 + b'\xff\xda\x00\x02'
+
+
+# Helper method to build a Fujifilm RAF: magic, padding, then the offset/length of the embedded JPEG at byte 84
+def build_raf(jpeg: bytes) -> bytes:
+    jpeg_offset = 100
+    header = _RAF_MAGIC + b'0201FF383501'.ljust(_RAF_JPEG_POINTER - 16, b'\x00')
+    header += struct.pack('>II', jpeg_offset, len(jpeg))
+    return header.ljust(jpeg_offset, b'\x00') + jpeg
+
+
+def write(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize('name, endian, magic', [
+    ('IMG_0001.CR2', '<', 42),
+    ('DSC_0001.NEF', '<', 42),
+    ('DSC_0002.NEF', '>', 42),
+    ('DSC00001.ARW', '<', 42),
+    ('P0000001.ORF', '<', 0x4F52),
+    ('P0000002.ORF', '>', 0x4F52),
+    ('P0000003.ORF', '<', 0x5352),
+    ('P1000001.RW2', '<', 0x55),
+])
+def test_tiff_based_raw(tmp_path, name, endian, magic):
+    path = write(tmp_path, name, build_tiff(endian, magic))
+    assert read_raw_date_taken(path) == date(2023, 7, 14)
+
+
+def test_orf_magic_bytes(tmp_path):
+    # Olympus writes the magic as the characters 'RO' (IIRO) / 'OR' (MMOR)
+    little = write(tmp_path, 'little.ORF', build_tiff('<', 0x4F52))
+    big = write(tmp_path, 'big.ORF', build_tiff('>', 0x4F52))
+    assert open(little, 'rb').read(4) == b'IIRO'
+    assert open(big, 'rb').read(4) == b'MMOR'
+    assert read_raw_date_taken(little) == read_raw_date_taken(big) == date(2023, 7, 14)
+
+
+def test_raf(tmp_path):
+    path = write(tmp_path, 'DSCF0001.RAF', build_raf(build_jpeg(build_tiff('>'))))
+    assert read_raw_date_taken(path) == date(2023, 7, 14)
+
+
+def test_raf_without_exif(tmp_path):
+    path = write(tmp_path, 'DSCF0002.RAF', build_raf(b'\xff\xd8\xff\xda\x00\x02'))
+    assert read_raw_date_taken(path) is None
+
+
+def test_raw_without_date_time_original(tmp_path):
+    path = write(tmp_path, 'IMG_0002.CR2', build_tiff('<', 42, None))
+    assert read_raw_date_taken(path) is None
+
+
+def test_blank_date(tmp_path):
+    path = write(tmp_path, 'IMG_0003.CR2', build_tiff('<', 42, b'    :  :     :  :  \x00'))
+    assert read_raw_date_taken(path) is None
+
+
+@pytest.mark.parametrize('name, data', [
+    # Cut off inside IFD0
+    ('truncated.NEF', build_tiff('>')[:14]),
+    # Cut off before the RAF's JPEG pointer
+    ('truncated.RAF', build_raf(build_jpeg(build_tiff('>')))[:60]),
+    # Unknown magic number
+    ('magic.RW2', build_tiff('<', 0x1234)),
+    # Not a TIFF or RAF at all
+    ('garbage.ARW', b'\x00' * 64),
+    # IFD0 points past the end of the file
+    ('pointer.CR2', b'II' + struct.pack('<HI', 42, 0xFFFF)),
+])
+def test_corrupt_raw_falls_back(tmp_path, name, data):
+    # ExifParseError tells the caller to hand the file to exiftool
+    with pytest.raises(ExifParseError):
+        read_raw_date_taken(write(tmp_path, name, data))
+
+
+def test_jpeg_and_tiff(tmp_path):
+    assert read_date_taken(write(tmp_path, 'a.jpg', build_jpeg(build_tiff('>')))) == date(2023, 7, 14)
+    assert read_date_taken(write(tmp_path, 'b.tif', build_tiff('<'))) == date(2023, 7, 14)
+    # The vendor magic numbers are only accepted for RAW files
+    with pytest.raises(ExifParseError):
+        read_date_taken(write(tmp_path, 'c.tif', build_tiff('<', 0x55)))
@@ -0,0 +1,17 @@
+from exiftool_pool import ExifToolPool
+
+
+def test_interleaved_calls_only_get_their_own_files(monkeypatch):
+    # A stand-in for exiftool that returns the paths it was given
+    monkeypatch.setattr(ExifToolPool, '_run_chunk', lambda self, chunk: [{'SourceFile': path} for path in chunk])
+
+    with ExifToolPool(workers=2, chunk_size=2) as pool:
+        first = pool.iter_metadata(f'a{i}' for i in range(9))
+        second = pool.iter_metadata(f'b{i}' for i in range(7))
+        # Both calls have chunks in flight at once
+        results = {'a': [next(first)['SourceFile']], 'b': [next(second)['SourceFile']]}
+        results['a'] += [data['SourceFile'] for data in first]
+        results['b'] += [data['SourceFile'] for data in second]
+
+    assert sorted(results['a']) == [f'a{i}' for i in range(9)]
+    assert sorted(results['b']) == [f'b{i}' for i in range(7)]
@@ -0,0 +1,168 @@
+import os
+from datetime import date
+import pytest
+import copy_backends
+from file_transfer import copy_file, copy_files
+from journal import TransferJournal, _write_all as write_all
+from manifest import new_hasher
+from progress import TransferProgress
+
+
+# Helper method to write a file with a given modification time (edits are dated 10s later, past the FAT mtime tolerance)
+def write(path: str, data: bytes, mtime_ns: int) -> str:
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+# Helper method to copy the files with copy_files and return the snapshot of the run
+def transfer(source_folder: str, destination_folders, files: list) -> dict:
+    progress = TransferProgress([])
+    copy_files({date(2024, 6, 1): files}, source_folder, destination_folders, max_workers=2, progress=progress)
+    return progress.snapshot()
+
+
+# Helper method to read the files of a destination (without the journal and manifest)
+def contents(folder: str) -> dict:
+    return {name: open(os.path.join(folder, name), 'rb').read() for name in os.listdir(folder) if not name.startswith('.')}
+
+
+@pytest.fixture
+def folders(tmp_path):
+    source = tmp_path / 'source'
+    source.mkdir()
+    return str(source), str(tmp_path / 'destination')
+
+
+def test_rerun_skips_unchanged_files(folders):
+    source, destination = folders
+    note = write(os.path.join(source, 'note.txt'), b'v1', 1_700_000_000_000_000_000)
+
+    assert transfer(source, destination, [note])['copied_files'] == 1
+    snapshot = transfer(source, destination, [note])
+    assert (snapshot['copied_files'], snapshot['skipped_files']) == (0, 1)
+
+
+@pytest.mark.parametrize('edit', [b'v2', b'v1v2'])
+def test_rerun_copies_edited_source(folders, edit):
+    source, destination = folders
+    note = write(os.path.join(source, 'note.txt'), b'v1', 1_700_000_000_000_000_000)
+    transfer(source, destination, [note])
+
+    # Same size or not, the edit has to reach the destination (the first copy is kept under its name)
+    write(note, edit, 1_700_000_010_000_000_000)
+    snapshot = transfer(source, destination, [note])
+    assert (snapshot['copied_files'], snapshot['skipped_files']) == (1, 0)
+    assert sorted(contents(destination).values()) == sorted([b'v1', edit])
+
+
+def test_copy_file_checks_the_journal_against_the_source(folders):
+    source, destination = folders
+    os.makedirs(destination)
+    note = write(os.path.join(source, 'note.txt'), b'v1', 1_700_000_000_000_000_000)
+
+    with TransferJournal(destination) as journal:
+        assert copy_file(note, source, destination, journal) is not None
+        assert copy_file(note, source, destination, journal) is None
+        write(note, b'v2', 1_700_000_010_000_000_000)
+        assert copy_file(note, source, destination, journal) is not None
+    assert sorted(contents(destination).values()) == [b'v1', b'v2']
+
+
+def test_journal_keeps_the_source_stat_across_compaction(folders):
+    source, destination = folders
+    os.makedirs(destination)
+    note = write(os.path.join(source, 'note.txt'), b'v1', 1_700_000_000_000_000_000)
+
+    with TransferJournal(destination) as journal:
+        journal.mark_done(note, 'note.txt', os.stat(note))
+        journal.compact()
+    with TransferJournal(destination) as journal:
+        assert journal.completed_name(note, os.stat(note)) == 'note.txt'
+        write(note, b'v2', 1_700_000_010_000_000_000)
+        assert journal.completed_name(note, os.stat(note)) is None
+
+
+def test_fanout_resumes_large_files(folders, monkeypatch):
+    source, destination = folders
+    second = destination + '2'
+    video = write(os.path.join(source, 'clip.mov'), bytes(range(256)) * 64, 1_700_000_000_000_000_000)
+    # Every file counts as large, copied in 1 KB chunks
+    monkeypatch.setattr('file_transfer.RESUME_THRESHOLD', 1)
+    monkeypatch.setattr('journal.CHUNK_SIZE', 1024)
+
+    # The second destination is unplugged after 3 chunks, the source is read once for both destinations
+    written = []
+    opened = []
+
+    def unplug(output, data):
+        if output.name.startswith(second):
+            written.append(len(data))
+            if len(written) > 3:
+                raise OSError('unplugged')
+        write_all(output, data)
+
+    def count_open(path, *args, **kwargs):
+        opened.append(path)
+        return open(path, *args, **kwargs)
+
+    monkeypatch.setattr('journal._write_all', unplug)
+    monkeypatch.setattr('journal.open', count_open, raising=False)
+    snapshot = transfer(source, [destination, second], [video])
+    assert (snapshot['copied_files'], snapshot['failed_files']) == (1, 1)
+    assert opened.count(video) == 1
+
+    monkeypatch.setattr('journal._write_all', write_all)
+    snapshot = transfer(source, [destination, second], [video])
+    assert (snapshot['copied_files'], snapshot['skipped_files']) == (1, 1)
+    assert snapshot['backends'] == {'resumed': 1}
+    assert contents(destination) == contents(second) == {'clip.mov': open(video, 'rb').read()}
+
+
+def test_failed_copy_leaves_no_temp_file(folders, monkeypatch):
+    source, destination = folders
+    os.makedirs(destination)
+    note = write(os.path.join(source, 'note.txt'), b'v1', 1_700_000_000_000_000_000)
+
+    # The destination goes read-only halfway through the copy
+    def fail(source_path, temp_path, **kwargs):
+        with open(temp_path, 'wb') as f:
+            f.write(b'v')
+        raise PermissionError(temp_path)
+
+    monkeypatch.setattr('file_transfer.copy_file_fast', fail)
+    with TransferJournal(destination) as journal:
+        assert copy_file(note, source, destination, journal) is None
+    assert os.listdir(destination) == ['.file_transfer_journal.jsonl']
+
+
+def test_copy_is_flushed_before_and_after_the_rename(folders, monkeypatch):
+    source, destination = folders
+    os.makedirs(destination)
+    note = write(os.path.join(source, 'note.txt'), b'v1', 1_700_000_000_000_000_000)
+
+    flushed = []
+    monkeypatch.setattr('file_transfer._fsync_path', lambda path: flushed.append((path, sorted(os.listdir(destination)))))
+    copy_file(note, source, destination)
+    # The temp file is flushed under its temp name, then the folder once the file has its final name
+    assert flushed == [(os.path.join(destination, '.note.txt.part'), ['.note.txt.part']), (destination, ['note.txt'])]
+
+
+def test_hashed_copy_keeps_the_kernel_side_backend(tmp_path, monkeypatch):
+    data = os.urandom(3 * 1024 * 1024)
+    source = write(str(tmp_path / 'IMG_0001.CR2'), data, 1_700_000_000_000_000_000)
+    destination = str(tmp_path / 'copy.CR2')
+
+    # A reflink that works on any file system (the data never goes through the hasher while it is copied)
+    def reflink(src, dst):
+        dst.write(src.read())
+    monkeypatch.setitem(copy_backends._BACKEND_FUNCTIONS, copy_backends.BACKEND_REFLINK, reflink)
+    monkeypatch.setattr(copy_backends, '_candidate_backends', lambda *pair: list(copy_backends.BACKENDS))
+
+    hasher = new_hasher()
+    assert copy_backends.copy_file_fast(source, destination, hasher=hasher) == 'reflink+hash'
+    expected = new_hasher()
+    expected.update(data)
+    assert hasher.hexdigest() == expected.hexdigest()
+    assert open(destination, 'rb').read() == data
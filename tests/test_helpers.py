@@ -0,0 +1,74 @@
+from datetime import date
+import threading
+import helpers
+from date_index import DateIndex
+from conftest import write_jpeg
+
+
+def test_index_records_undated_images_but_not_unreadable_ones(tmp_path):
+    source = tmp_path / 'source'
+    source.mkdir()
+    dated = write_jpeg(str(source / 'dated.jpg'), '2024:06:01 10:00:00')
+    undated = write_jpeg(str(source / 'undated.jpg'))
+    truncated = str(source / 'truncated.jpg')
+    with open(truncated, 'wb') as f:
+        f.write(b'\xff\xd8\xff\xe1\x00\x40Exif\x00\x00II*\x00')
+
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        date_map = helpers.get_creation_dates_for_directory(str(source), index)
+    assert date_map == {date(2024, 6, 1): [dated]}
+
+    # What the next scan finds in the index
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        assert index.lookup(dated) == (True, date(2024, 6, 1))
+        # No DateTimeOriginal is a result worth caching, a file that couldn't be read is read again next time
+        assert index.lookup(undated) == (True, None)
+        assert index.lookup(truncated) == (False, None)
+
+
+def test_index_skips_images_that_raise(tmp_path, monkeypatch):
+    source = tmp_path / 'source'
+    source.mkdir()
+    locked = write_jpeg(str(source / 'locked.jpg'), '2024:06:01 10:00:00')
+    raw = str(source / 'locked.nef')
+    with open(raw, 'wb') as f:
+        f.write(b'II*\x00')
+
+    readable = write_jpeg(str(source / 'readable.jpg'), '2024:06:02 10:00:00')
+
+    get_image_date_taken = helpers.get_image_date_taken
+    def locked_out(file_path):
+        if file_path == locked:
+            raise PermissionError(13, 'Permission denied', file_path)
+        return get_image_date_taken(file_path)
+    monkeypatch.setattr(helpers, 'get_image_date_taken', locked_out)
+
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        assert helpers.get_creation_dates_for_directory(str(source), index) == {date(2024, 6, 2): [readable]}
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        # Neither the image nor its RAW file is cached as undated
+        assert index.lookup(locked) == (False, None)
+        assert index.lookup(raw) == (False, None)
+        assert index.lookup(readable) == (True, date(2024, 6, 2))
+
+
+def test_cancelled_scan_caches_nothing(tmp_path, monkeypatch):
+    source = tmp_path / 'source'
+    source.mkdir()
+    first = write_jpeg(str(source / 'first.jpg'), '2024:06:01 10:00:00')
+    second = write_jpeg(str(source / 'second.jpg'), '2024:06:02 10:00:00')
+
+    # The Cancel button is pressed while the images are read
+    cancel = threading.Event()
+    get_image_date_taken = helpers.get_image_date_taken
+    def cancelled_while_reading(file_path):
+        cancel.set()
+        return get_image_date_taken(file_path)
+    monkeypatch.setattr(helpers, 'get_image_date_taken', cancelled_while_reading)
+
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        assert helpers.get_creation_dates_for_directory(str(source), index, cancel=cancel) == {}
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        # Images the cancelled scan never merged aren't cached as undated
+        assert index.lookup(first) == (False, None)
+        assert index.lookup(second) == (False, None)
@@ -0,0 +1,81 @@
+import os, queue, threading, time
+import pytest
+import io_scheduler
+from concurrency import run_adaptive
+from io_scheduler import DEVICE_REMOVABLE, DEVICE_ROTATIONAL, DEVICE_SSD, DEVICE_UNKNOWN, device_limit, run_scheduled
+
+
+@pytest.mark.parametrize('kind, max_workers, expected', [
+    (DEVICE_ROTATIONAL, 16, 1),
+    (DEVICE_REMOVABLE, 16, 2),
+    (DEVICE_REMOVABLE, 1, 1),
+    # SSDs and devices that aren't positively identified (network shares, virtual disks) use max_workers
+    (DEVICE_SSD, 16, 16),
+    (DEVICE_UNKNOWN, 16, 16),
+    (DEVICE_UNKNOWN, 2, 2),
+])
+def test_device_limit(monkeypatch, kind, max_workers, expected):
+    monkeypatch.setattr(io_scheduler, 'device_kind', lambda device: kind)
+    assert device_limit(1234, max_workers) == expected
+
+
+@pytest.mark.parametrize('kind, expected', [(DEVICE_ROTATIONAL, 1), (DEVICE_UNKNOWN, 6)])
+def test_run_scheduled_copies_in_flight(tmp_path, monkeypatch, kind, expected):
+    monkeypatch.setattr(io_scheduler, 'device_kind', lambda device: kind)
+    files = []
+    for i in range(12):
+        path = tmp_path / f'{i}.bin'
+        path.write_bytes(b'x')
+        files.append(str(path))
+
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def copy(file_path):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return os.path.basename(file_path)
+
+    results = run_scheduled(copy, files, str(tmp_path), max_workers=6)
+    assert sorted(results) == sorted(os.path.basename(path) for path in files)
+    assert peak == expected
+
+
+@pytest.mark.parametrize('scheduler', ['scheduled', 'adaptive'])
+def test_streamed_files_are_copied_as_they_arrive(tmp_path, scheduler):
+    files = queue.Queue()
+    copied = []
+
+    # The files trickle in from another thread, the end of the stream is marked with None
+    def produce():
+        for i in range(20):
+            path = tmp_path / f'{i}.bin'
+            path.write_bytes(b'x')
+            files.put(str(path))
+            time.sleep(0.005)
+        files.put(None)
+
+    def stream():
+        while True:
+            file_path = files.get()
+            if file_path is None:
+                return
+            yield file_path
+
+    def copy(file_path):
+        copied.append(file_path)
+        return os.path.basename(file_path)
+
+    threading.Thread(target=produce).start()
+    if scheduler == 'scheduled':
+        results = run_scheduled(copy, stream(), str(tmp_path), max_workers=4)
+    else:
+        results = run_adaptive(copy, stream())
+    assert sorted(results) == sorted(f'{i}.bin' for i in range(20))
+    assert len(copied) == 20
@@ -0,0 +1,49 @@
+import os
+from datetime import date
+import pytest
+import pipeline
+from conftest import write_jpeg
+from date_index import DateIndex
+from progress import TransferProgress
+
+
+@pytest.mark.parametrize('workers, scheduler', [(4, 'run_scheduled'), ('auto', 'run_adaptive')])
+def test_ingest_dispatches_copies_like_copy_files(tmp_path, monkeypatch, workers, scheduler):
+    source = tmp_path / 'source'
+    (source / 'DCIM').mkdir(parents=True)
+    for i in range(5):
+        write_jpeg(str(source / 'DCIM' / f'IMG_{i:04d}.jpg'), '2024:06:01 10:00:00')
+
+    # Record which scheduler the copy stage goes through
+    used = []
+    original = getattr(pipeline, scheduler)
+
+    def spy(*args, **kwargs):
+        used.append(scheduler)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(pipeline, scheduler, spy)
+
+    progress = TransferProgress([])
+    result = pipeline.ingest(str(source), str(tmp_path / 'destination'), workers, progress=progress)
+    assert used == [scheduler]
+    assert result.matched == progress.snapshot()['copied_files'] == 5
+    assert sorted(name for name in os.listdir(tmp_path / 'destination') if not name.startswith('.')) == [f'IMG_{i:04d}.jpg' for i in range(5)]
+
+
+def test_ingest_dates_files_in_worker_processes(tmp_path):
+    source = tmp_path / 'source'
+    source.mkdir()
+    write_jpeg(str(source / 'june.jpg'), '2024:06:01 10:00:00')
+    write_jpeg(str(source / 'july.jpg'), '2024:07:01 10:00:00')
+    truncated = str(source / 'truncated.jpg')
+    with open(truncated, 'wb') as f:
+        f.write(b'\xff\xd8\xff\xe1\x00\x40Exif\x00\x00II*\x00')
+
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        result = pipeline.ingest(str(source), str(tmp_path / 'destination'), 2, start_date=date(2024, 6, 15), index=index,
+                                 progress=TransferProgress([]), extract_workers=2, processes=True)
+    assert result.date_counts == {date(2024, 6, 1): 1, date(2024, 7, 1): 1}
+    assert sorted(name for name in os.listdir(tmp_path / 'destination') if not name.startswith('.')) == ['july.jpg']
+    # The file the worker couldn't read isn't cached as undated
+    with DateIndex(str(tmp_path / 'index.sqlite3')) as index:
+        assert index.lookup(truncated) == (False, None)
@@ -0,0 +1,23 @@
+import os
+from scanner import KIND_IMAGE, KIND_OTHER, KIND_PAIRED_RAW, KIND_UNPAIRED_RAW, scan_directory
+
+
+def test_pairs_carry_both_stat_results(tmp_path):
+    for name in ('IMG_0001.JPG', 'IMG_0001.CR2', 'IMG_0002.NEF', 'notes.txt', '.hidden.jpg'):
+        (tmp_path / name).write_bytes(name.encode())
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'IMG_0003.jpg').write_bytes(b'x')
+
+    entries = {os.path.basename(entry.path): entry for entry in scan_directory(str(tmp_path))}
+    assert sorted(entries) == ['IMG_0001.CR2', 'IMG_0001.JPG', 'IMG_0002.NEF', 'IMG_0003.jpg', 'notes.txt']
+
+    image, raw = entries['IMG_0001.JPG'], entries['IMG_0001.CR2']
+    assert (image.kind, raw.kind) == (KIND_IMAGE, KIND_PAIRED_RAW)
+    assert (image.pair, raw.pair) == (raw.path, image.path)
+    # Every file is stat'd once by scandir, the other half of a pair comes with the entry
+    assert image.pair_stat == raw.stat == os.stat(raw.path)
+    assert raw.pair_stat == image.stat == os.stat(image.path)
+
+    assert entries['IMG_0002.NEF'].kind == KIND_UNPAIRED_RAW
+    assert entries['notes.txt'].kind == KIND_OTHER
+    assert entries['IMG_0003.jpg'].pair is entries['IMG_0003.jpg'].pair_stat is None
@@ -0,0 +1,34 @@
+import os
+from conftest import write_jpeg
+from progress import TransferProgress
+from standalone import dry_run, transfer
+
+
+def test_dry_run_plans_against_the_journal(tmp_path):
+    source = tmp_path / 'source'
+    for card in ('a', 'b'):
+        (source / card).mkdir(parents=True)
+    # Two files with the same name, the second one is copied under a new name
+    write_jpeg(str(source / 'a' / 'IMG_0001.jpg'), '2024:06:01 10:00:00')
+    second = write_jpeg(str(source / 'b' / 'IMG_0001.jpg'), '2024:06:01 11:00:00')
+    mtime_ns = os.stat(second).st_mtime_ns + 10_000_000_000
+    os.utime(second, ns=(mtime_ns, mtime_ns))
+    destination = str(tmp_path / 'destination')
+    transfer(str(source), [destination], 2, progress=TransferProgress([]))
+    listing = sorted(os.listdir(destination))
+
+    # The journal knows where both files went, so nothing is left to copy
+    plan = dry_run(str(source), [destination])[destination]
+    assert plan.to_copy == []
+    assert sorted(os.listdir(destination)) == listing
+
+
+def test_dry_run_leaves_a_new_destination_alone(tmp_path):
+    source = tmp_path / 'source'
+    source.mkdir()
+    write_jpeg(str(source / 'IMG_0001.jpg'), '2024:06:01 10:00:00')
+    destination = str(tmp_path / 'destination')
+
+    plan = dry_run(str(source), [destination])[destination]
+    assert [name for _, name, _ in plan.to_copy] == ['IMG_0001.jpg']
+    assert not os.path.exists(destination)
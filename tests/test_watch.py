@@ -0,0 +1,107 @@
+import os, sys, time, threading
+import pytest
+from conftest import write_jpeg
+from test_exif_reader import build_tiff
+from progress import TransferProgress
+from watch import watch
+
+# How long a test waits for the watch to copy a file before it gives up
+TIMEOUT = 10.0
+
+WATCHERS = [
+    pytest.param(True, id='polling'),
+    pytest.param(False, id='inotify', marks=pytest.mark.skipif(not sys.platform.startswith('linux'), reason="inotify is Linux only")),
+]
+
+
+# Helper method to read the files of a destination (without the journal and manifest)
+def contents(folder: str) -> dict:
+    if not os.path.isdir(folder):
+        return {}
+    return {name: open(os.path.join(folder, name), 'rb').read() for name in os.listdir(folder) if not name.startswith('.')}
+
+
+# Helper method to wait until a destination holds the given number of files
+def wait_for(folder: str, count: int) -> dict:
+    deadline = time.monotonic() + TIMEOUT
+    while len(contents(folder)) < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return contents(folder)
+
+
+class Watch:
+    """Runs watch() in a thread until stop() is called, which returns the latency summary."""
+
+    def __init__(self, source_folder: str, destination_folder, polling: bool):
+        self.progress = TransferProgress([])
+        self.stop_event = threading.Event()
+        self.result = {}
+        kwargs = dict(progress=self.progress, stop=self.stop_event, debounce=0.05, polling=polling, poll_interval=0.1)
+        self.thread = threading.Thread(target=lambda: self.result.update(watch(source_folder, destination_folder, **kwargs)))
+        self.thread.start()
+        # The watcher lists the source when it starts, files written before that aren't new
+        time.sleep(0.3)
+
+    def stop(self) -> dict:
+        self.stop_event.set()
+        self.thread.join(TIMEOUT)
+        assert not self.thread.is_alive()
+        return self.result
+
+
+@pytest.fixture
+def folders(tmp_path):
+    source = tmp_path / 'source'
+    source.mkdir()
+    return str(source), str(tmp_path / 'destination')
+
+
+@pytest.mark.parametrize('polling', WATCHERS)
+def test_copies_new_files(folders, polling):
+    source, destination = folders
+    write_jpeg(os.path.join(source, 'before.jpg'), '2024:06:01 10:00:00')
+    running = Watch(source, destination, polling)
+
+    write_jpeg(os.path.join(source, 'IMG_0001.jpg'), '2024:06:01 10:00:00')
+    with open(os.path.join(source, 'IMG_0002.CR2'), 'wb') as f:
+        f.write(build_tiff())
+    # A folder created while watching is watched (and its files copied) too
+    os.makedirs(os.path.join(source, 'card', 'DCIM'))
+    with open(os.path.join(source, 'card', 'DCIM', 'notes.txt'), 'wb') as f:
+        f.write(b'notes')
+    copied = wait_for(destination, 3)
+    summary = running.stop()
+
+    assert sorted(copied) == ['IMG_0001.jpg', 'IMG_0002.CR2', 'notes.txt']
+    assert copied['IMG_0002.CR2'] == build_tiff()
+    assert summary['files'] == running.progress.snapshot()['copied_files'] == 3
+    assert 0 <= summary['p50_ms'] <= summary['p95_ms'] <= summary['max_ms']
+
+
+@pytest.mark.parametrize('polling', WATCHERS)
+def test_rewritten_file_is_copied_again(folders, polling):
+    source, destination = folders
+    running = Watch(source, destination, polling)
+
+    note = os.path.join(source, 'note.txt')
+    with open(note, 'wb') as f:
+        f.write(b'v1')
+    assert list(wait_for(destination, 1).values()) == [b'v1']
+
+    # The edit lands under a new name, the first copy is kept
+    with open(note, 'ab') as f:
+        f.write(b'v2')
+    mtime_ns = os.stat(note).st_mtime_ns + 10_000_000_000
+    os.utime(note, ns=(mtime_ns, mtime_ns))
+    copied = wait_for(destination, 2)
+    summary = running.stop()
+
+    assert sorted(copied.values()) == [b'v1', b'v1v2']
+    assert summary['files'] == 2
+
+
+def test_stop_without_new_files(folders):
+    source, destination = folders
+    running = Watch(source, destination, polling=True)
+    assert running.stop() == {'files': 0}
+    assert contents(destination) == {}
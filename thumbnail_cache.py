@@ -0,0 +1,238 @@
+import io, os, hashlib, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List
+from date_range_index import _get_extension
+
+# Default location of the on-disk thumbnail cache (next to the capture date index)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.file_transfer', 'thumbnails')
+
+# Bounding box of the thumbnails, and how many of them are kept in memory and (in bytes) on disk
+THUMBNAIL_SIZE = (160, 120)
+MEMORY_ITEMS = 512
+DISK_BYTES = 256 * 1024 * 1024
+
+# Number of threads generating thumbnails
+DEFAULT_WORKERS = 2
+
+# Only JPEGs can be decoded at a reduced scale (or carry an EXIF thumbnail), anything else would need a full decode
+PREVIEW_EXTENSIONS = {'jpg', 'jpeg'}
+
+# EXIF tags of the embedded thumbnail (offset from the TIFF header and length, in IFD1) and of the orientation
+JPEG_INTERCHANGE_FORMAT = 0x0201
+JPEG_INTERCHANGE_FORMAT_LENGTH = 0x0202
+ORIENTATION = 0x0112
+
+# Marks a file no thumbnail can be made for (so it isn't tried again)
+_NO_THUMBNAIL = b''
+
+
+# Helper method to pick the files of a date that can be previewed (the first count JPEGs)
+def pick_previews(paths: Iterable[str], count: int) -> List[str]:
+    previews = []
+    for path in paths:
+        if _get_extension(path) in PREVIEW_EXTENSIONS:
+            previews.append(path)
+            if len(previews) == count:
+                break
+    return previews
+
+
+# Helper method to get the thumbnail embedded in the EXIF data of an opened JPEG (None if there is none)
+def _embedded_thumbnail(img):
+    from PIL import ExifTags, Image
+
+    exif_data = img.info.get('exif')
+    if not exif_data:
+        return None
+    ifd1 = img.getexif().get_ifd(ExifTags.IFD.IFD1)
+    offset = ifd1.get(JPEG_INTERCHANGE_FORMAT)
+    length = ifd1.get(JPEG_INTERCHANGE_FORMAT_LENGTH)
+    if not offset or not length:
+        return None
+
+    # The offset is counted from the TIFF header, which follows the 'Exif\0\0' marker
+    start = 6 if exif_data.startswith(b'Exif\x00\x00') else 0
+    thumbnail = Image.open(io.BytesIO(exif_data[start + offset:start + offset + length]))
+    thumbnail.load()
+    return thumbnail
+
+
+def generate_thumbnail(path: str, size: tuple = THUMBNAIL_SIZE) -> bytes:
+    """
+    Makes a JPEG thumbnail of an image without decoding it at full resolution: the thumbnail embedded
+    in the EXIF data is used if there is one, otherwise the JPEG is decoded at 1/2, 1/4 or 1/8 scale
+    with Pillow's draft mode. Returns None for files that aren't JPEGs.
+
+    Parameters:
+        path (str): Path of the image.
+        size (tuple): Bounding box of the thumbnail (width, height).
+    """
+    from PIL import Image
+
+    with Image.open(path) as img:
+        if img.format != 'JPEG':
+            return None
+        thumbnail = _embedded_thumbnail(img)
+        if thumbnail is None:
+            img.draft('RGB', size)
+            thumbnail = img.copy()
+        orientation = img.getexif().get(ORIENTATION)
+
+    # The embedded thumbnail and the draft aren't rotated, apply the orientation of the photo
+    transpose = {
+        2: Image.Transpose.FLIP_LEFT_RIGHT, 3: Image.Transpose.ROTATE_180, 4: Image.Transpose.FLIP_TOP_BOTTOM,
+        5: Image.Transpose.TRANSPOSE, 6: Image.Transpose.ROTATE_270, 7: Image.Transpose.TRANSVERSE, 8: Image.Transpose.ROTATE_90,
+    }.get(orientation)
+    if transpose is not None:
+        thumbnail = thumbnail.transpose(transpose)
+
+    thumbnail = thumbnail.convert('RGB')
+    thumbnail.thumbnail(size)
+    output = io.BytesIO()
+    thumbnail.save(output, format='JPEG', quality=80)
+    return output.getvalue()
+
+
+class ThumbnailCache:
+    """
+    Two level LRU cache of image thumbnails (JPEG bytes): the most recently used ones in memory and
+    all of them on disk, keyed by path, size and modification time so edited files get a new thumbnail.
+    Thumbnails are generated by background threads, a cached one is returned without touching the image.
+
+    Parameters:
+        cache_dir (str): Folder of the on-disk cache (trimmed to max_disk_bytes, least recently used first).
+        size (tuple): Bounding box of the thumbnails (width, height).
+        memory_items (int): Number of thumbnails kept in memory.
+        max_disk_bytes (int): Size limit of the on-disk cache.
+        workers (int): Number of threads generating thumbnails.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, size: tuple = THUMBNAIL_SIZE, memory_items: int = MEMORY_ITEMS,
+                 max_disk_bytes: int = DISK_BYTES, workers: int = DEFAULT_WORKERS):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+        # Bumped by every prefetch, so the prefetch of an earlier scan stops
+        self._prefetch_generation = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._executor.submit(self.trim)
+
+    # Helper method to get the cache key of a file (None if it doesn't exist anymore)
+    def _key(self, path: str) -> str:
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return None
+        key = f"{path}|{stat_result.st_size}|{stat_result.st_mtime_ns}|{self.size[0]}x{self.size[1]}"
+        return hashlib.sha1(key.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    # Helper method to put a thumbnail in the memory cache (evicting the least recently used one)
+    def _remember(self, key: str, data: bytes) -> None:
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    # Helper method to look a key up in memory, then on disk
+    def _lookup(self, key: str) -> bytes:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+        disk_path = os.path.join(self.cache_dir, key + '.jpg')
+        try:
+            with open(disk_path, 'rb') as f:
+                data = f.read()
+            # The modification time is the LRU order of the on-disk cache
+            os.utime(disk_path)
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def get(self, path: str) -> bytes:
+        """Returns the cached thumbnail of a file, or None if it hasn't been generated yet (or can't be)."""
+        key = self._key(path)
+        data = self._lookup(key) if key is not None else None
+        return data or None
+
+    def load(self, path: str) -> bytes:
+        """Returns the thumbnail of a file, generating (and caching) it if needed. None if the file can't be previewed."""
+        key = self._key(path)
+        if key is None:
+            return None
+        data = self._lookup(key)
+        if data is not None:
+            return data or None
+
+        try:
+            data = generate_thumbnail(path, self.size) or _NO_THUMBNAIL
+        except Exception as e:
+            print(f"Error creating the thumbnail of {path}: {e}")
+            data = _NO_THUMBNAIL
+
+        self._remember(key, data)
+        if data:
+            # Write to a temp file first so a reader never sees half a thumbnail
+            disk_path = os.path.join(self.cache_dir, key + '.jpg')
+            try:
+                with open(disk_path + '.part', 'wb') as f:
+                    f.write(data)
+                os.replace(disk_path + '.part', disk_path)
+            except OSError as e:
+                print(f"Error writing the thumbnail of {path} to the cache: {e}")
+        return data or None
+
+    def request(self, path: str, callback: Callable[[str, bytes], None]) -> None:
+        """Generates the thumbnail of a file in the background and calls callback(path, data) from the worker thread."""
+        def run():
+            callback(path, self.load(path))
+        self._executor.submit(run)
+
+    def prefetch(self, paths: Iterable[str]) -> None:
+        """Generates the thumbnails of the files in the background (one worker, replaces an earlier prefetch)."""
+        with self._lock:
+            self._prefetch_generation += 1
+            generation = self._prefetch_generation
+
+        def run():
+            for path in paths:
+                if self._prefetch_generation != generation:
+                    return
+                self.load(path)
+        self._executor.submit(run)
+
+    def cancel_prefetch(self) -> None:
+        """Stops the running prefetch after the thumbnail it is working on (e.g. before a copy reads the same card)."""
+        with self._lock:
+            self._prefetch_generation += 1
+
+    def trim(self) -> None:
+        """Deletes the least recently used thumbnails until the on-disk cache is below max_disk_bytes."""
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries if entry.is_file()]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self.cancel_prefetch()
+        self._executor.shutdown(wait=False, cancel_futures=True)
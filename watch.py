@@ -0,0 +1,332 @@
+import os, sys, time, select, struct, statistics, threading
+import ctypes, ctypes.util
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import List
+import helpers
+from exiftool_pool import ExifToolPool
+from file_transfer import DestinationSet
+from pipeline import CaptureFilter, date_file
+from progress import FINISHED, ConsoleRenderer, TransferEvent, TransferProgress
+from scanner import DEFAULT_IGNORE_PATTERNS, is_ignored
+
+# A file is picked up once it was closed after writing and nothing happened to it for DEFAULT_DEBOUNCE seconds,
+# or (for writers that keep their files open) once nothing happened to it for OPEN_FILE_TIMEOUT seconds
+DEFAULT_DEBOUNCE = 0.5
+OPEN_FILE_TIMEOUT = 30.0
+
+# How often the polling fallback lists the source tree
+DEFAULT_POLL_INTERVAL = 2.0
+
+# How often the landing to copied latency is reported while watching
+REPORT_INTERVAL = 60.0
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+
+# struct inotify_event: wd, mask, cookie, len, followed by len bytes of name
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """
+    Reports the files written in a directory tree using Linux inotify: one watch per directory, new
+    directories are watched (and their files reported) as they appear, nothing is rescanned.
+
+    events() returns (path, closed) pairs, closed being True once a file was closed after writing or
+    moved into the tree. If the kernel's event queue overflows, the files changed since the watch
+    started are listed once so nothing is lost.
+
+    Parameters:
+        root (str): Folder to watch (recursively).
+        ignore_patterns (List[str]): fnmatch patterns for file and folder names to skip.
+    """
+
+    def __init__(self, root: str, ignore_patterns: List[str] = DEFAULT_IGNORE_PATTERNS):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = root
+        self.ignore_patterns = ignore_patterns
+        self.started = time.time()
+        # Watch descriptor -> directory
+        self._directories = {}
+        self._add_tree(root, [])
+
+    # Helper method to watch a directory and everything below it (the files already in new directories are added to found)
+    def _add_tree(self, directory: str, found: list) -> None:
+        for folder, subdirs, files in os.walk(directory):
+            subdirs[:] = [name for name in subdirs if not is_ignored(name, self.ignore_patterns)]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+            if wd < 0:
+                print(f"Error watching {folder}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self._directories[wd] = folder
+            if directory != self.root:
+                found.extend((os.path.join(folder, name), True) for name in files if not is_ignored(name, self.ignore_patterns))
+
+    def events(self, timeout: float) -> list:
+        """Waits up to timeout seconds and returns the (path, closed) of the files written since the last call."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        found = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += _EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                print("Watch: the event queue overflowed, listing the files changed since the watch started")
+                found.extend(self._changed_since_start())
+                continue
+            if mask & IN_IGNORED:
+                self._directories.pop(wd, None)
+                continue
+            folder = self._directories.get(wd)
+            if folder is None or not name:
+                continue
+            name = os.fsdecode(name)
+            if is_ignored(name, self.ignore_patterns):
+                continue
+            path = os.path.join(folder, name)
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path, found)
+            else:
+                found.append((path, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))))
+        return found
+
+    # Helper method to list the files changed since the watch started (after lost events)
+    def _changed_since_start(self) -> list:
+        changed = []
+        for folder in list(self._directories.values()):
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_file() and not is_ignored(entry.name, self.ignore_patterns) and entry.stat().st_mtime >= self.started:
+                            changed.append((entry.path, True))
+            except OSError:
+                continue
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Fallback for InotifyWatcher where inotify isn't available (or the source is a network share, which
+    doesn't deliver events): lists the tree every interval seconds and reports the files that are new or
+    changed since the last listing. The files already there when the watch starts aren't reported.
+
+    Parameters:
+        root (str): Folder to watch (recursively).
+        interval (float): Seconds between two listings.
+        ignore_patterns (List[str]): fnmatch patterns for file and folder names to skip.
+    """
+
+    def __init__(self, root: str, interval: float = DEFAULT_POLL_INTERVAL, ignore_patterns: List[str] = DEFAULT_IGNORE_PATTERNS):
+        self.root = root
+        self.interval = interval
+        self.ignore_patterns = ignore_patterns
+        self._known = self._list()
+        self._next_poll = time.monotonic() + interval
+
+    # Helper method to list the tree (path -> (size, mtime_ns))
+    def _list(self) -> dict:
+        listing = {}
+        for folder, subdirs, files in os.walk(self.root):
+            subdirs[:] = [name for name in subdirs if not is_ignored(name, self.ignore_patterns)]
+            for name in files:
+                if is_ignored(name, self.ignore_patterns):
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    stat_result = os.stat(path)
+                except OSError:
+                    continue
+                listing[path] = (stat_result.st_size, stat_result.st_mtime_ns)
+        return listing
+
+    def events(self, timeout: float) -> list:
+        """Waits up to timeout seconds and returns the (path, closed) of the files that changed since the last listing."""
+        wait = self._next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, wait))
+        self._next_poll = time.monotonic() + self.interval
+
+        listing = self._list()
+        # Polling can't see a file being closed, a file that stops changing between two listings counts as closed
+        changed = [(path, True) for path, key in listing.items() if self._known.get(path) != key]
+        self._known = listing
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class LatencyMetrics:
+    """Landing to copied latency of the files copied by a watch (thread safe)."""
+
+    def __init__(self):
+        self._latencies = []
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def summary(self) -> dict:
+        """Returns the number of files and the mean, median, 95th percentile and maximum latency in ms."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return {'files': 0}
+        return {
+            'files': len(latencies),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 1),
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+            'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+            'max_ms': round(latencies[-1] * 1000, 1),
+        }
+
+
+# Helper method to format a latency summary for the console
+def format_latency(summary: dict) -> str:
+    if not summary['files']:
+        return "no files copied"
+    return (
+        f"{summary['files']} files, landing to copied: mean {summary['mean_ms']:.0f} ms, median {summary['p50_ms']:.0f} ms, "
+        f"p95 {summary['p95_ms']:.0f} ms, max {summary['max_ms']:.0f} ms"
+    )
+
+
+def watch(source_folder: str, destination_folder: str | List[str], max_workers: int = 4, file_type: str = None, start_date=None, end_date=None,
+          ignore_patterns: List[str] = DEFAULT_IGNORE_PATTERNS, checksums: bool = True, progress: TransferProgress = None,
+          stop: threading.Event = None, debounce: float = DEFAULT_DEBOUNCE, polling: bool = False,
+          poll_interval: float = DEFAULT_POLL_INTERVAL, metrics: LatencyMetrics = None) -> dict:
+    """
+    Watches the source folder and copies every new file that matches the date/type filter as soon as it
+    has landed, until stop is set. Only the new files are dated (with the same helpers as the scan) and
+    checked against the destinations; the source is never rescanned.
+
+    Files are picked up once they were closed after writing and nothing happened to them for debounce seconds.
+    Linux inotify is used where available, otherwise (or with polling) the tree is listed every poll_interval seconds.
+
+    Parameters:
+        source_folder (str): Folder to watch (recursively).
+        destination_folder (str | List[str]): Path to the destination directory, or a list of them.
+        max_workers (int): Number of copy threads.
+        file_type (str): File extension filter (e.g., ".jpg").
+        start_date (datetime): Copy files taken on or after this date (None = no lower bound).
+        end_date (datetime): Copy files taken on or before this date (None = no upper bound).
+        ignore_patterns (List[str]): fnmatch patterns for file and folder names to skip.
+        checksums (bool): Hash every file while it is copied and record it in the destination's manifest.
+        progress (TransferProgress): Receives an event per file (defaults to a console renderer).
+        stop (threading.Event): Ends the watch once set (the copies in flight finish).
+        debounce (float): Seconds a closed file has to stay untouched before it is picked up.
+        polling (bool): Poll the tree instead of using inotify.
+        poll_interval (float): Seconds between two listings of the polling fallback.
+        metrics (LatencyMetrics): Receives the landing to copied latency of every copied file.
+
+    Returns the latency summary (see LatencyMetrics.summary).
+    """
+    destination_folders = [destination_folder] if isinstance(destination_folder, str) else list(destination_folder)
+    if progress is None:
+        progress = TransferProgress([ConsoleRenderer()])
+    stop = stop or threading.Event()
+    metrics = metrics or LatencyMetrics()
+    matches = CaptureFilter(start_date, end_date, file_type)
+
+    watcher = None
+    if not polling:
+        try:
+            watcher = InotifyWatcher(source_folder, ignore_patterns)
+        except OSError as e:
+            print(f"Watch: inotify isn't available ({e}), polling every {poll_interval:.0f}s instead")
+    if watcher is None:
+        watcher = PollingWatcher(source_folder, poll_interval, ignore_patterns)
+    print(f"Watching {source_folder} for new files ({type(watcher).__name__})")
+
+    with ExitStack() as stack:
+        stack.callback(watcher.close)
+        destinations = DestinationSet(destination_folders, stack, progress, checksums)
+        # One exiftool pool for the whole watch (its processes only start once a RAW file needs exiftool)
+        pool = stack.enter_context(ExifToolPool(workers=1, params=helpers.RAW_DATE_PARAMS))
+        # Entered last so it is shut down (waiting for the copies in flight) before the journals and manifests are closed
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='watch_copy'))
+
+        def copy(file_path, targets, stat_result, landed):
+            try:
+                if destinations.copy(file_path, targets, source_folder, stat_result) is not None:
+                    metrics.record(time.monotonic() - landed)
+            except Exception as e:
+                # The failure is already reported as an event, the watch goes on with the next file
+                print(f"Error copying {file_path}: {e}")
+
+        # Path -> (landed, last event, closed) of the files that are still being written
+        pending = {}
+        next_report = time.monotonic() + REPORT_INTERVAL
+        reported_files = 0
+
+        while not stop.is_set():
+            for path, closed in watcher.events(min(0.1, debounce)):
+                now = time.monotonic()
+                landed = pending[path][0] if path in pending else now
+                pending[path] = (landed, now, closed)
+
+            now = time.monotonic()
+            for path, (landed, last, closed) in list(pending.items()):
+                quiet = now - last
+                if quiet < debounce or (not closed and quiet < OPEN_FILE_TIMEOUT):
+                    continue
+                del pending[path]
+                try:
+                    stat_result = os.stat(path)
+                except OSError:
+                    # Deleted or renamed again before it settled
+                    continue
+                date_taken = date_file(path, stat_result, pool=pool)
+                if not matches(path, date_taken):
+                    continue
+                targets = destinations.route(path, stat_result)
+                if targets:
+                    executor.submit(copy, path, targets, stat_result, landed)
+
+            if now >= next_report:
+                summary = metrics.summary()
+                if summary['files'] != reported_files:
+                    print(f"Watch: {format_latency(summary)}")
+                    reported_files = summary['files']
+                next_report = now + REPORT_INTERVAL
+
+        executor.shutdown(wait=True)
+        destinations.compact()
+        progress.emit(TransferEvent(FINISHED))
+
+    summary = metrics.summary()
+    print(f"Watch stopped: {format_latency(summary)}")
+    return summary